@@ -0,0 +1,316 @@
+"""Moderation throughput benchmark.
+
+Feeds a message corpus through helpers_moderation.moderate_message(), the
+same chain bot.handle_update() runs, with the outbound Telegram calls replaced
+by a counter. Reports messages/sec for the whole chain, its p50/p99 latency
+for clean and matching messages, and p50/p99 latency per rule category, with
+the rules in mod_topics/ scaled x1, x10 and x100.
+
+Run from the repo root:
+
+    python benchmarks/bench_moderation.py
+    python benchmarks/bench_moderation.py --messages 20000 --scales 1,10,100
+    python benchmarks/bench_moderation.py --corpus recorded_updates.jsonl
+
+A recorded corpus is a JSONL file of Telegram updates, such as one written
+with UPDATE_RECORD_PATH set (or objects with a "text" field); message text is
+used, everything else (including media captions, which the rules don't read)
+is skipped.
+"""
+
+import argparse
+import copy
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src import helpers_moderation as moderation  # noqa: E402
+
+MOD_TOPICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "mod_topics")
+
+GENERAL_THREAD = "1"
+NEWBIE_THREAD = "2"
+GROUP_TEST_THREAD = "3"
+IGNORED_THREAD = "4"
+POLICY = moderation.ModerationPolicy(
+    newbie_channel=NEWBIE_THREAD,
+    group_test_channel=GROUP_TEST_THREAD,
+    ignore_automod_channels=frozenset({IGNORED_THREAD}),
+    mod_accounts=frozenset({"bench_mod"}),
+)
+
+# Outbound calls apply_moderation() makes for each category (send + delete where it deletes)
+TELEGRAM_CALLS = {
+    moderation.CATEGORY_AUTO_POOF: ("sendMessage", "deleteMessage"),
+    moderation.CATEGORY_BANNED_TOPIC: ("sendMessage",),
+    moderation.CATEGORY_NEWBIE_REPLY: ("sendMessage",),
+    moderation.CATEGORY_GROUP_TEST_LINK: ("sendMessage", "deleteMessage"),
+    moderation.CATEGORY_DONT_LINK: ("sendMessage", "deleteMessage"),
+}
+
+PLAIN_CHAT = [
+    "gm everyone, what's a good starting dose for reta?",
+    "just got my tirz in, how long does bac water last once mixed?",
+    "anyone compared the latest batch results from the testing channel?",
+    "I reconstituted with 2ml, is that too much for a 10mg vial",
+    "thanks for the help yesterday, shipping was quick",
+    "what's the difference between the kits and single vials",
+    "protest rally downtown made me late for my pin lol",
+    "has anyone here tried splitting doses twice a week?",
+]
+URL_MESSAGES = [
+    "check out https://www.stairwaytogray.com/posts/crypto/crypto-101/",
+    "we moved to https://discord.gg/abcdef come say hi",
+    "official server is discord.gg/WszTsF5s",
+    "join t.me/+AbCdEfGh for more",
+    "results here: https://janoshik.com/tests/12345",
+    "see www.glp1forum.com/threads/99 and http://example.org/page",
+    "spreadsheet: https://docs.google.com/spreadsheets/d/1v9IPC5hpRfM1-DrMmbMsYv34TLAoadn8BXuotoxZyhM/edit",
+]
+POOF_MESSAGES = [
+    "has anyone ordered from snp recently?",
+    "shanghai nexa pharma restocked",
+    "nexaphh has a promo going",
+]
+BANNED_MESSAGES = [
+    "where can I find dnp",
+    "slu-pp-332 orally vs injected?",
+    "my addy 20mg script ran out",
+    "running test e and tren ace this cycle",
+    "anyone use hgh with their stack",
+]
+UNICODE_MESSAGES = [
+    "ｓｎｐ ｉｎ ｆｕｌｌｗｉｄｔｈ",
+    "Ça va? 🧪💉 j'ai reçu ma commande 📦",
+    "これはテストです 🙏 ретатрутид",
+    "𝐛𝐨𝐥𝐝 𝐭𝐞𝐱𝐭 about bitcoin?",
+    "emoji only 🔥🔥🔥🚀🚀🚀💯",
+]
+NEWBIE_MESSAGES = [
+    "can I pay with crypto for my first order?",
+    "I don't see ABC on the vendor list, are they legit?",
+]
+GROUP_TEST_MESSAGES = ["join the group test at t.me/somegrouptest"]
+
+# (kind, weight) for the synthetic mix
+CORPUS_MIX = [
+    ("plain", 55),
+    ("urls", 15),
+    ("unicode", 10),
+    ("banned", 6),
+    ("poof", 4),
+    ("newbie", 4),
+    ("long_paste", 4),
+    ("group_test", 2),
+]
+
+
+def _long_paste(rng):
+    lines = []
+    for _ in range(rng.randint(40, 120)):
+        lines.append(rng.choice(PLAIN_CHAT + URL_MESSAGES[:1] + UNICODE_MESSAGES[1:3]))
+    return "\n".join(lines)
+
+
+def synthetic_corpus(count, seed=7):
+    """Return [(kind, text, thread_id, username)] drawn from CORPUS_MIX."""
+    rng = random.Random(seed)
+    kinds = [kind for kind, _ in CORPUS_MIX]
+    weights = [weight for _, weight in CORPUS_MIX]
+    corpus = []
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        thread = GENERAL_THREAD
+        if kind == "plain":
+            text = rng.choice(PLAIN_CHAT)
+        elif kind == "urls":
+            text = rng.choice(URL_MESSAGES)
+        elif kind == "unicode":
+            text = rng.choice(UNICODE_MESSAGES)
+        elif kind == "banned":
+            text = rng.choice(BANNED_MESSAGES)
+        elif kind == "poof":
+            text = rng.choice(POOF_MESSAGES)
+        elif kind == "newbie":
+            text, thread = rng.choice(NEWBIE_MESSAGES), NEWBIE_THREAD
+        elif kind == "group_test":
+            text, thread = rng.choice(GROUP_TEST_MESSAGES), GROUP_TEST_THREAD
+        else:
+            text = _long_paste(rng)
+        corpus.append((kind, text, thread, f"user{rng.randint(1, 500)}"))
+    return corpus
+
+
+def recorded_corpus(path, limit=None):
+    """Read message texts from a JSONL file of Telegram updates."""
+    corpus = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            # Files written by helpers_recorder wrap each update as {"recorded_at": ..., "update": {...}}
+            record = record.get("update", record)
+            message = record.get("message") or record.get("edited_message") or record
+            text = message.get("text")
+            if not text:
+                continue
+            thread = str(message.get("message_thread_id", GENERAL_THREAD))
+            username = message.get("from", {}).get("username")
+            corpus.append(("recorded", text, thread, username))
+            if limit and len(corpus) >= limit:
+                break
+    return corpus
+
+
+def _scale_terms(terms, copy_idx):
+    return [f"{term}zq{copy_idx}" for term in terms]
+
+
+def scale_config(config, factor):
+    """Return a config with ``factor`` times as many rules; the added rules never match."""
+    if factor <= 1:
+        return config
+
+    topics = copy.deepcopy(config.mod_topics_data)
+    links = copy.deepcopy(config.dont_link_data)
+    for copy_idx in range(1, factor):
+        for section in ("Auto_Poof_Topics", "Banned_Topics", "Newbies_Auto_Reply"):
+            for name, data in list((config.mod_topics_data.get(section) or {}).items()):
+                scaled = dict(data)
+                if data.get("patterns"):
+                    scaled["patterns"] = _scale_terms(data["patterns"], copy_idx)
+                if data.get("substances"):
+                    scaled["substances"] = [_scale_terms(group, copy_idx) for group in data["substances"]]
+                topics[section][f"{name}_x{copy_idx}"] = scaled
+        links["domain_urls"] = list(links.get("domain_urls") or []) + [
+            f"{copy_idx}x{domain}" for domain in config.dont_link_data.get("domain_urls") or []
+        ]
+
+    return moderation.ModerationConfig(
+        mod_topics_data=topics,
+        dont_link_data=links,
+        rules=moderation.compile_ruleset(topics),
+        links=moderation.compile_link_rules(links.get("domain_urls"), links.get("ignore_urls")),
+        fingerprint=f"{config.fingerprint}-x{factor}",
+    )
+
+
+def _category_steps(config):
+    rules, links = config.rules, config.links
+    return {
+        moderation.CATEGORY_AUTO_POOF: rules.match_auto_poof,
+        moderation.CATEGORY_BANNED_TOPIC: rules.match_banned,
+        moderation.CATEGORY_NEWBIE_REPLY: rules.match_newbie,
+        moderation.CATEGORY_DONT_LINK: links.match_context,
+    }
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _context(text, thread, username):
+    return moderation.MessageContext(text, message_thread_id=thread, username=username, mod_accounts=POLICY.mod_accounts)
+
+
+def run_benchmark(config, corpus, warmup=200):
+    """Time the full chain and each rule category over the corpus (latencies in microseconds)."""
+    steps = _category_steps(config)
+    for _, text, thread, username in corpus[:warmup]:
+        moderation.moderate_message(config, POLICY, _context(text, thread, username))
+
+    chain_latencies = []
+    # Clean messages (no rule fired) vs messages that hit a rule
+    outcome_latencies = defaultdict(list)
+    telegram_calls = Counter()
+    outcomes = Counter()
+    started = time.perf_counter()
+    for _, text, thread, username in corpus:
+        t0 = time.perf_counter_ns()
+        match = moderation.moderate_message(config, POLICY, _context(text, thread, username))
+        if match:
+            # Stand-in for apply_moderation(): count the calls instead of sending them
+            telegram_calls.update(TELEGRAM_CALLS[match.category])
+        latency = (time.perf_counter_ns() - t0) / 1000
+        chain_latencies.append(latency)
+        outcome_latencies["matching" if match else "clean"].append(latency)
+        outcomes[match.category if match else "pass"] += 1
+    elapsed = time.perf_counter() - started
+
+    category_latencies = defaultdict(list)
+    for _, text, _, _ in corpus:
+        for category, step in steps.items():
+            t0 = time.perf_counter_ns()
+            step(moderation.MessageContext(text))
+            category_latencies[category].append((time.perf_counter_ns() - t0) / 1000)
+
+    return {
+        "messages": len(corpus),
+        "msgs_per_sec": len(corpus) / elapsed if elapsed else 0.0,
+        "chain": chain_latencies,
+        "by_outcome": outcome_latencies,
+        "categories": category_latencies,
+        "outcomes": outcomes,
+        "telegram_calls": telegram_calls,
+    }
+
+
+def _format_latency(samples):
+    return (
+        f"p50={_percentile(samples, 50):8.1f}us  p99={_percentile(samples, 99):8.1f}us  "
+        f"mean={statistics.fmean(samples) if samples else 0.0:8.1f}us"
+    )
+
+
+def print_report(factor, config, result):
+    counts = ", ".join(f"{key}={value}" for key, value in config.rule_counts().items())
+    print(f"\n=== ruleset x{factor} ({counts}) ===")
+    print(f"messages: {result['messages']}  throughput: {result['msgs_per_sec']:,.0f} msgs/sec")
+    print(f"  {'full chain':<16} {_format_latency(result['chain'])}")
+    for outcome in ("clean", "matching"):
+        print(f"  {'  ' + outcome:<16} {_format_latency(result['by_outcome'][outcome])}")
+    for category, samples in result["categories"].items():
+        print(f"  {category:<16} {_format_latency(samples)}")
+    print("  outcomes: " + ", ".join(f"{key}={value}" for key, value in sorted(result["outcomes"].items())))
+    print("  stubbed telegram calls: " + ", ".join(f"{key}={value}" for key, value in sorted(result["telegram_calls"].items())))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the moderation rule chain")
+    parser.add_argument("--messages", type=int, default=2000, help="Synthetic messages per run")
+    parser.add_argument("--scales", default="1,10,100", help="Comma-separated ruleset multipliers")
+    parser.add_argument("--corpus", help="JSONL file of recorded Telegram updates to use instead of the synthetic mix")
+    parser.add_argument("--seed", type=int, default=7, help="Seed for the synthetic corpus")
+    parser.add_argument("--mod-topics", default=MOD_TOPICS_DIR, help="Directory with moderated_topics.yml and dont_link.yml")
+    args = parser.parse_args(argv)
+
+    if args.corpus:
+        corpus = recorded_corpus(args.corpus, limit=args.messages)
+        source = args.corpus
+    else:
+        corpus = synthetic_corpus(args.messages, seed=args.seed)
+        source = "synthetic mix: " + ", ".join(f"{kind} {weight}%" for kind, weight in CORPUS_MIX)
+    if not corpus:
+        parser.error("corpus is empty")
+    print(f"corpus: {len(corpus)} messages ({source})")
+
+    base_config = moderation.load_moderation_config(args.mod_topics)
+    for factor in [int(value) for value in args.scales.split(",") if value.strip()]:
+        config = scale_config(base_config, factor)
+        print_report(factor, config, run_benchmark(config, corpus))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Local stand-in for the Telegram Bot API, for load tests and replays.
+
+Answers every ``/bot<token>/<method>`` call with a plausible success payload
+after a configurable delay, optionally failing a share of calls with HTTP 500
+or throttling them with a 429 and ``retry_after``. ``/file/bot<token>/...``
+serves a small PNG so getFile + download flows work end to end.
+
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 40 --jitter-ms 20 \\
+        --error-rate 0.01 --throttle-rate 0.02 --retry-after 3
+
+Point the bot at it with ``TELEGRAM_API_ROOT=http://127.0.0.1:8081``.
+``GET /_stats`` returns per-method call counts and injected failures as JSON;
+``POST /_reset`` clears them.
+"""
+
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+BOT_PATH = re.compile(r"^/bot[^/]+/(?P<method>[A-Za-z]+)$")
+FILE_PATH = re.compile(r"^/file/bot[^/]+/(?P<path>.+)$")
+
+# 1x1 transparent PNG
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeBotState:
+    """Call counters and failure injection settings shared by handler threads."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, throttle_rate=0.0, retry_after=1, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._message_id = 1000
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = Counter()
+            self.errors = Counter()
+            self.throttled = Counter()
+            self.started = time.time()
+
+    def next_message_id(self):
+        with self._lock:
+            self._message_id += 1
+            return self._message_id
+
+    def roll(self):
+        """Pick this call's fate: 'throttle', 'error' or 'ok', plus its delay in seconds."""
+        with self._lock:
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            return "throttle", delay
+        if draw < self.throttle_rate + self.error_rate:
+            return "error", delay
+        return "ok", delay
+
+    def count(self, counter, method):
+        with self._lock:
+            counter[method] += 1
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.time() - self.started
+            return {
+                "elapsed_seconds": elapsed,
+                "calls": dict(self.calls),
+                "errors": dict(self.errors),
+                "throttled": dict(self.throttled),
+                "total_calls": sum(self.calls.values()),
+            }
+
+
+def method_result(state, method, params):
+    """Success payload for a Bot API method, shaped like the real responses the bot reads."""
+    chat_id = params.get("chat_id")
+    if method in ("sendMessage", "sendPhoto", "sendDocument", "sendAnimation"):
+        message_id = state.next_message_id()
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "supergroup"},
+            "text": params.get("text", ""),
+            "photo": [{"file_id": f"fake-photo-{message_id}", "file_unique_id": f"u{message_id}", "width": 1, "height": 1}],
+        }
+    if method == "sendMediaGroup":
+        return [{"message_id": state.next_message_id(), "chat": {"id": chat_id, "type": "supergroup"}}]
+    if method == "getFile":
+        file_id = params.get("file_id", "file")
+        return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(PNG_BYTES), "file_path": f"photos/{file_id}.png"}
+    if method == "getChatMember":
+        return {"status": "member", "user": {"id": params.get("user_id"), "is_bot": False, "first_name": "Member"}}
+    if method == "getChatMemberCount":
+        return 1234
+    if method == "getMe":
+        return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+    if method == "getUpdates":
+        return []
+    if method == "getWebhookInfo":
+        return {"url": "", "pending_update_count": 0}
+    if method == "createChatInviteLink":
+        return {"invite_link": f"https://t.me/+fake{state.next_message_id()}", "expire_date": params.get("expire_date")}
+    return True
+
+
+def make_handler(state):
+    class FakeBotHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # noqa: A002 - BaseHTTPRequestHandler signature
+            pass
+
+        def _params(self):
+            params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            content_type = self.headers.get("Content-Type", "")
+            if body and content_type.startswith("application/json"):
+                params.update(json.loads(body))
+            elif body and content_type.startswith("application/x-www-form-urlencoded"):
+                params.update({key: values[-1] for key, values in parse_qs(body.decode("utf-8")).items()})
+            # multipart uploads (sendPhoto/sendDocument with files) are drained but not parsed
+            return params
+
+        def _send(self, status, payload=None, body=None, content_type="application/json"):
+            if body is None:
+                body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _handle(self):
+            path = urlparse(self.path).path
+            if path == "/_stats":
+                return self._send(200, state.stats())
+            if path == "/_reset":
+                state.reset()
+                return self._send(200, {"ok": True})
+
+            file_match = FILE_PATH.match(path)
+            if file_match:
+                state.count(state.calls, "file_download")
+                return self._send(200, body=PNG_BYTES, content_type="image/png")
+
+            bot_match = BOT_PATH.match(path)
+            if not bot_match:
+                return self._send(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+
+            method = bot_match.group("method")
+            params = self._params()
+            state.count(state.calls, method)
+            fate, delay = state.roll()
+            if delay:
+                time.sleep(delay)
+
+            if fate == "throttle":
+                state.count(state.throttled, method)
+                return self._send(
+                    429,
+                    {
+                        "ok": False,
+                        "error_code": 429,
+                        "description": f"Too Many Requests: retry after {state.retry_after}",
+                        "parameters": {"retry_after": state.retry_after},
+                    },
+                )
+            if fate == "error":
+                state.count(state.errors, method)
+                return self._send(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+            return self._send(200, {"ok": True, "result": method_result(state, method, params)})
+
+        do_GET = _handle
+        do_POST = _handle
+
+    return FakeBotHandler
+
+
+def serve(host="127.0.0.1", port=8081, **settings):
+    """Start the fake API on a background thread and return (server, state)."""
+    state = FakeBotState(**settings)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-bot-api").start()
+    return server, state
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API for local load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Mean delay before each response")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Uniform +/- jitter on the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls answered with HTTP 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of calls answered with HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    server, state = serve(
+        args.host,
+        args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    print(f"Fake Bot API listening on http://{args.host}:{args.port} (stats at /_stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(json.dumps(state.stats(), indent=2))
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
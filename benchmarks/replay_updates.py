@@ -0,0 +1,168 @@
+"""Replay recorded Telegram updates against a running bot's /webhook.
+
+Reads a JSONL file written with UPDATE_RECORD_PATH (or plain update objects),
+POSTs each update to the webhook at a fixed rate or as fast as the worker
+threads allow, and reports throughput, latency percentiles and status codes.
+With --fake-api pointing at benchmarks/fake_bot_api.py (and the bot started
+with TELEGRAM_API_ROOT set to the same address) it also reports the outbound
+Bot API calls the replay caused.
+
+    python benchmarks/fake_bot_api.py --port 8081 --latency-ms 40 &
+    TELEGRAM_API_ROOT=http://127.0.0.1:8081 python bot.py &
+    python benchmarks/replay_updates.py recorded_updates.jsonl \\
+        --target http://127.0.0.1:8443/webhook --rate 50 --fake-api http://127.0.0.1:8081
+
+update_id and message_id are shifted per run so the bot's dedup window does
+not drop a second replay of the same file (disable with --keep-ids).
+Test-result uploads still call OpenAI and Google Sheets unless those are
+configured for a sandbox.
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def load_updates(path, limit=None):
+    updates = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            updates.append(record.get("update", record))
+            if limit and len(updates) >= limit:
+                break
+    return updates
+
+
+def shift_ids(update, offset):
+    """Copy an update with update_id/message_id moved by ``offset`` so dedup sees it as new."""
+    update = json.loads(json.dumps(update))
+    if "update_id" in update:
+        update["update_id"] += offset
+    for key in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if isinstance(update.get(key), dict) and "message_id" in update[key]:
+            update[key]["message_id"] += offset
+    return update
+
+
+class Pacer:
+    """Hands out send times ``1/rate`` apart across threads; rate <= 0 means no pacing."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            slot = self._next
+            self._next = max(self._next, time.perf_counter()) + self.interval
+        delay = slot - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def replay(updates, target, rate=0.0, concurrency=8, timeout=60.0):
+    """POST every update to ``target``; returns (latencies_ms, status_counts, elapsed_seconds)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    pacer = Pacer(rate)
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def send(update):
+        pacer.wait()
+        started = time.perf_counter()
+        try:
+            status = session.post(target, json=update, timeout=timeout).status_code
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed_ms)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, updates))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded updates against /webhook")
+    parser.add_argument("corpus", help="JSONL file of recorded updates")
+    parser.add_argument("--target", default="http://127.0.0.1:8443/webhook")
+    parser.add_argument("--rate", type=float, default=0.0, help="Updates per second (0 = as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Parallel in-flight requests")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N updates")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the corpus this many times")
+    parser.add_argument("--keep-ids", action="store_true", help="Send recorded update_ids unchanged")
+    parser.add_argument("--fake-api", help="Base URL of fake_bot_api.py to collect outbound call counts from")
+    args = parser.parse_args(argv)
+
+    recorded = load_updates(args.corpus, args.limit)
+    if not recorded:
+        parser.error("no updates in corpus")
+
+    run_offset = int(time.time()) % 10**6 * 1000
+    updates = []
+    for round_idx in range(max(1, args.repeat)):
+        for update in recorded:
+            updates.append(update if args.keep_ids else shift_ids(update, run_offset + round_idx * 10**9))
+
+    if args.fake_api:
+        requests.post(f"{args.fake_api.rstrip('/')}/_reset", timeout=5)
+
+    pace = f"{args.rate:g}/s" if args.rate > 0 else "unpaced"
+    print(f"Replaying {len(updates)} update(s) to {args.target} ({pace}, concurrency={args.concurrency})")
+    latencies, statuses, elapsed = replay(updates, args.target, rate=args.rate, concurrency=args.concurrency)
+
+    print(f"\nthroughput: {len(updates) / elapsed:,.1f} updates/sec over {elapsed:.2f}s")
+    print(
+        "latency ms: "
+        f"p50={_percentile(latencies, 50):.1f}  p90={_percentile(latencies, 90):.1f}  "
+        f"p99={_percentile(latencies, 99):.1f}  max={max(latencies):.1f}  mean={statistics.fmean(latencies):.1f}"
+    )
+    print("responses: " + ", ".join(f"{status}={count}" for status, count in sorted(statuses.items(), key=str)))
+
+    if args.fake_api:
+        # Queue ingestion acknowledges before handling; give the workers a moment to finish
+        time.sleep(1.0)
+        stats = requests.get(f"{args.fake_api.rstrip('/')}/_stats", timeout=5).json()
+        print(f"\noutbound Bot API calls: {stats['total_calls']}")
+        for method, count in sorted(stats["calls"].items(), key=lambda item: -item[1]):
+            extra = []
+            if stats["throttled"].get(method):
+                extra.append(f"429s={stats['throttled'][method]}")
+            if stats["errors"].get(method):
+                extra.append(f"errors={stats['errors'][method]}")
+            print(f"  {method:<24} {count:>7}  {' '.join(extra)}")
+
+    return 0 if all(isinstance(status, int) and status < 500 for status in statuses) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
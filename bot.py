@@ -1,25 +1,41 @@
 from flask import Flask, request, jsonify
-import requests
 import threading
 import time
 import datetime
-import re
-import unicodedata
 import os
 import sys
 import yaml
 import json
+import hmac
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
 import logging
 
 sys.path.append('./src')
 from src import create_messages as msgs
 from src import helpers_telegram
+from src import helpers_telegram_api
 from src import helpers_discord 
 from src import helpers_invites
-
-# Setup basic logging configuration
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
+from src import helpers_workers
+from src import helpers_dedup
+from src import helpers_polling
+from src import helpers_moderation
+from src import helpers_metrics
+from src import helpers_logging
+from src import helpers_recorder
+from src import helpers_spam
+from src import helpers_welcome
+from src import helpers_outbound
+from src import helpers_file_ids
+from src import helpers_media
+from src import helpers_membership
+from src import helpers_extraction_cache
+from src import helpers_tokens
+from src import helpers_services
+
+# Queue-backed logging: records are written by a listener thread (LOG_FORMAT, LOG_SAMPLE_RATES, LOG_MAX_CHARS)
+helpers_logging.configure_logging()
 
 # Load environment variables
 ENV_FILE = ".env-dev"
@@ -58,7 +74,13 @@ def _require_list(key: str):
     return value
 
 
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+# TELEGRAM_API_ROOT can point at a local Bot API server (or a fake one for load tests)
+TELEGRAM_API_ROOT = os.getenv("TELEGRAM_API_ROOT", "https://api.telegram.org").rstrip("/")
+TELEGRAM_API_URL = f"{TELEGRAM_API_ROOT}/bot{BOT_TOKEN}"
+TELEGRAM_FILE_URL = f"{TELEGRAM_API_ROOT}/file/bot{BOT_TOKEN}"
+# Shared keep-alive pool with timeouts and retries for every Bot API call (TELEGRAM_TIMEOUT_SECONDS etc.)
+TELEGRAM_API = helpers_telegram_api.get_client()
+ALLOWED_UPDATES = ["message", "edited_message", "channel_post", "edited_channel_post", "inline_query", "callback_query", "chat_member", "my_chat_member"]
 
 SUPERGROUP_ID = str(_require_value("SUPERGROUP_ID"))
 TEST_RESULTS_CHANNEL = str(_require_value("TEST_RESULTS_CHANNEL"))
@@ -68,6 +90,12 @@ GENERAL_CHANNEL = str(_require_value("GENERAL_CHANNEL"))
 IGNORE_AUTOMOD_CHANNELS = [str(channel) for channel in _require_list("IGNORE_AUTOMOD_CHANNELS")]
 MOD_ACCOUNTS = [str(account) for account in TELEGRAM_CONFIG.get("MOD_ACCOUNTS", [])]
 RULES_GUIDE_POST = str(_require_value("RULES_GUIDE_POST"))
+MODERATION_POLICY = helpers_moderation.ModerationPolicy(
+    newbie_channel=NEWBIE_CHANNEL,
+    group_test_channel=GROUP_TEST_CHANNEL,
+    ignore_automod_channels=frozenset(IGNORE_AUTOMOD_CHANNELS),
+    mod_accounts=frozenset(MOD_ACCOUNTS),
+)
 
 app = Flask(__name__)
 
@@ -102,7 +130,8 @@ def start_periodic_announcement(frequency_minutes=180):
             if should_send:
                 message = msgs.newbie_announcement()
                 if ENVIRONMENT == 'PROD':
-                    helpers_telegram.send_message(SUPERGROUP_ID, message, NEWBIE_CHANNEL)
+                    with helpers_outbound.lane(helpers_outbound.LANE_BULK):
+                        helpers_telegram.send_message(SUPERGROUP_ID, message, NEWBIE_CHANNEL)
                     logging.info("Made newbie announcement")
                 ## Kept turned off for dev to avoid sending messages all day in test bed 
                 # elif ENVIRONMENT == 'DEV':
@@ -136,32 +165,61 @@ def initialize_announcement_thread():
     thread = threading.Thread(target=start_periodic_announcement, daemon=True)
     thread.start()
 
-# Initialize Global variables
-def create_globals():
-    global banned_data, newbies_mod_topics, dont_link_domains, ignore_domains, auto_poof_topics
+MOD_TOPICS_DIR = './mod_topics'
+
+# Message rates per user and per thread; limits come from mod_topics/spam_control.yml
+flood_tracker = helpers_spam.FloodTracker()
+# Recent message fingerprints for near-duplicate spam waves (Spam_Waves in spam_control.yml)
+spam_wave_detector = helpers_spam.SpamWaveDetector()
+
+def _apply_moderation_config(config):
+    global banned_data, newbies_mod_topics, dont_link_domains, ignore_domains, auto_poof_topics, moderation_config
 
     # Get banned topics
-    with open('./mod_topics/moderated_topics.yml', 'r') as file:
-        mod_topics_data = yaml.safe_load(file)
-    banned_data = mod_topics_data.get('Banned_Topics', {})
-    newbies_mod_topics = mod_topics_data.get('Newbies_Auto_Reply', {})
-    auto_poof_topics = mod_topics_data.get('Auto_Poof_Topics', {})
-    
+    banned_data = config.mod_topics_data.get('Banned_Topics', {})
+    newbies_mod_topics = config.mod_topics_data.get('Newbies_Auto_Reply', {})
+    auto_poof_topics = config.mod_topics_data.get('Auto_Poof_Topics', {})
+
     # Get dont link communities
-    with open('./mod_topics/dont_link.yml', 'r') as file:
-        domains = yaml.safe_load(file)
-    dont_link_domains = domains.get('domain_urls', [])
-    ignore_domains = domains.get('ignore_urls', [])
-    
-    logging.info("Setting global variables...")
-    return banned_data, newbies_mod_topics, dont_link_domains, ignore_domains, auto_poof_topics
+    dont_link_domains = config.dont_link_data.get('domain_urls', [])
+    ignore_domains = config.dont_link_data.get('ignore_urls', [])
+
+    # Single reference swap: handle_update() reads moderation_config once per update
+    moderation_config = config
+    flood_tracker.configure(config.flood_limits)
+    if config.wave_limits is not None:
+        spam_wave_detector.configure(config.wave_limits)
+
+# Initialize Global variables
+def create_globals():
+    config = helpers_moderation.load_moderation_config(MOD_TOPICS_DIR)
+    _apply_moderation_config(config)
+    logging.info(f"Setting global variables... compiled moderation rules: {config.rule_counts()}")
+    return banned_data, newbies_mod_topics, dont_link_domains, ignore_domains, auto_poof_topics, moderation_config
+
+# Recompile mod_topics/ after an edit; a failed compile keeps the rules already in use
+def reload_globals():
+    started = time.perf_counter()
+    try:
+        config = helpers_moderation.load_moderation_config(MOD_TOPICS_DIR, strict=True)
+    except Exception as e:
+        logging.error(f"Moderation config reload failed; keeping previous rules: {e}")
+        return False
+    _apply_moderation_config(config)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logging.info(f"Reloaded moderation config in {elapsed_ms:.1f} ms: {config.rule_counts()}")
+    return True
 
 # Ensure thread is started and globals created on app import
 # start_ai_roleplay_thread()
-initialize_announcement_thread()
 create_globals()
-helpers_discord.start_discord_bridge()
-helpers_invites.start_invite_rotation_thread()
+# Once per process: `python bot.py` runs this file as __main__ and again as the imported `bot` module
+helpers_services.start_once("announcements", initialize_announcement_thread)
+helpers_services.start_once("config_watcher", helpers_moderation.start_config_watcher, MOD_TOPICS_DIR, moderation_config.fingerprint, reload_globals)
+helpers_services.start_once("rule_optimizer", helpers_moderation.start_rule_optimizer, lambda: moderation_config)
+helpers_services.start_once("discord_bridge", helpers_discord.start_discord_bridge)
+helpers_services.start_once("invite_rotation", helpers_invites.start_invite_rotation_thread)
+helpers_services.start_once("member_count_reconciler", helpers_membership.start_member_count_reconciler, helpers_telegram.fetch_member_count)
 ### NON WEBHOOK END ###
 
 
@@ -175,146 +233,405 @@ def login():
 
     # Check if user is a member of the supergroup
     if helpers_telegram.is_user_in_supergroup(user_id):
-        # Allow access (You can generate a session token here)
-        return jsonify({"status": "success", "message": "User is authorized"})
+        # Allow access, with a signed token the site can check on /verify instead of calling back here
+        return jsonify({"status": "success", "message": "User is authorized", **_issue_login_token(user_id)})
     else:
         # Deny access
         return jsonify({"status": "error", "message": "User is not a member of the supergroup"}), 403
 
+
+def _issue_login_token(user_id):
+    settings = helpers_tokens.get_token_settings()
+    if not settings:
+        return {}
+    token, claims = helpers_tokens.issue_token(settings["secret"], user_id, settings["ttl_seconds"])
+    return {"token": token, "user_id": claims.user_id, "expires_at": claims.expires_at}
+
+
+def _request_token():
+    header = request.headers.get("Authorization", "")
+    return header[len("Bearer "):] if header.startswith("Bearer ") else request.args.get("token")
+
+
+def _login_token_claims():
+    """Settings and verified claims for the request's token (Bearer header or ?token=), or an error response."""
+    settings = helpers_tokens.get_token_settings()
+    if not settings:
+        return None, None, (jsonify({"error": "Not found"}), 404)
+    try:
+        return settings, helpers_tokens.verify_token(settings["secret"], _request_token()), None
+    except helpers_tokens.InvalidToken as e:
+        return settings, None, (jsonify({"status": "error", "message": f"Invalid token: {e}"}), 401)
+
+
+# Stateless check of a /login token: no Telegram call, so the site can run it on every page view
+@app.route('/verify', methods=['GET'])
+def verify():
+    _, claims, error = _login_token_claims()
+    if error:
+        return error
+    return jsonify({"status": "success", "user_id": claims.user_id, "expires_at": claims.expires_at})
+
+
+# Swap a token for a fresh one; membership is only re-checked once the token is close to expiry
+@app.route('/refresh', methods=['POST'])
+def refresh():
+    settings, claims, error = _login_token_claims()
+    if error:
+        return error
+    if claims.remaining() > settings["refresh_seconds"]:
+        return jsonify({"status": "success", "token": _request_token(), "user_id": claims.user_id, "expires_at": claims.expires_at})
+    if not helpers_telegram.is_user_in_supergroup(claims.user_id):
+        return jsonify({"status": "error", "message": "User is not a member of the supergroup"}), 403
+    return jsonify({"status": "success", **_issue_login_token(claims.user_id)})
+
 # Set the webhook
 @app.route('/setwebhook', methods=['GET'])
 def set_webhook():
-    url = f"{TELEGRAM_API_URL}/setWebhook"
     payload = {
         "url": f"{WEBHOOK_URL}",
-        "allowed_updates": ["message", "edited_message", "channel_post", "edited_channel_post", "inline_query", "callback_query", "chat_member", "my_chat_member"]
+        "allowed_updates": ALLOWED_UPDATES
     }
-    print(url)
-    response = requests.post(url, json=payload)
+    response = TELEGRAM_API.call("setWebhook", json=payload)
     return response.json()
 
 # Delete the webhook
 @app.route('/deletewebhook', methods=['GET'])
 def delete_webhook():
-    url = f"{TELEGRAM_API_URL}/deleteWebhook"
     payload = {"url": f"{WEBHOOK_URL}"}
-    print(url)
-    response = requests.post(url, json=payload)
+    response = TELEGRAM_API.call("deleteWebhook", json=payload)
     return response.json()
 
 # Check current webhook status
 @app.route('/checkwebhook', methods=['GET'])
 def check_webhook():
-    url = f"{TELEGRAM_API_URL}/getWebhookInfo"
-    print(url)
-    response = requests.get(url)
+    response = TELEGRAM_API.call("getWebhookInfo", http_method="GET")
     return response.json()
 
+
+def _runtime_gauges():
+    lanes = dict(helpers_workers.worker_stats())
+    if _extraction_lane is not None:
+        lanes[_extraction_lane.name] = _extraction_lane.stats()
+    lanes.update(helpers_outbound.deferred_send_stats())
+    for lane, stats in lanes.items():
+        for key in ("depth", "busy", "workers", "processed", "failed", "rejected", "wait_seconds_max"):
+            yield f"bot_worker_{key}", {"lane": lane}, stats[key]
+    deduplicator = helpers_dedup.get_deduplicator()
+    yield "bot_dedup_tracked_keys", {}, len(deduplicator)
+    yield "bot_dedup_duplicates", {}, deduplicator.duplicates
+    for category, count in moderation_config.rule_counts().items():
+        yield "bot_moderation_rules", {"category": category}, count
+    for key, value in flood_tracker.stats().items():
+        yield f"bot_flood_{key}", {}, value
+    for key, value in spam_wave_detector.stats().items():
+        yield f"bot_spam_wave_{key}", {}, value
+    for key, value in helpers_welcome.get_welcome_aggregator(send_welcome).stats().items():
+        yield f"bot_welcome_{key}", {}, value
+    for key, value in helpers_file_ids.get_file_id_cache().stats().items():
+        yield f"bot_file_id_cache_{key}", {}, value
+    for key, value in helpers_membership.get_membership_cache().stats().items():
+        yield f"bot_membership_cache_{key}", {}, value
+    member_counts = helpers_membership.get_member_counts()
+    for key, value in member_counts.stats().items():
+        yield f"bot_member_count_cache_{key}", {}, value
+    for chat_id, count in member_counts.counts().items():
+        yield "bot_chat_members", {"chat_id": chat_id}, count
+    for key, value in helpers_extraction_cache.get_extraction_cache().stats().items():
+        yield f"bot_extraction_cache_{key}", {}, value
+    for key, value in helpers_media.FILE_PATHS.stats().items():
+        yield f"bot_file_path_cache_{key}", {}, value
+    scheduler = helpers_outbound.get_scheduler()
+    if scheduler is not None:
+        for lane, stats in scheduler.stats().items():
+            yield "bot_outbound_queue_depth", {"lane": lane}, stats["depth"]
+            yield "bot_outbound_granted", {"lane": lane}, stats["granted"]
+            yield "bot_outbound_timed_out", {"lane": lane}, stats["timed_out"]
+            yield "bot_outbound_deferred", {"lane": lane}, stats["deferred"]
+
+
+helpers_services.start_once("runtime_gauges", helpers_metrics.register_gauges, _runtime_gauges)
+
+
+def _bearer_token_matches(token):
+    # Compare bytes in constant time; the header is client input and may not be ASCII
+    supplied = request.headers.get("Authorization", "").encode("utf-8")
+    return hmac.compare_digest(supplied, f"Bearer {token}".encode("utf-8"))
+
+
+# Prometheus scrape endpoint; disabled unless METRICS_TOKEN is set
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    if not _bearer_token_matches(token):
+        return jsonify({"error": "Unauthorized"}), 401
+    return helpers_metrics.render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+# Current moderation rule order and per-rule stats; disabled unless ADMIN_TOKEN is set
+@app.route('/admin/moderation', methods=['GET'])
+def admin_moderation():
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return jsonify({"error": "Not found"}), 404
+    if not _bearer_token_matches(token):
+        return jsonify({"error": "Unauthorized"}), 401
+    config = moderation_config
+    return jsonify({
+        "fingerprint": config.fingerprint,
+        "rule_counts": config.rule_counts(),
+        "tiers": config.rules.rule_stats(),
+    })
+
 # Handle incoming updates
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    global banned_data, newbies_mod_topics, dont_link_domains, ignore_domains, auto_poof_topics
-    
-    # Log raw request data
-    raw_data = request.data.decode('utf-8')
-    logging.info(f"Raw request data: {raw_data}")
-    
     try:
-        update = request.get_json()
+        with helpers_metrics.span("parse"):
+            update = request.get_json()
         if update is None:
             return jsonify({"error": "Invalid JSON format"}), 400
+
+        with helpers_logging.update_log_context(update):
+            # Raw bodies are sampled and truncated per LOG_SAMPLE_RATES / LOG_MAX_CHARS
+            logging.info(
+                "Raw request data: %s",
+                request.get_data(as_text=True),
+                extra={"category": helpers_logging.CATEGORY_RAW_UPDATE},
+            )
+
+            # Telegram redelivers slow updates; drop repeats before any handler runs
+            if helpers_dedup.is_duplicate_update(update):
+                logging.info(f"Skipping duplicate update {update.get('update_id')}")
+                return jsonify({"ok": True}), 200
+
+            # Opt-in capture for benchmarks/replay_updates.py (UPDATE_RECORD_PATH)
+            helpers_recorder.record_update(update)
+
+            # Queue ingestion: acknowledge right away and let the worker pool do the work
+            if helpers_workers.workers_enabled():
+                if not helpers_workers.dispatch_update(update):
+                    # Let Telegram's redelivery through once there is room again
+                    helpers_dedup.forget_update(update)
+                    return jsonify({"error": "Update queue is full"}), 503
+                return jsonify({"ok": True}), 200
+
+            # A 500 makes Telegram redeliver the update, so it must not be dropped as a duplicate then
+            with helpers_metrics.span("handle_update"), helpers_dedup.forget_update_on_error(update):
+                # Sends that would have to wait for the rate limiter go out later, not on this request
+                with helpers_outbound.deferrable():
+                    handle_update(update)
+        return jsonify({"ok": True}), 200
+
+    except Exception as e:
+        # Log the error to check what went wrong
+        logging.error(f"Error processing webhook: {e}")
+        return jsonify({"error": f"Internal server error: {e}"}), 500
+
+
+def update_lane(update):
+    """Route test-result uploads to the slow extraction lane, everything else to moderation."""
+    message = update.get('message', {})
+    if (
+        ("document" in message or "photo" in message)
+        and str(message.get('chat', {}).get('id')) == SUPERGROUP_ID
+        and str(message.get("message_thread_id")) == TEST_RESULTS_CHANNEL
+    ):
+        return helpers_workers.LANE_EXTRACTION
+    return helpers_workers.LANE_MODERATION
+
+
+_batch_executor = None
+_extraction_lane = None
+
+
+def _handle_update_safely(update):
+    try:
+        handle_update(update)
+    except Exception as e:
+        logging.error(f"Error processing update {update.get('update_id')}: {e}")
+
+
+def process_update_batch(updates):
+    """Run a getUpdates batch through the same handlers as webhook().
+
+    Moderation updates in the batch run concurrently and are waited for.
+    Extraction updates go to a separate bounded lane and are not waited for,
+    so slow OpenAI and Sheets work holds up neither this batch's moderation
+    nor the next getUpdates call. When that lane is full the update is
+    handled here, so a burst of uploads slows polling down instead of
+    queueing without limit. The offset moves past queued extractions, so a
+    restart loses at most POLL_EXTRACTION_QUEUE of them.
+    """
+    global _batch_executor, _extraction_lane
+
+    fresh_updates = [update for update in updates if not helpers_dedup.is_duplicate_update(update)]
+    handed_off = set()
+    try:
+        for update in fresh_updates:
+            helpers_recorder.record_update(update)
+
+        if helpers_workers.workers_enabled():
+            for update in fresh_updates:
+                if not helpers_workers.dispatch_update(update):
+                    # Lane is full: handle it here so polling slows down instead of dropping updates
+                    _handle_update_safely(update)
+                handed_off.add(update.get("update_id"))
+            return
+
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("POLL_BATCH_CONCURRENCY", 8)),
+                thread_name_prefix="poll-batch",
+            )
+            _extraction_lane = helpers_workers.WorkerLane(
+                "poll-extraction",
+                handle_update,
+                workers=int(os.getenv("POLL_EXTRACTION_CONCURRENCY", 2)),
+                max_queue=int(os.getenv("POLL_EXTRACTION_QUEUE", 8)),
+            )
+            _extraction_lane.start()
+        moderation = [u for u in fresh_updates if update_lane(u) == helpers_workers.LANE_MODERATION]
+        extraction = [u for u in fresh_updates if update_lane(u) == helpers_workers.LANE_EXTRACTION]
+        futures = [_batch_executor.submit(_handle_update_safely, update) for update in moderation]
+        for update in extraction:
+            if not _extraction_lane.submit(update):
+                # Lane is full: handle it here so polling slows down instead of queueing without bound
+                _handle_update_safely(update)
+        handed_off.update(update.get("update_id") for update in fresh_updates)
+        wait(futures)
+    except Exception:
+        # The poller fetches this batch again; let the updates nothing has handled back through dedup
+        for update in fresh_updates:
+            if update.get("update_id") not in handed_off:
+                helpers_dedup.forget_update(update)
+        raise
+
+
+def run_polling():
+    """Long-poll getUpdates instead of receiving webhooks (no public URL needed)."""
+    # getUpdates is rejected while a webhook is set
+    delete_response = delete_webhook()
+    logging.info(f"Delete Webhook Response: {delete_response}")
+    helpers_polling.poll_updates(
+        process_update_batch,
+        client=TELEGRAM_API,
+        allowed_updates=ALLOWED_UPDATES,
+        timeout=int(os.getenv("POLL_TIMEOUT_SECONDS", helpers_polling.POLL_TIMEOUT_SECONDS)),
+    )
+
+
+# Run every bot function for a single Telegram update
+def handle_update(update):
+    # Worker and polling threads start without a log context of their own
+    with helpers_logging.update_log_context(update):
+        _handle_update(update)
+
+
+def _handle_update(update):
+    # Read the moderation config once so a hot reload can't swap it mid-update
+    config = moderation_config
+
+    ### AUTOMATED WELCOME MESSAGE FOR NEW MEMBER ###
+    # Check for "new_chat_member" in the ChatMemberUpdated update
+    if "chat_member" in update:
+        chat_member_update = update["chat_member"]
+        chat_id = chat_member_update.get("chat", {}).get("id")
+        new_member = chat_member_update.get("new_chat_member", {}).get("user")
+        new_status = chat_member_update.get("new_chat_member", {}).get("status")
+        old_status = chat_member_update.get("old_chat_member", {}).get("status")
+        logging.info(f"New member status: {new_status}, Old member status: {old_status}")
+        if str(chat_id) == SUPERGROUP_ID and new_member:
+            # Joins, leaves and bans take effect for /login at once
+            helpers_membership.get_membership_cache().apply_status(new_member["id"], new_status)
+        # Keep /lastcall's member count current without asking Telegram
+        helpers_membership.get_member_counts().apply_update(
+            chat_id, chat_member_update.get("old_chat_member"), chat_member_update.get("new_chat_member")
+        )
+        # Check if the user has joined the group
+        if new_status == "member" and old_status in ["left", "kicked"]:
+            if str(chat_id) == SUPERGROUP_ID:
+                # Join bursts are welcomed in batches (WELCOME_BATCH_SECONDS / WELCOME_BATCH_MAX_MENTIONS)
+                helpers_welcome.get_welcome_aggregator(send_welcome).add(chat_id, new_member)
+                return
         
-        ### AUTOMATED WELCOME MESSAGE FOR NEW MEMBER ###
-        # Check for "new_chat_member" in the ChatMemberUpdated update
-        if "chat_member" in update:
-            chat_member_update = update["chat_member"]
-            chat_id = chat_member_update.get("chat", {}).get("id")
-            new_member = chat_member_update.get("new_chat_member", {}).get("user")
-            new_status = chat_member_update.get("new_chat_member", {}).get("status")
-            old_status = chat_member_update.get("old_chat_member", {}).get("status")
-            logging.info(f"New member status: {new_status}, Old member status: {old_status}")
-            # Check if the user has joined the group
-            if new_status == "member" and old_status in ["left", "kicked"]:
-                if str(chat_id) == SUPERGROUP_ID:
-                    welcome_message = msgs.welcome_newbie(new_member)
-                    helpers_telegram.send_message(chat_id, welcome_message)
-                    return jsonify({"ok": True}), 200
-            
-        ### EXTRACT TG UPDATE IDs ###
-        message = update.get('message', {})
-        chat_id = message.get('chat', {}).get('id', None)
-        message_thread_id = message.get("message_thread_id")
-        message_id = message.get("message_id", None)
-        user_id = message.get('from', {}).get('id', None)
-        user_firstname = message.get('from', {}).get('first_name', None)
-        username = message.get('from', {}).get('username', None)
-        text = message.get('text', '').strip()
-
-        ### HANDLE COMMANDS ###
-        if text.startswith("/"):
-            command = text.split()[0].lower()  # Extract the command
+    # The bot's own membership changes count towards the chat too; forget chats it has left
+    if "my_chat_member" in update:
+        my_member_update = update["my_chat_member"]
+        chat_id = my_member_update.get("chat", {}).get("id")
+        new_bot_member = my_member_update.get("new_chat_member")
+        if helpers_membership.counts_as_member(new_bot_member):
+            helpers_membership.get_member_counts().apply_update(chat_id, my_member_update.get("old_chat_member"), new_bot_member)
+        else:
+            helpers_membership.get_member_counts().forget(chat_id)
+
+    ### EXTRACT TG UPDATE IDs ###
+    message = update.get('message', {})
+    chat_id = message.get('chat', {}).get('id', None)
+    message_thread_id = message.get("message_thread_id")
+    message_id = message.get("message_id", None)
+    user_id = message.get('from', {}).get('id', None)
+    user_firstname = message.get('from', {}).get('first_name', None)
+    username = message.get('from', {}).get('username', None)
+    text = message.get('text', '').strip()
+
+    ### HANDLE COMMANDS ###
+    if text.startswith("/"):
+        command = text.split()[0].lower()  # Extract the command
+        with helpers_metrics.span("command"):
             handle_command(command, chat_id, message_thread_id, message_id, update)
-            return jsonify({"ok": True}), 200
-        
-        ### Skip the rest of the Bot functions if update is not from the main moderation TG groups
-        if str(chat_id) != SUPERGROUP_ID:
-            return jsonify({"ok": True}), 200  # Exit after handling the command for non-target groups
-        
-        ### ALL OTHER MESSAGES ###
-        elif "message" in update:
-
-            ### AUTO POOF MESSAGES WITH SPECIFIC TERMS ###
-            normalized_text = unicodedata.normalize("NFKC", text)
-            if str(message_thread_id) not in IGNORE_AUTOMOD_CHANNELS and username not in MOD_ACCOUNTS: 
-                for _, data in auto_poof_topics.items():
-                    banned_message = data.get('message')
-                    banned_patterns = data.get('patterns')
-                    for word in banned_patterns:
-                        pattern = rf"\b{re.escape(word)}\b"
-                        if re.search(pattern, normalized_text, re.IGNORECASE):
-                            full_banned_message = msgs.banned_topic(word, banned_message, user=message.get('from', {}))
-                            helpers_telegram.send_message(chat_id, full_banned_message)
-                            logging.info(f"Auto-poofing message {message_id} in chat {chat_id} for pattern: {word}")
-                            helpers_telegram.delete_message(chat_id, message_id)
-                            return jsonify({"ok": True}), 200
-
-            ### CHECK FOR BANNED TOPICS ###
-            for _, data in banned_data.items():
-                banned_message = data.get('message')
-                banned_topics = data.get('substances')
-                for tuple_topic in banned_topics:
-                    for word in tuple_topic:
-                        pattern = r'\b' + re.escape(word.lower()) + r'\b'
-                        if re.search(pattern, text.lower()):
-                            banned_topic_message = msgs.banned_topic(tuple_topic, banned_message)
-                            helpers_telegram.send_message(chat_id, banned_topic_message, message_thread_id, reply_to_message_id=message_id)
-                            return jsonify({"ok": True}), 200
-                        
-                ### REGEX PATTERNS PER BANNED TOPIC ###  
-                banned_patterns = data.get('patterns', [])
-                for rx in banned_patterns:
-                    try:
-                        if re.search(rx, text, flags=re.IGNORECASE | re.DOTALL):
-                            banned_topic_message = msgs.banned_topic("Pattern match", banned_message)
-                            helpers_telegram.send_message(chat_id, banned_topic_message, message_thread_id, reply_to_message_id=message_id)
-                            return jsonify({"ok": True}), 200
-                    except re.error as e:
-                        logging.error(f"Invalid regex in banned pattern '{rx}': {e}")
-
-            ### CHECK FOR SPECIFIC QUESTIONS IN NEWBIES CHANNEL ###
-            if str(message_thread_id) == NEWBIE_CHANNEL and username not in MOD_ACCOUNTS:
-                for topic, data in newbies_mod_topics.items():
-                    if any(re.search(pattern, text) for pattern in data["patterns"]):
-                        message = data["message"]
-                        helpers_telegram.send_message(chat_id, message, message_thread_id, reply_to_message_id=message_id)
-                        return jsonify({"ok": True}), 200
-
-
-            ### WHEN DOC OR PHOTO POSTED IN TEST RESULTS CHANNEL 
-            if ("document" in message or "photo" in message) and str(message_thread_id) == TEST_RESULTS_CHANNEL:
+        return
+    
+    ### Skip the rest of the Bot functions if update is not from the main moderation TG groups
+    if str(chat_id) != SUPERGROUP_ID:
+        return  # Exit after handling the command for non-target groups
+    
+    ### ALL OTHER MESSAGES ###
+    elif "message" in update:
+
+        is_test_result_upload = ("document" in message or "photo" in message) and str(message_thread_id) == TEST_RESULTS_CHANNEL
+        with helpers_metrics.span("moderation"):
+            # Text features (NFKC, lowercase, text and caption URLs, mod flag) are derived once and shared by every rule
+            message_context = helpers_moderation.MessageContext.from_message(message, MODERATION_POLICY.mod_accounts)
+            flood = check_flood(message, message_context)
+            wave = None
+            if not flood.action and not is_test_result_upload:
+                wave = check_spam_wave(config, message_context, chat_id, message_id)
+            # Flooding senders and spam-wave copies are poofed without running the rule chain on each one
+            match = None if flood.action or wave else helpers_moderation.moderate_message(
+                config, MODERATION_POLICY, message_context, skip_links=is_test_result_upload
+            )
+        # Enforcement jumps the outbound send queue; rule-driven newbie answers go in the reply lane
+        if flood.action:
+            with helpers_outbound.lane(helpers_outbound.LANE_MODERATION):
+                apply_flood(flood, message, chat_id, message_thread_id, message_id, user_id, user_firstname)
+            return
+        if wave:
+            with helpers_outbound.lane(helpers_outbound.LANE_MODERATION):
+                apply_spam_wave(wave, chat_id, message_thread_id)
+            return
+        if match:
+            if match.category == helpers_moderation.CATEGORY_NEWBIE_REPLY:
+                send_lane = helpers_outbound.LANE_REPLY
+            else:
+                send_lane = helpers_outbound.LANE_MODERATION
+            with helpers_outbound.lane(send_lane):
+                apply_moderation(
+                    match, message, chat_id, message_thread_id, message_id, user_id, user_firstname,
+                    thread_flooding=flood.thread_flooding,
+                )
+            return
+
+        ### WHEN DOC OR PHOTO POSTED IN TEST RESULTS CHANNEL 
+        if is_test_result_upload:
+            # One getFile and one download, shared by extraction and the Discord bridge
+            with helpers_media.message_media(TELEGRAM_API, message) as media:
                 # AUTO EXTRACT TEST RESULTS (always run)
                 try:
-                    test_results_summary = msgs.summarize_test_results(update, BOT_TOKEN)
+                    with helpers_metrics.span("extraction"):
+                        test_results_summary = msgs.summarize_test_results(update, BOT_TOKEN, media)
                     helpers_telegram.send_message(chat_id, test_results_summary, message_thread_id)
                     logging.info("Test results extraction completed successfully")
                 except Exception as e:
@@ -324,69 +641,115 @@ def webhook():
                         "🚫 Test results extraction failed. Please verify the file type and that all required details are present, then try again.",
                         message_thread_id,
                     )
-                
+
                 # DISCORD BRIDGE - TELEGRAM TO DISCORD (skip for bot messages)
                 if str(chat_id) == SUPERGROUP_ID:
                     try:
-                        file_id = None
-                        filename = None
-                        
-                        if "photo" in message:
-                            file_id = message["photo"][-1]["file_id"]
-                            filename = "image.jpg"
-                        elif "document" in message:
-                            file_id = message["document"]["file_id"]
-                            filename = message["document"].get("file_name", "document")
-                        
-                        if file_id:
-                            file_response = requests.get(f"{TELEGRAM_API_URL}/getFile?file_id={file_id}")
-                            file_data = file_response.json()
-                            
-                            if file_data.get("ok"):
-                                file_path = file_data["result"]["file_path"]
-                                file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-                                
-                                display_name = username or user_firstname or "Anonymous"
-                                caption = text if text else None
-                                
-                                helpers_discord.send_telegram_file_to_discord(display_name, file_url, filename, caption)
-                                logging.info(f"Bridged Telegram→Discord: {display_name} ({filename})")
-                                
+                        display_name = username or user_firstname or "Anonymous"
+                        caption = text if text else None
+
+                        helpers_discord.send_telegram_file_to_discord(display_name, media.read(), media.filename, caption)
+                        logging.info(f"Bridged Telegram→Discord: {display_name} ({media.filename})")
+
                     except Exception as e:
                         logging.error(f"Failed to bridge Telegram file to Discord: {e}")
-                
-                return jsonify({"ok": True}), 200
+            
+            return
 
-            ### AUTO POOF LINKED COMMUNITIES ###
-            # Flag t.me/ links in group test channel
-            if "t.me/" in text and str(message_thread_id) == GROUP_TEST_CHANNEL and username not in MOD_ACCOUNTS: 
-                logging.info(f"Detected t.me/ link in group test thread")
-                reply_message = msgs.dont_link_group_test(user_id, user_firstname)
-                helpers_telegram.send_message(chat_id, reply_message, message_thread_id, reply_to_message_id=message_id)
-                helpers_telegram.delete_message(chat_id, message_id)
-                return jsonify({"ok": True}), 200
 
-            # If the text contains any ignored URL, skip moderation
-            if any(ignore_url in text for ignore_url in ignore_domains):
-                logging.info("Message contains an ignored URL. No moderation needed.")
-                return jsonify({"ok": True}), 200
-            
-            # If the text contains any moderated domain, return a warning message
-            for moderated_domain in dont_link_domains:
-                if moderated_domain in text  and username not in MOD_ACCOUNTS:
-                    logging.info(f"Detected moderated domain: {moderated_domain}")
-                    reply_message = msgs.dont_link(user_id, user_firstname)
-                    helpers_telegram.send_message(chat_id, reply_message, message_thread_id)
-                    helpers_telegram.delete_message(chat_id, message_id)
-                    return jsonify({"ok": True}), 200
-            
-        # if none of the bot functions need to run, also return success so update is accounted for
-        return jsonify({"ok": True}), 200
+# Count the message against the sender's and the thread's flood limits (mods and ignored threads are exempt)
+def check_flood(message, message_context):
+    if message_context.is_mod or message_context.thread in MODERATION_POLICY.ignore_automod_channels:
+        return helpers_spam.FloodVerdict()
+    return flood_tracker.record(message_context.user_id, message_context.thread, message.get("media_group_id"))
 
-    except Exception as e:
-        # Log the error to check what went wrong
-        logging.error(f"Error processing webhook: {e}")
-        return jsonify({"error": f"Internal server error: {e}"}), 500
+
+# Poof (and on repeat floods, mute) a sender who is over the per-user flood limit
+def apply_flood(flood, message, chat_id, message_thread_id, message_id, user_id, user_firstname):
+    if flood.new_episode:
+        user_name = message.get('from', {}).get('username', user_firstname)
+        logging.warning(
+            f"Flood from user {user_id} in chat {chat_id}: ~{flood.user_rate:.0f} messages in window, "
+            f"strike {flood.strikes}, action {flood.action}"
+        )
+        if flood.action == helpers_spam.ACTION_MUTE:
+            mute_seconds = flood_tracker.limits.mute_seconds
+            helpers_telegram.restrict_chat_member(chat_id, user_id, time.time() + mute_seconds)
+            notice = msgs.flood_muted(user_id, user_name, max(1, mute_seconds // 60))
+        else:
+            notice = msgs.flood_poofed(user_id, user_name)
+        if flood_tracker.allow_reply(user_id, flood.action, flood.thread_flooding):
+            helpers_telegram.send_message(chat_id, notice, message_thread_id)
+    helpers_telegram.delete_message(chat_id, message_id)
+
+
+# Index the message for near-duplicate detection; returns a WaveVerdict if it's part of a spam wave
+def check_spam_wave(config, message_context, chat_id, message_id):
+    return helpers_moderation.check_spam_wave(
+        config, MODERATION_POLICY, message_context, spam_wave_detector, chat_id, message_id
+    )
+
+
+# Poof every copy in a spam wave; the notice is posted once, when the wave is first detected
+def apply_spam_wave(wave, chat_id, message_thread_id):
+    if wave.new_wave:
+        logging.warning(
+            f"Spam wave {wave.wave.wave_id}: {len(wave.poof)} near-identical message(s) "
+            f"from {len(wave.wave.users)} users; poofing"
+        )
+        helpers_telegram.send_message(chat_id, msgs.spam_wave_poofed(len(wave.poof)), message_thread_id)
+    for poof_chat_id, poof_message_id in wave.poof:
+        try:
+            helpers_telegram.delete_message(poof_chat_id, poof_message_id)
+        except Exception as e:
+            logging.error(f"Failed to poof spam wave message {poof_message_id}: {e}")
+
+
+# One welcome message for one or more new members
+def send_welcome(chat_id, new_members):
+    with helpers_outbound.lane(helpers_outbound.LANE_BULK):
+        helpers_telegram.send_message(chat_id, msgs.welcome_newbies(new_members))
+
+
+# Carry out the action for a moderation match returned by helpers_moderation.moderate_message
+def apply_moderation(match, message, chat_id, message_thread_id, message_id, user_id, user_firstname, thread_flooding=False):
+    # Repeat notices to the same user within the cooldown, and every notice while the thread is
+    # flooding, are skipped so the bot doesn't amplify a flood; deletions always happen
+    if match.category == helpers_moderation.CATEGORY_NEWBIE_REPLY:
+        reply = not thread_flooding
+    else:
+        reply = flood_tracker.allow_reply(user_id, match.category, thread_flooding)
+
+    if match.category == helpers_moderation.CATEGORY_AUTO_POOF:
+        if reply:
+            full_banned_message = msgs.banned_topic(match.term, match.message, user=message.get('from', {}))
+            helpers_telegram.send_message(chat_id, full_banned_message)
+        logging.info(f"Auto-poofing message {message_id} in chat {chat_id} for pattern: {match.term}")
+        helpers_telegram.delete_message(chat_id, message_id)
+
+    elif match.category == helpers_moderation.CATEGORY_BANNED_TOPIC:
+        if reply:
+            banned_topic_message = msgs.banned_topic(match.term, match.message)
+            helpers_telegram.send_message(chat_id, banned_topic_message, message_thread_id, reply_to_message_id=message_id)
+
+    elif match.category == helpers_moderation.CATEGORY_NEWBIE_REPLY:
+        if reply:
+            helpers_telegram.send_message(chat_id, match.message, message_thread_id, reply_to_message_id=message_id)
+
+    elif match.category == helpers_moderation.CATEGORY_GROUP_TEST_LINK:
+        logging.info(f"Detected t.me/ link in group test thread")
+        if reply:
+            reply_message = msgs.dont_link_group_test(user_id, user_firstname)
+            helpers_telegram.send_message(chat_id, reply_message, message_thread_id, reply_to_message_id=message_id)
+        helpers_telegram.delete_message(chat_id, message_id)
+
+    elif match.category == helpers_moderation.CATEGORY_DONT_LINK:
+        # A URL in the text hit a moderated domain (and isn't an ignored URL)
+        logging.info(f"Detected moderated domain: {match.rule} in {match.url}")
+        if reply:
+            reply_message = msgs.dont_link(user_id, user_firstname)
+            helpers_telegram.send_message(chat_id, reply_message, message_thread_id)
+        helpers_telegram.delete_message(chat_id, message_id)
 
 
 # Helper to handle commands
@@ -452,29 +815,40 @@ def handle_command(command, chat_id, message_thread_id, reply_to_message_id, upd
 #     thread = threading.Thread(target=run_ai_conversation_loop, daemon=True)
 #     thread.start()
 
+# Start the update worker pool once the handlers above are defined (UPDATE_INGESTION_MODE=queue)
+helpers_services.start_once("update_workers", helpers_workers.start_update_workers, handle_update, update_lane)
+
 if __name__ == "__main__":
     import argparse
 
+    # The services above belong to the imported `bot` module (started first, when src/ imports it);
+    # run everything through that copy so handlers and services share one set of globals
+    import bot
+
     # Create argument parser
     parser = argparse.ArgumentParser(description="Manage Telegram bot webhooks.")
     parser.add_argument("--delete-webhook", action="store_true", help="Delete the current webhook.")
     parser.add_argument("--set-webhook", action="store_true", help="Set the webhook.")
     parser.add_argument("--check-webhook", action="store_true", help="Check the webhook status.")
+    parser.add_argument("--poll", action="store_true", help="Long-poll getUpdates instead of serving the webhook.")
     
     args = parser.parse_args()
 
     # Handle delete-webhook
     if args.delete_webhook:
-        delete_response = delete_webhook()
+        delete_response = bot.delete_webhook()
         logging.info(f"Delete Webhook Response: {delete_response}")
 
     elif args.set_webhook:
-        set_response = set_webhook()
+        set_response = bot.set_webhook()
         logging.info(f"Set Webhook Response: {set_response}")
 
     elif args.check_webhook:
-        check_response = check_webhook()
+        check_response = bot.check_webhook()
         logging.info(f"Check Webhook Response: {check_response}")
 
+    elif args.poll:
+        bot.run_polling()
+
     else:
-        app.run(host="0.0.0.0", port=8443)
+        bot.app.run(host="0.0.0.0", port=8443)
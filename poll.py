@@ -0,0 +1,5 @@
+"""Long-poll getUpdates instead of serving the webhook (same as `python bot.py --poll`)."""
+import bot
+
+if __name__ == "__main__":
+    bot.run_polling()
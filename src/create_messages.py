@@ -3,12 +3,16 @@ import os
 import sys
 from uuid import uuid4
 import numpy as np
-import requests
 import logging
 
 sys.path.append('./src')
 from src import helpers_openai
 from src import helpers_google
+from src import helpers_metrics
+from src import helpers_logging
+from src import helpers_media
+from src import helpers_extraction_cache
+from src import helpers_telegram
 
 # Setup basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
@@ -16,9 +20,21 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def welcome_newbie(new_user):
     """Formats a welcome message for newbies."""
+    mention = f"<a href='tg://user?id={new_user['id']}'>@{new_user.get('username', new_user['first_name'])}</a> " if new_user!='' else new_user
+    return _welcome_text(mention)
+
+def welcome_newbies(new_users):
+    """Formats one welcome message mentioning every member in a join burst."""
+    if len(new_users) == 1:
+        return welcome_newbie(new_users[0])
+    mention = ", ".join(
+        f"<a href='tg://user?id={user['id']}'>@{user.get('username', user['first_name'])}</a>" for user in new_users
+    )
+    return _welcome_text(mention)
+
+def _welcome_text(mention):
     wiki = "<a href='https://www.stairwaytogray.com/'>📖 Community Intro</a>"
     guides = f"<a href='{bot.RULES_GUIDE_POST}'>📚 Rules & Guides Channel</a>"
-    mention = f"<a href='tg://user?id={new_user['id']}'>@{new_user.get('username', new_user['first_name'])}</a> " if new_user!='' else new_user
     welcome_message = (
         f"{mention} Welcome to the Telegram community for Stairway to Gray! ✨🐰\n\n"
         f"Before jumping in, we've gathered answers to the most common newbie questions in our <b>Gray 101</b> guide and <b>Rules & Guides channel</b> linked below:\n\n{wiki}\n{guides}\n\n"
@@ -52,9 +68,7 @@ def newbie_announcement():
 def lastcall(update, BOT_TOKEN):
     # Get chat member count
     chat_id = update['message']["chat"]["id"]
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChatMemberCount"
-    response = requests.get(url, params={'chat_id': chat_id})
-    member_count = int(response.json().get("result")) - 1  # To account for Bot itself
+    member_count = helpers_telegram.get_member_count(chat_id) - 1  # To account for Bot itself
 
     # Get the full command text after '/lastcall'
     command_text = update['message']['text'][len('/lastcall '):].strip()
@@ -136,6 +150,29 @@ def dont_link(user_id, user_name):
     )
     return message
 
+def flood_poofed(user_id, user_name):
+    message = (
+        f"<a href='tg://user?id={user_id}'>@{user_name}</a> 💨🚫 "
+        "Whoa, slow down! You're posting faster than the group allows, so we're auto-poofing these messages. "
+        "Please wait a moment and combine your thoughts into fewer messages. 🙏"
+    )
+    return message
+
+def flood_muted(user_id, user_name, mute_minutes):
+    message = (
+        f"<a href='tg://user?id={user_id}'>@{user_name}</a> 🔇 "
+        f"You've been muted for {mute_minutes} minutes for repeatedly flooding the chat. "
+        "If this was a mistake, please reach out to a mod. 🙏"
+    )
+    return message
+
+def spam_wave_poofed(message_count):
+    message = (
+        f"💨🚫 Auto-poofed {message_count} near-identical messages posted by several accounts. "
+        "Copy-paste waves like this are almost always scams: never DM vendors or 'mentors' who reach out first. 🙏"
+    )
+    return message
+
 def dont_link_group_test(user_id, user_name):
     message = (
     f"<a href='tg://user?id={user_id}'>@{user_name}</a> 💨🚫 Ope! "
@@ -148,43 +185,52 @@ def dont_link_group_test(user_id, user_name):
     )
     return message
 
-def summarize_test_results(update, BOT_TOKEN):
+def record_test_results(extraction, data_rows):
+    """Append a fresh extraction's rows to the results sheet.
+
+    A cache hit is a repost whose rows were appended when it was first
+    extracted, so nothing is appended for it. If an append fails, the
+    extraction is dropped from the cache so the next post records it.
+    """
+    if extraction.cached:
+        return
+    try:
+        for data_row in data_rows:
+            helpers_google.append_to_sheet(data_row)
+    except Exception:
+        helpers_extraction_cache.get_extraction_cache().invalidate(extraction.key)
+        raise
+
+def summarize_test_results(update, BOT_TOKEN, media=None):
+    """Extract, record and summarize the test result attached to the update.
+
+    ``media`` is the update's helpers_media.MediaFile when the caller shares
+    one download with other consumers; otherwise one is fetched here.
+    """
     message = update["message"]
     text = message.get("text", "")
 
-    # Handle documents or photos
-    if "document" in message:
-        file_id = message["document"]["file_id"]
-    elif "photo" in message:
-        file_id = message["photo"][-1]["file_id"]
-    else:
-        raise ValueError("No document or photo found in the message.")
-
-    # Get file info
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getFile"
-    file_info = requests.get(url, params={"file_id": file_id}).json()
-    file_path = file_info["result"]["file_path"]
+    if media is None:
+        media = helpers_media.message_media(bot.TELEGRAM_API, message)
+        if media is None:
+            raise ValueError("No document or photo found in the message.")
+        with media:
+            return summarize_test_results(update, BOT_TOKEN, media)
 
-    # Download the file
-    file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-    downloaded_file = requests.get(file_url).content
-    local_path = f"./temp{uuid4()}/{os.path.basename(file_path)}"
+    # Copy the (already downloaded, if shared) file where the extractor can read it
+    local_path = f"./temp{uuid4()}/{os.path.basename(media.file_path)}"
     os.makedirs(os.path.dirname(local_path), exist_ok=True)
-    with open(local_path, "wb") as f:
-        f.write(downloaded_file)
+    media.save(local_path)
 
     # Process the file using OpenAI
-    extracted_test_data = helpers_openai.extract_data_with_openai(local_path, text)
-    logging.info(f"Extracted data returned: {extracted_test_data}")
+    extraction = helpers_openai.extract_test_results(local_path, text)
+    extracted_test_data = extraction.results
+    logging.info("Extracted data returned: %s", extracted_test_data, extra={"category": helpers_logging.CATEGORY_MODEL_RESPONSE})
 
     if extracted_test_data:
-        required_fields = [
-            "vendor",
-            "peptide",
-            "test_date",
-            "expected_mass_mg"
-        ]
+        required_fields = helpers_extraction_cache.REQUIRED_FIELDS
 
+        data_rows = []
         for sample in extracted_test_data:
             missing = [field for field in required_fields if getattr(sample, field, None) in (None, "")]
             if missing:
@@ -214,11 +260,14 @@ def summarize_test_results(update, BOT_TOKEN):
                 + [sample.test_key]
                 + [sample.test_task]
             )
-            helpers_google.append_to_sheet(data_row)
+            data_rows.append(data_row)
+
+        record_test_results(extraction, data_rows)
 
         raw_data_url =  f"<a href='{bot.TEST_RESULTS_SPREADSHEET}'>🌐 You can find the raw data here</a>"
         if sample.mass_mg:
-            grouped_stats = helpers_google.calculate_statistics(sample.vendor, sample.peptide)
+            with helpers_metrics.span("statistics"):
+                grouped_stats = helpers_google.calculate_statistics(sample.vendor, sample.peptide)
             logging.info(f"Grouped stats: {grouped_stats}")
             # Initialize the message text
             message_text = f"📊 <b>{sample.vendor.upper()} {sample.peptide.upper()} Analysis for the last 6 months:</b>\n\n"
@@ -249,7 +298,7 @@ def summarize_test_results(update, BOT_TOKEN):
 
             # Clean up
             os.remove(local_path)
-            logging.info(f"Message: {message_text + raw_data_url}")
+            logging.info("Message: %s", message_text + raw_data_url, extra={"category": helpers_logging.CATEGORY_MESSAGE_BODY})
             return message_text + raw_data_url
         
         elif sample.endotoxin:
@@ -262,7 +311,7 @@ def summarize_test_results(update, BOT_TOKEN):
                 f"<a href='https://www.stairwaytogray.com/posts/testing/testing-101/#endotoxin'>More details in the Testing 101 Guide 🔬</a>\n\n"
             )
             os.remove(local_path)
-            logging.info(f"Message: {message_text + raw_data_url}")
+            logging.info("Message: %s", message_text + raw_data_url, extra={"category": helpers_logging.CATEGORY_MESSAGE_BODY})
             return message_text + raw_data_url
         
         else:
@@ -271,7 +320,7 @@ def summarize_test_results(update, BOT_TOKEN):
                 f"🔹<a href='https://www.stairwaytogray.com/posts/testing/testing-101/#how-do-i-read-my-test-results'>How Do I Read My Test Results? Check out the Testing 101 Guide 🔬</a>\n\n"
             )
             os.remove(local_path)
-            logging.info(f"Message: {message_text + raw_data_url}")
+            logging.info("Message: %s", message_text + raw_data_url, extra={"category": helpers_logging.CATEGORY_MESSAGE_BODY})
             return message_text + raw_data_url
     
     else:
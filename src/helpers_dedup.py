@@ -0,0 +1,196 @@
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+MESSAGE_UPDATE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post")
+
+_deduplicator: Optional["UpdateDeduplicator"] = None
+_deduplicator_lock = threading.Lock()
+
+
+class UpdateDeduplicator:
+    """Time-windowed, memory-capped record of recently seen Telegram updates.
+
+    Keys live in a ring buffer (oldest first) plus a dict for O(1) lookups.
+    Entries fall out once they are older than ``window_seconds`` or once the
+    buffer holds ``max_entries`` keys, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 600,
+        max_entries: int = 10000,
+        key_on_message: bool = True,
+        state_path: Optional[Path] = None,
+    ):
+        self.window_seconds = float(window_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.key_on_message = key_on_message
+        self.state_path = state_path
+        self.duplicates = 0
+        self._ring: Deque[Tuple[float, tuple]] = deque()
+        self._seen: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if state_path:
+            self._load()
+
+    def update_keys(self, update: dict) -> List[tuple]:
+        keys: List[tuple] = []
+        update_id = update.get("update_id")
+        if update_id is not None:
+            keys.append(("update", update_id))
+        if self.key_on_message:
+            for update_type in MESSAGE_UPDATE_TYPES:
+                message = update.get(update_type)
+                if not isinstance(message, dict):
+                    continue
+                chat_id = message.get("chat", {}).get("id")
+                message_id = message.get("message_id")
+                if chat_id is not None and message_id is not None:
+                    # Edits reuse the message_id, so the update type (and for edits, edit_date) is part of the key
+                    if update_type.startswith("edited_"):
+                        keys.append((update_type, chat_id, message_id, message.get("edit_date")))
+                    else:
+                        keys.append((update_type, chat_id, message_id))
+        return keys
+
+    def is_duplicate(self, update: dict, now: Optional[float] = None) -> bool:
+        """Return True if the update was already seen; otherwise remember it."""
+        keys = self.update_keys(update)
+        if not keys:
+            return False
+
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            if any(key in self._seen for key in keys):
+                self.duplicates += 1
+                return True
+            for key in keys:
+                self._remember(key, now)
+            self._dirty = True
+        return False
+
+    def forget(self, update: dict):
+        """Drop an update's keys so a redelivery is processed (e.g. after a rejected enqueue)."""
+        with self._lock:
+            for key in self.update_keys(update):
+                self._seen.pop(key, None)
+            self._dirty = True
+
+    @contextmanager
+    def forget_on_error(self, update: dict):
+        """Forget ``update`` if the block raises, so Telegram's redelivery of a failed update is handled."""
+        try:
+            yield
+        except Exception:
+            self.forget(update)
+            raise
+
+    def __len__(self):
+        return len(self._seen)
+
+    def _remember(self, key: tuple, timestamp: float):
+        while len(self._ring) >= self.max_entries:
+            old_timestamp, old_key = self._ring.popleft()
+            if self._seen.get(old_key) == old_timestamp:
+                del self._seen[old_key]
+        self._ring.append((timestamp, key))
+        self._seen[key] = timestamp
+
+    def _expire(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._ring and self._ring[0][0] < cutoff:
+            timestamp, key = self._ring.popleft()
+            if self._seen.get(key) == timestamp:
+                del self._seen[key]
+
+    def _load(self):
+        try:
+            data = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to read update dedup state %s: %s", self.state_path, exc)
+            return
+
+        now = time.time()
+        with self._lock:
+            for timestamp, key in data.get("entries", []):
+                self._remember(tuple(key), float(timestamp))
+            self._expire(now)
+        logging.info("Loaded %d recent update key(s) from %s", len(self._seen), self.state_path)
+
+    def persist(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[timestamp, list(key)] for timestamp, key in self._ring if self._seen.get(key) == timestamp]
+            self._dirty = False
+
+        try:
+            if self.state_path.parent and not self.state_path.parent.exists():
+                self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps({"entries": entries}))
+            os.replace(tmp_path, self.state_path)
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to persist update dedup state to %s: %s", self.state_path, exc)
+
+
+def _persist_loop(deduplicator: UpdateDeduplicator, interval_seconds: float):
+    while True:
+        time.sleep(interval_seconds)
+        deduplicator.persist()
+
+
+def get_deduplicator() -> UpdateDeduplicator:
+    """Lazily build the process-wide deduplicator from environment settings."""
+    global _deduplicator
+    if _deduplicator is not None:
+        return _deduplicator
+
+    with _deduplicator_lock:
+        if _deduplicator is not None:
+            return _deduplicator
+
+        window_seconds = float(os.getenv("UPDATE_DEDUP_WINDOW_SECONDS", 600))
+        max_entries = int(os.getenv("UPDATE_DEDUP_MAX_ENTRIES", 10000))
+        key_on_message = os.getenv("UPDATE_DEDUP_MESSAGE_KEYS", "1") != "0"
+        state_env = os.getenv("UPDATE_DEDUP_STATE_PATH")
+        state_path = Path(state_env).expanduser() if state_env else None
+
+        deduplicator = UpdateDeduplicator(window_seconds, max_entries, key_on_message, state_path)
+        if state_path:
+            interval_seconds = max(1.0, float(os.getenv("UPDATE_DEDUP_PERSIST_SECONDS", 30)))
+            threading.Thread(
+                target=_persist_loop,
+                args=(deduplicator, interval_seconds),
+                daemon=True,
+                name="update-dedup-persist",
+            ).start()
+            atexit.register(deduplicator.persist)
+        _deduplicator = deduplicator
+    return _deduplicator
+
+
+def is_duplicate_update(update: dict) -> bool:
+    return get_deduplicator().is_duplicate(update)
+
+
+def forget_update(update: dict):
+    get_deduplicator().forget(update)
+
+
+def forget_update_on_error(update: dict):
+    return get_deduplicator().forget_on_error(update)
@@ -3,13 +3,14 @@ import asyncio
 import logging
 import os
 import json
-import requests
 from io import BytesIO
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from dotenv import load_dotenv
 
-from src import helpers_telegram
+from src import helpers_telegram_async
+from src import helpers_metrics
+from src import helpers_outbound
 
 
 # Load environment variables
@@ -46,6 +47,10 @@ TELEGRAM_CHAT_ID, TELEGRAM_TOPIC_ID = _get_telegram_targets()
 class DiscordBridge(discord.Client):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+
+    async def close(self):
+        await helpers_telegram_async.get_client().close()
+        await super().close()
         
     async def on_ready(self):
         logging.info(f'Discord bridge logged in as {self.user}')
@@ -85,94 +90,111 @@ class DiscordBridge(discord.Client):
             
             if message.content:
                 telegram_message += f"{message.content}\n\n"
-                
-            helpers_telegram.send_message(
-                TELEGRAM_CHAT_ID, 
-                telegram_message, 
-                message_thread_id=TELEGRAM_TOPIC_ID
-            )
-            
-            # Send attachments
-            for attachment in message.attachments:
-                if attachment.content_type and attachment.content_type.startswith('image/'):
-                    helpers_telegram.send_image(
+
+            # Bridged posts wait behind moderation and replies in the send queue
+            with helpers_outbound.lane(helpers_outbound.LANE_BULK):
+                telegram = helpers_telegram_async.get_client()
+                await telegram.send_message(
+                    TELEGRAM_CHAT_ID, 
+                    telegram_message, 
+                    message_thread_id=TELEGRAM_TOPIC_ID
+                )
+
+                # Send image attachments as one album, each with its own caption
+                images = [
+                    attachment for attachment in message.attachments
+                    if attachment.content_type and attachment.content_type.startswith('image/')
+                ]
+                if images:
+                    await telegram.send_media_group(
                         TELEGRAM_CHAT_ID,
-                        image_url=attachment.url,
+                        [attachment.url for attachment in images],
                         message_thread_id=TELEGRAM_TOPIC_ID,
-                        caption=f"📎 {attachment.filename}"
+                        captions=[f"📎 {attachment.filename}" for attachment in images]
                     )
-                    
-                    # Manually trigger test results extraction for test results channel
-                    if TELEGRAM_TOPIC_ID == '48':
-                        from src.helpers_test_results import extract_test_results_from_image
-                        extract_test_results_from_image(attachment.url, TELEGRAM_CHAT_ID, TELEGRAM_TOPIC_ID)
-            
-            # Extract and send images from links (always run for messages with links)
-            if has_content:
-                await self.extract_and_send_link_images(message.content)
+                    await asyncio.gather(*(self.extract_test_results(attachment.url) for attachment in images))
+
+                # Extract and send images from links (always run for messages with links)
+                if has_content:
+                    await self.extract_and_send_link_images(message.content)
                     
             logging.info(f"Bridged Discord→Telegram: {message.author.display_name}")
             
         except Exception as e:
             logging.error(f"Failed to bridge Discord message: {e}")
+
+    async def extract_test_results(self, image_url):
+        """Manually trigger test results extraction for the test results channel"""
+        if TELEGRAM_TOPIC_ID == '48':
+            from src.helpers_test_results import extract_test_results_from_image
+            # Extraction makes blocking OpenAI and Sheets calls; keep them off the gateway loop
+            await asyncio.to_thread(extract_test_results_from_image, image_url, TELEGRAM_CHAT_ID, TELEGRAM_TOPIC_ID)
+
+    async def find_link_image(self, url):
+        """Return the absolute URL of the most relevant image on a webpage, or None"""
+        try:
+            page = await helpers_telegram_async.get_client().fetch(
+                url, operation="link_page", headers={'User-Agent': 'Mozilla/5.0'}
+            )
+            soup = BeautifulSoup(page, 'html.parser')
+            
+            # Look for images with priority order
+            image_url = None
+            
+            # 1. Try report-specific images first
+            report_img = soup.find('img', class_='report-img') or soup.find('img', alt=lambda x: x and 'test report' in x.lower())
+            if report_img and report_img.get('src'):
+                image_url = report_img['src']
             
+            # 2. Try Open Graph image
+            if not image_url:
+                og_image = soup.find('meta', property='og:image')
+                if og_image and og_image.get('content'):
+                    image_url = og_image['content']
+            
+            # 3. Try first img tag
+            if not image_url:
+                img_tag = soup.find('img')
+                if img_tag and img_tag.get('src'):
+                    image_url = img_tag['src']
+            
+            # Make URL absolute
+            return urljoin(url, image_url) if image_url else None
+                
+        except Exception as e:
+            logging.error(f"Failed to extract image from {url}: {e}")
+            return None
+
     async def extract_and_send_link_images(self, content):
         """Extract images from webpage links and send to Telegram"""
         import re
         
         # Find URLs in content
         urls = re.findall(r'https?://[^\s]+', content)
-        
+
+        # Pages are fetched one at a time, only until an image has been sent
         for url in urls:
+            image_url = await self.find_link_image(url)
+            if not image_url:
+                continue
             try:
-                response = requests.get(url, timeout=10, headers={'User-Agent': 'Mozilla/5.0'})
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.content, 'html.parser')
-                
-                # Look for images with priority order
-                image_url = None
-                
-                # 1. Try report-specific images first
-                report_img = soup.find('img', class_='report-img') or soup.find('img', alt=lambda x: x and 'test report' in x.lower())
-                if report_img and report_img.get('src'):
-                    image_url = report_img['src']
-                
-                # 2. Try Open Graph image
-                if not image_url:
-                    og_image = soup.find('meta', property='og:image')
-                    if og_image and og_image.get('content'):
-                        image_url = og_image['content']
-                
-                # 3. Try first img tag
-                if not image_url:
-                    img_tag = soup.find('img')
-                    if img_tag and img_tag.get('src'):
-                        image_url = img_tag['src']
-                
-                # Make URL absolute
-                if image_url:
-                    image_url = urljoin(url, image_url)
-                    
-                    # Send image to Telegram
-                    helpers_telegram.send_image(
-                        TELEGRAM_CHAT_ID,
-                        image_url=image_url,
-                        message_thread_id=TELEGRAM_TOPIC_ID,
-                        caption=f"🔗 From: {image_url}"
-                    )
-                    
-                    # Manually trigger test results extraction for test results channel
-                    if TELEGRAM_TOPIC_ID == '48':
-                        from src.helpers_test_results import extract_test_results_from_image
-                        extract_test_results_from_image(image_url, TELEGRAM_CHAT_ID, TELEGRAM_TOPIC_ID)
-                    break  # Only send first image found
-                    
+                await helpers_telegram_async.get_client().send_image(
+                    TELEGRAM_CHAT_ID,
+                    image_url=image_url,
+                    message_thread_id=TELEGRAM_TOPIC_ID,
+                    caption=f"🔗 From: {image_url}"
+                )
             except Exception as e:
-                logging.error(f"Failed to extract image from {url}: {e}")
+                # A dead image link shouldn't stop the next link's image from being forwarded
+                logging.error(f"Failed to send link image {image_url}: {e}")
                 continue
+            try:
+                await self.extract_test_results(image_url)
+            except Exception as e:
+                logging.error(f"Failed to extract test results from {image_url}: {e}")
+            break  # Only send first image found
             
-    async def send_to_discord(self, username, file_url, filename, caption=None):
+    async def send_to_discord(self, username, file_content, filename, caption=None):
         """Send file from Telegram to Discord"""
         try:
             channel = self.get_channel(DISCORD_STGTS_CHANNEL_ID)
@@ -189,18 +211,15 @@ class DiscordBridge(discord.Client):
                 logging.error("Bot lacks Attach Files permission in Discord channel")
                 return
                 
-            # Download file
-            response = requests.get(file_url)
-            response.raise_for_status()
-            
             # Create message content
             content = f"🔗 **STG Telegram Bridge**\n👤 **{username}**"
             if caption:
                 content += f"\n\n{caption}"
                 
             # Send to Discord
-            file = discord.File(fp=BytesIO(response.content), filename=filename)
-            await channel.send(content=content, file=file)
+            file = discord.File(fp=BytesIO(file_content), filename=filename)
+            with helpers_metrics.dependency_call("discord", "channel.send"):
+                await channel.send(content=content, file=file)
             
             logging.info(f"Bridged Telegram→Discord: {username}")
             
@@ -242,12 +261,12 @@ def start_discord_bridge():
     discord_thread.start()
     logging.info("Discord bridge started")
 
-def send_telegram_file_to_discord(username, file_url, filename, caption=None):
-    """Send file from Telegram to Discord"""
+def send_telegram_file_to_discord(username, file_content, filename, caption=None):
+    """Send file from Telegram to Discord; ``file_content`` is the bytes the update's handler already downloaded"""
     global discord_client
     if discord_client and discord_client.is_ready():
         asyncio.run_coroutine_threadsafe(
-            discord_client.send_to_discord(username, file_url, filename, caption),
+            discord_client.send_to_discord(username, file_content, filename, caption),
             discord_client.loop
         )
     else:
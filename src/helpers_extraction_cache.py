@@ -0,0 +1,228 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from src.helpers_lru import LRUDict
+
+HASH_CHUNK_BYTES = 64 * 1024
+# Fields a TestResult needs before it is summarized, recorded or cached
+REQUIRED_FIELDS = ("vendor", "peptide", "test_date", "expected_mass_mg")
+
+_cache: Optional["ExtractionCache"] = None
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class Extraction:
+    """One test-result extraction: the parsed TestResults (None for an unsupported image)."""
+
+    results: Optional[list]
+    key: str
+    cached: bool = False
+
+
+class ExtractionCache:
+    """Persistent LRU of extraction key -> parsed TestResult dicts.
+
+    Keys come from ``extraction_key``: the model, the prompt fingerprint and
+    a hash of the image, so a repost of the same COA is answered without a
+    vision call while a new model or prompt misses and re-extracts. Entries
+    expire after ``ttl_seconds``. Only complete extractions are kept (see
+    ``put_if_complete``): the caption is part of the prompt, so a repost of
+    an unsupported or incomplete result with a better caption must reach
+    the model again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 30 * 24 * 3600,
+        state_path: Optional[Path] = None,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.state_path = state_path
+        self._clock = clock
+        self._entries = LRUDict(max_entries)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        if state_path:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[List[dict]]:
+        """The cached results for ``key``, or None if it must be extracted."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] <= self._clock():
+                del self._entries[key]
+                self.expired += 1
+                self._dirty = True
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry["results"])
+
+    def put_if_complete(self, key: str, results: List[dict]) -> List[dict]:
+        """Cache ``results`` if there are some and none is missing a required field.
+
+        Returns the results to use, which are the cached ones when they were stored.
+        """
+        if results and not any(missing_fields(result) for result in results):
+            return self.put(key, results)
+        return list(results)
+
+    def put(self, key: str, results: List[dict]) -> List[dict]:
+        """Cache the parsed results for ``key``.
+
+        If a concurrent extraction of the same key already landed, its entry
+        is kept and its results are returned.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry["expires_at"] > self._clock():
+                return list(entry["results"])
+            self._entries.pop(key, None)
+            expires_at = self._clock() + self.ttl_seconds
+            self._entries.touch(key, lambda: {"results": list(results), "expires_at": expires_at})
+            self._dirty = True
+            return list(results)
+
+    def invalidate(self, key: Optional[str] = None):
+        """Forget one extraction, or every extraction when ``key`` is None (e.g. after fixing a bad prompt)."""
+        with self._lock:
+            if key is None:
+                self.invalidated += len(self._entries)
+                self._entries.clear()
+                self._dirty = True
+            elif self._entries.pop(key, None) is not None:
+                self.invalidated += 1
+                self._dirty = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "expired": self.expired,
+                "invalidated": self.invalidated,
+                "evicted": self._entries.evicted,
+            }
+
+    def _load(self):
+        try:
+            data = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to read extraction cache %s: %s", self.state_path, exc)
+            return
+
+        now = self._clock()
+        with self._lock:
+            # Saved oldest first, so replaying them restores the LRU order
+            for key, entry in data.get("entries", []):
+                if entry["expires_at"] > now:
+                    self._entries.touch(key, lambda: entry)
+        logging.info("Loaded %d cached extraction(s) from %s", len(self._entries), self.state_path)
+
+    def persist(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[key, entry] for key, entry in self._entries.items()]
+            self._dirty = False
+
+        try:
+            if self.state_path.parent and not self.state_path.parent.exists():
+                self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps({"entries": entries}))
+            os.replace(tmp_path, self.state_path)
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to persist extraction cache to %s: %s", self.state_path, exc)
+
+
+def image_digest(path: str) -> str:
+    """Hash of an image's decoded pixels, so re-saves that only change metadata or orientation tags match.
+
+    Files Pillow can't decode (PDFs) are hashed byte for byte.
+    """
+    try:
+        from PIL import Image, ImageOps
+
+        with Image.open(path) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            digest = hashlib.sha256(f"{image.width}x{image.height}:".encode())
+            digest.update(image.tobytes())
+            return f"px:{digest.hexdigest()}"
+    except Exception:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
+
+
+def missing_fields(result: dict) -> List[str]:
+    return [field for field in REQUIRED_FIELDS if result.get(field) in (None, "")]
+
+
+def extraction_key(digest: str, model_id: str, prompt_version: str) -> str:
+    return f"{model_id}:{prompt_version}:{digest}"
+
+
+def _persist_loop(cache: ExtractionCache, interval_seconds: float):
+    while True:
+        time.sleep(interval_seconds)
+        cache.persist()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Lazily build the process-wide cache from EXTRACTION_CACHE_* settings."""
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is not None:
+            return _cache
+
+        max_entries = int(os.getenv("EXTRACTION_CACHE_SIZE", 1024))
+        ttl_seconds = float(os.getenv("EXTRACTION_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+        state_env = os.getenv("EXTRACTION_CACHE_STATE_PATH")
+        state_path = Path(state_env).expanduser() if state_env else None
+
+        cache = ExtractionCache(max_entries, ttl_seconds, state_path)
+        if state_path:
+            interval_seconds = max(1.0, float(os.getenv("EXTRACTION_CACHE_PERSIST_SECONDS", 60)))
+            threading.Thread(
+                target=_persist_loop,
+                args=(cache, interval_seconds),
+                daemon=True,
+                name="extraction-cache-persist",
+            ).start()
+            atexit.register(cache.persist)
+        _cache = cache
+    return _cache
@@ -0,0 +1,194 @@
+import atexit
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+from src.helpers_lru import LRUDict
+
+HASH_CHUNK_BYTES = 64 * 1024
+
+_cache: Optional["FileIdCache"] = None
+_cache_lock = threading.Lock()
+
+
+class FileIdCache:
+    """Persistent LRU of media source -> Telegram ``file_id`` for media the bot has already sent.
+
+    Keys are either a source URL (``url_key``) or a hash of the bytes that
+    were uploaded (``content_key``), so the same asset is recognised however
+    it arrives. Resending by file_id is a small JSON request: nothing is
+    downloaded or uploaded. Callers invalidate() an id Telegram rejects.
+    """
+
+    def __init__(self, max_entries: int = 2048, state_path: Optional[Path] = None):
+        self.state_path = state_path
+        self._entries = LRUDict(max_entries)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        if state_path:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if not key:
+            return None
+        with self._lock:
+            file_id = self._entries.get(key)
+            if file_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return file_id
+
+    def put(self, key: Optional[str], file_id: Optional[str]):
+        if not key or not file_id:
+            return
+        with self._lock:
+            if self._entries.get(key) == file_id:
+                self._entries.move_to_end(key)
+                return
+            self._entries.pop(key, None)
+            self._entries.touch(key, lambda: file_id)
+            self._dirty = True
+
+    def invalidate(self, key: Optional[str]):
+        """Forget a file_id Telegram refused, so the next send uploads afresh."""
+        with self._lock:
+            if key and self._entries.pop(key, None) is not None:
+                self.invalidated += 1
+                self._dirty = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidated": self.invalidated,
+                "evicted": self._entries.evicted,
+            }
+
+    def _load(self):
+        try:
+            data = json.loads(self.state_path.read_text())
+        except FileNotFoundError:
+            return
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to read file_id cache %s: %s", self.state_path, exc)
+            return
+
+        with self._lock:
+            # Saved oldest first, so replaying them restores the LRU order
+            for key, file_id in data.get("entries", []):
+                self._entries.touch(key, lambda: file_id)
+        logging.info("Loaded %d cached file_id(s) from %s", len(self._entries), self.state_path)
+
+    def persist(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = [[key, file_id] for key, file_id in self._entries.items()]
+            self._dirty = False
+
+        try:
+            if self.state_path.parent and not self.state_path.parent.exists():
+                self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+            tmp_path.write_text(json.dumps({"entries": entries}))
+            os.replace(tmp_path, self.state_path)
+        except Exception as exc:  # pragma: no cover - defensive
+            logging.warning("Unable to persist file_id cache to %s: %s", self.state_path, exc)
+
+
+def url_key(url: str) -> str:
+    return f"url:{url}"
+
+
+def content_key(content: Union[bytes, object]) -> str:
+    """``sha256:<hex>`` of raw bytes or of a seekable file (hashed in chunks, then rewound)."""
+    if isinstance(content, (bytes, bytearray)):
+        return f"sha256:{hashlib.sha256(content).hexdigest()}"
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(HASH_CHUNK_BYTES), b""):
+        digest.update(chunk)
+    content.seek(0)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def sent_file_id(message: Optional[dict]) -> Optional[str]:
+    """The reusable file_id of the media in a sent Message (largest photo size for photos)."""
+    if not message:
+        return None
+    if message.get("photo"):
+        return message["photo"][-1]["file_id"]
+    for kind in ("animation", "document", "video"):
+        if message.get(kind):
+            return message[kind]["file_id"]
+    return None
+
+
+# Bad Request descriptions that mean the file_id itself is unusable. Any
+# other 400 (thread not found, caption or parse errors) would fail the same
+# way after an upload, so the cached id is kept and the error passed on.
+STALE_FILE_ID_ERRORS = (
+    "wrong file identifier",
+    "wrong remote file identifier",
+    "wrong file_id",
+    "file reference expired",
+    "file_reference_expired",
+    "type of file mismatch",
+)
+
+
+def is_stale_file_id_error(description: Optional[str]) -> bool:
+    """Whether a Bad Request ``description`` blames the file_id that was sent."""
+    description = (description or "").lower()
+    return any(error in description for error in STALE_FILE_ID_ERRORS)
+
+
+def _persist_loop(cache: FileIdCache, interval_seconds: float):
+    while True:
+        time.sleep(interval_seconds)
+        cache.persist()
+
+
+def get_file_id_cache() -> FileIdCache:
+    """Lazily build the process-wide cache from TELEGRAM_FILE_ID_* settings."""
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is not None:
+            return _cache
+
+        max_entries = int(os.getenv("TELEGRAM_FILE_ID_CACHE_SIZE", 2048))
+        state_env = os.getenv("TELEGRAM_FILE_ID_STATE_PATH")
+        state_path = Path(state_env).expanduser() if state_env else None
+
+        cache = FileIdCache(max_entries, state_path)
+        if state_path:
+            interval_seconds = max(1.0, float(os.getenv("TELEGRAM_FILE_ID_PERSIST_SECONDS", 60)))
+            threading.Thread(
+                target=_persist_loop,
+                args=(cache, interval_seconds),
+                daemon=True,
+                name="file-id-cache-persist",
+            ).start()
+            atexit.register(cache.persist)
+        _cache = cache
+    return _cache
@@ -7,6 +7,7 @@ import os
 import sys
 import logging
 from dotenv import load_dotenv
+from src import helpers_metrics
 
 # Setup basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
@@ -37,12 +38,13 @@ SPREADSHEET_COLS = ["Vendor", "Test Date", "Batch", "Expected Mass mg", "Mass mg
 def append_to_sheet(data):
     global service
     body = {"values": [data]}
-    service.spreadsheets().values().append(
-        spreadsheetId=SPREADSHEET_ID,
-        range=RANGE_NAME,
-        valueInputOption="USER_ENTERED",
-        body=body
-    ).execute()
+    with helpers_metrics.dependency_call("google_sheets", "values.append"):
+        service.spreadsheets().values().append(
+            spreadsheetId=SPREADSHEET_ID,
+            range=RANGE_NAME,
+            valueInputOption="USER_ENTERED",
+            body=body
+        ).execute()
 
 # Function to read data from Google Sheets
 def read_sheet():
@@ -53,10 +55,11 @@ def read_sheet():
     - pd.DataFrame: A DataFrame containing all rows, with column names taken from the first row of the sheet.
     """
     global service
-    result = service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range=RANGE_NAME
-    ).execute()
+    with helpers_metrics.dependency_call("google_sheets", "values.get"):
+        result = service.spreadsheets().values().get(
+            spreadsheetId=SPREADSHEET_ID,
+            range=RANGE_NAME
+        ).execute()
     values = result.get("values", [])
     
     if not values:
@@ -67,10 +70,11 @@ def read_sheet():
 def calculate_statistics(vendor_name, peptide):
     global service
     # Read data from Google Sheets
-    result = service.spreadsheets().values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range=RANGE_NAME
-    ).execute()
+    with helpers_metrics.dependency_call("google_sheets", "values.get"):
+        result = service.spreadsheets().values().get(
+            spreadsheetId=SPREADSHEET_ID,
+            range=RANGE_NAME
+        ).execute()
     values = result.get("values", [])
     df = pd.DataFrame(values[1:], columns=values[0])
     logging.info(f"Vendor: {vendor_name}, Peptide: {peptide}")
@@ -11,6 +11,9 @@ from zoneinfo import ZoneInfo
 import requests
 from dotenv import load_dotenv
 
+from src import helpers_metrics
+from src import helpers_telegram_api
+
 INVITE_MARKER = "[tg-invite-rotation]"
 ## (INVITE_COUNT x INVITE_MEMBER_LIMIT) should stay under about 3000 per 24 hours to avoid triggering nuke
 INVITE_COUNT = 2
@@ -18,7 +21,6 @@ INVITE_MEMBER_LIMIT = 1000
 DISCORD_API_BASE = "https://discord.com/api/v10"
 INVITE_STATE_PATH = Path(os.getenv("INVITE_STATE_PATH", ".invite_rotation_state.json")).expanduser()
 
-_TELEGRAM_API_BASE: Optional[str] = None
 _INVITE_CHAT_ID: Optional[str] = None
 _rotation_thread: Optional[threading.Thread] = None
 
@@ -31,15 +33,13 @@ else:
     logging.info("No local env file found; relying on OS / Heroku env vars.")
 
 def _ensure_telegram_config():
-    """Lazy-load Telegram API base URL and invite target chat ID."""
-    global _TELEGRAM_API_BASE, _INVITE_CHAT_ID
-    if _TELEGRAM_API_BASE and _INVITE_CHAT_ID:
+    """Lazy-load the invite target chat ID (and check BOT_TOKEN is set for the shared client)."""
+    global _INVITE_CHAT_ID
+    if _INVITE_CHAT_ID:
         return
 
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
+    if not os.getenv("BOT_TOKEN"):
         raise RuntimeError("BOT_TOKEN must be set to rotate Telegram invite links")
-    _TELEGRAM_API_BASE = f"https://api.telegram.org/bot{bot_token}"
 
     telegram_config_json = os.getenv("TELEGRAM_CONFIG")
     if not telegram_config_json:
@@ -134,11 +134,7 @@ def create_invite_links(expire_seconds: int, count: int = 1, members_per_link: i
         }
 
         try:
-            response = requests.post(
-                f"{_TELEGRAM_API_BASE}/createChatInviteLink",
-                json=payload,
-                timeout=15,
-            )
+            response = helpers_telegram_api.get_client().call("createChatInviteLink", json=payload)
             data = response.json()
         except Exception as exc:
             logging.error("Error creating invite link %d/%d: %s", idx + 1, invite_count, exc)
@@ -169,10 +165,9 @@ def revoke_invite_links(invite_links: Iterable[Union[str, dict]]):
             continue
 
         try:
-            response = requests.post(
-                f"{_TELEGRAM_API_BASE}/revokeChatInviteLink",
+            response = helpers_telegram_api.get_client().call(
+                "revokeChatInviteLink",
                 json={"chat_id": _INVITE_CHAT_ID, "invite_link": invite_url},
-                timeout=15,
             )
             data = response.json()
             if response.ok and data.get("ok"):
@@ -193,12 +188,15 @@ def _discord_headers() -> dict:
 
 def _delete_previous_invite_messages(channel_id: str, marker: str):
     try:
-        response = requests.get(
-            f"{DISCORD_API_BASE}/channels/{channel_id}/messages",
-            params={"limit": 50},
-            headers=_discord_headers(),
-            timeout=15,
-        )
+        with helpers_metrics.dependency_call("discord", "messages.list") as call:
+            response = call.record(
+                requests.get(
+                    f"{DISCORD_API_BASE}/channels/{channel_id}/messages",
+                    params={"limit": 50},
+                    headers=_discord_headers(),
+                    timeout=15,
+                )
+            )
         response.raise_for_status()
         messages = response.json()
     except Exception as exc:
@@ -213,11 +211,14 @@ def _delete_previous_invite_messages(channel_id: str, marker: str):
         if not message_id:
             continue
         try:
-            delete_response = requests.delete(
-                f"{DISCORD_API_BASE}/channels/{channel_id}/messages/{message_id}",
-                headers=_discord_headers(),
-                timeout=15,
-            )
+            with helpers_metrics.dependency_call("discord", "messages.delete") as call:
+                delete_response = call.record(
+                    requests.delete(
+                        f"{DISCORD_API_BASE}/channels/{channel_id}/messages/{message_id}",
+                        headers=_discord_headers(),
+                        timeout=15,
+                    )
+                )
             if delete_response.status_code == 429:
                 logging.warning("Rate limited when deleting Discord invite message; stopping cleanup")
                 break
@@ -268,12 +269,15 @@ def post_invites_to_discord_root(invite_links: List[dict], marker: str = INVITE_
     logging.info("Posting invites to Discord: %s", invite_urls)
 
     try:
-        response = requests.post(
-            f"{DISCORD_API_BASE}/channels/{channel_id}/messages",
-            headers=_discord_headers(),
-            json={"content": content},
-            timeout=15,
-        )
+        with helpers_metrics.dependency_call("discord", "messages.create") as call:
+            response = call.record(
+                requests.post(
+                    f"{DISCORD_API_BASE}/channels/{channel_id}/messages",
+                    headers=_discord_headers(),
+                    json={"content": content},
+                    timeout=15,
+                )
+            )
         response.raise_for_status()
         logging.info("Posted %d new invite links to Discord root channel", len(invite_links))
     except Exception as exc:
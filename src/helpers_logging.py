@@ -0,0 +1,163 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+# Log categories passed as extra={"category": ...}; anything without one is always kept
+CATEGORY_RAW_UPDATE = "raw_update"
+CATEGORY_MESSAGE_BODY = "message_body"
+CATEGORY_MODEL_RESPONSE = "model_response"
+
+DEFAULT_SAMPLE_RATES = {
+    CATEGORY_RAW_UPDATE: 0.01,
+    CATEGORY_MESSAGE_BODY: 0.1,
+    CATEGORY_MODEL_RESPONSE: 1.0,
+}
+DEFAULT_MAX_CHARS = 2000
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_update_id: contextvars.ContextVar = contextvars.ContextVar("log_update_id", default=None)
+_chat_id: contextvars.ContextVar = contextvars.ContextVar("log_chat_id", default=None)
+_listener: Optional[QueueListener] = None
+
+
+def parse_sample_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse ``LOG_SAMPLE_RATES`` (``raw_update=0.01,model_response=0.5``) over the defaults."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (value or "").split(","):
+        if "=" not in item:
+            continue
+        category, rate = item.split("=", 1)
+        try:
+            rates[category.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class CorrelationFilter(logging.Filter):
+    """Stamp records with the update_id/chat_id of the update being handled."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = _update_id.get()
+        record.chat_id = _chat_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of records per category; warnings and errors are never dropped."""
+
+    def __init__(self, rates: Dict[str, float], rng: Optional[random.Random] = None):
+        super().__init__()
+        self.rates = rates
+        self._random = (rng or random.Random()).random
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        category = getattr(record, "category", None)
+        if category is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(category, 1.0)
+        return rate >= 1.0 or (rate > 0.0 and self._random() < rate)
+
+
+class TruncatingQueueHandler(QueueHandler):
+    """Format on the calling thread (cheap), truncate, and hand off to the listener thread."""
+
+    def __init__(self, log_queue, max_chars: int = DEFAULT_MAX_CHARS):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} chars]"
+        if record.exc_info:
+            # Tracebacks can't cross the queue as objects; render them here
+            message = f"{message}\n{logging.Formatter().formatException(record.exc_info)}"
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the correlation fields at the top level."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for field in ("update_id", "chat_id", "category"):
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+@contextmanager
+def log_context(update_id=None, chat_id=None):
+    """Attach update_id/chat_id to every record logged inside the block."""
+    update_token = _update_id.set(update_id)
+    chat_token = _chat_id.set(chat_id)
+    try:
+        yield
+    finally:
+        _update_id.reset(update_token)
+        _chat_id.reset(chat_token)
+
+
+def update_log_context(update: dict):
+    """log_context() for a Telegram update, taking chat_id from whichever payload it carries."""
+    chat_id = None
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get("chat"), dict):
+            chat_id = value["chat"].get("id")
+            break
+    return log_context(update.get("update_id"), chat_id)
+
+
+def configure_logging(level: int = logging.INFO):
+    """Route the root logger through a queue drained by a background listener thread.
+
+    Replaces any handlers installed by earlier ``basicConfig`` calls. Settings:
+    LOG_FORMAT (``text`` or ``json``), LOG_SAMPLE_RATES and LOG_MAX_CHARS.
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "text").strip().lower() == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+    queue_handler = TruncatingQueueHandler(log_queue, int(os.getenv("LOG_MAX_CHARS", DEFAULT_MAX_CHARS)))
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(os.getenv("LOG_SAMPLE_RATES"))))
+    queue_handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
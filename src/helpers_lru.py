@@ -0,0 +1,22 @@
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+
+class LRUDict(OrderedDict):
+    """OrderedDict that drops its least recently used keys beyond ``max_entries``."""
+
+    def __init__(self, max_entries: int):
+        super().__init__()
+        self.max_entries = max(1, int(max_entries))
+        self.evicted = 0
+
+    def touch(self, key: Hashable, factory: Callable[[], object]):
+        value = self.get(key)
+        if value is None:
+            value = self[key] = factory()
+            while len(self) > self.max_entries:
+                self.popitem(last=False)
+                self.evicted += 1
+        else:
+            self.move_to_end(key)
+        return value
@@ -0,0 +1,141 @@
+import os
+import shutil
+import threading
+import time
+from typing import Callable, Optional
+
+from src import helpers_telegram_api
+from src.helpers_lru import LRUDict
+
+# The Bot API refuses getFile downloads over 20 MB
+MEDIA_MAX_BYTES = int(os.getenv("TELEGRAM_MEDIA_MAX_BYTES", 20 * 1024 * 1024))
+# Telegram guarantees a file_path works for at least an hour; stop reusing it a little early
+FILE_PATH_TTL_SECONDS = 3300
+
+
+class FilePathCache:
+    """LRU of file_id -> getFile result, each entry dropped once its download link may have expired."""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = FILE_PATH_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = LRUDict(max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, file_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(file_id)
+            if entry is None or entry[0] <= self._clock():
+                self._entries.pop(file_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(file_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, file_id: str, info: dict):
+        with self._lock:
+            self._entries.pop(file_id, None)
+            self._entries.touch(file_id, lambda: (self._clock() + self.ttl_seconds, info))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+FILE_PATHS = FilePathCache(int(os.getenv("TELEGRAM_FILE_PATH_CACHE_SIZE", 512)))
+
+
+def resolve_file(client, file_id: str) -> dict:
+    """getFile ``file_id`` (``file_path``, ``file_size``), reusing a result that is still valid."""
+    info = FILE_PATHS.get(file_id)
+    if info is not None:
+        return info
+    data = client.call("getFile", params={"file_id": file_id}, http_method="GET").json()
+    if not data.get("ok"):
+        raise RuntimeError(f"getFile failed: {data.get('description', data)}")
+    info = data["result"]
+    FILE_PATHS.put(file_id, info)
+    return info
+
+
+class MediaFile:
+    """A photo or document from one update, resolved and downloaded at most once.
+
+    Every consumer of the update (test result extraction, the Discord bridge)
+    reads the same handle. The body is spooled: held in memory up to
+    helpers_telegram_api.SPOOL_MAX_MEMORY, on disk beyond that, and refused
+    past ``max_bytes``. Close the handle (or use it as a context manager)
+    once the update is handled.
+    """
+
+    def __init__(self, client, file_id: str, filename: str, file_size: Optional[int] = None, max_bytes: int = MEDIA_MAX_BYTES):
+        self.client = client
+        self.file_id = file_id
+        self.filename = filename
+        self.file_size = file_size
+        self.max_bytes = max_bytes
+        self._info: Optional[dict] = None
+        self._body = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def file_path(self) -> str:
+        with self._lock:
+            return self._resolve()["file_path"]
+
+    def _resolve(self) -> dict:
+        if self._info is None:
+            self._info = resolve_file(self.client, self.file_id)
+        return self._info
+
+    def _download(self):
+        if self._body is None:
+            if helpers_telegram_api.too_large(self.file_size or self._resolve().get("file_size"), self.max_bytes):
+                raise ValueError(f"{self.filename} is larger than the {self.max_bytes} byte download limit")
+            response = self.client.download(self._resolve()["file_path"], stream=True)
+            response.raise_for_status()
+            self._body = helpers_telegram_api.spool(response, self.max_bytes)
+        self._body.seek(0)
+        return self._body
+
+    def read(self) -> bytes:
+        with self._lock:
+            return self._download().read()
+
+    def save(self, path: str):
+        """Copy the body to ``path`` (for consumers that need a file on disk)."""
+        with self._lock:
+            body = self._download()
+            with open(path, "wb") as f:
+                shutil.copyfileobj(body, f)
+
+    def close(self):
+        with self._lock:
+            if self._body is not None:
+                self._body.close()
+                self._body = None
+
+
+def message_media(client, message: dict) -> Optional[MediaFile]:
+    """The largest photo size or the document attached to ``message``, if any."""
+    if "photo" in message:
+        photo = message["photo"][-1]
+        return MediaFile(client, photo["file_id"], "image.jpg", photo.get("file_size"))
+    if "document" in message:
+        document = message["document"]
+        return MediaFile(client, document["file_id"], document.get("file_name", "document"), document.get("file_size"))
+    return None
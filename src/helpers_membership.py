@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from src.helpers_lru import LRUDict
+
+# getChatMember statuses that count as being in the supergroup
+MEMBER_STATUSES = frozenset({"member", "administrator", "creator"})
+
+_cache: Optional["MembershipCache"] = None
+_cache_lock = threading.Lock()
+_counts: Optional["MemberCountCache"] = None
+_counts_lock = threading.Lock()
+
+
+class MembershipCache:
+    """Bounded cache of "is this user in the supergroup?" answers.
+
+    Members are remembered for ``positive_ttl`` seconds and non-members for
+    the shorter ``negative_ttl``, so someone who just joined isn't locked out
+    for long even if their join update was missed. chat_member updates
+    overwrite an entry the moment a join or leave is seen, and a lookup that
+    started before that update can't overwrite it with its older answer.
+    """
+
+    def __init__(
+        self,
+        positive_ttl: float = 600,
+        negative_ttl: float = 60,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries = LRUDict(max_entries)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.updates = 0
+
+    def now(self) -> float:
+        return self._clock()
+
+    def get(self, user_id) -> Optional[bool]:
+        """The cached answer for ``user_id``, or None if it must be looked up."""
+        key = str(user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id, is_member: bool, observed_at: Optional[float] = None):
+        """Cache an answer as of ``observed_at`` (default now), unless a newer one is already cached."""
+        key = str(user_id)
+        observed_at = self._clock() if observed_at is None else observed_at
+        expires_at = observed_at + (self.positive_ttl if is_member else self.negative_ttl)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > observed_at:
+                return
+            self._entries.pop(key, None)
+            self._entries.touch(key, lambda: (is_member, expires_at, observed_at))
+
+    def apply_status(self, user_id, status: Optional[str]):
+        """Record the membership change carried by a chat_member update."""
+        with self._lock:
+            self.updates += 1
+        self.put(user_id, status in MEMBER_STATUSES)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "updates": self.updates}
+
+
+def get_membership_cache() -> MembershipCache:
+    """Lazily build the process-wide cache from MEMBERSHIP_CACHE_* settings."""
+    global _cache
+    if _cache is not None:
+        return _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = MembershipCache(
+                positive_ttl=float(os.getenv("MEMBERSHIP_CACHE_TTL_SECONDS", 600)),
+                negative_ttl=float(os.getenv("MEMBERSHIP_CACHE_NEGATIVE_TTL_SECONDS", 60)),
+                max_entries=int(os.getenv("MEMBERSHIP_CACHE_MAX_ENTRIES", 10000)),
+            )
+    return _cache
+
+
+def counts_as_member(chat_member: Optional[dict]) -> bool:
+    """Whether getChatMemberCount counts this ChatMember (restricted users only while still in the chat)."""
+    if not chat_member:
+        return False
+    status = chat_member.get("status")
+    return status in MEMBER_STATUSES or (status == "restricted" and bool(chat_member.get("is_member")))
+
+
+class MemberCountCache:
+    """Per-chat member counts, seeded by one getChatMemberCount and then kept current from updates.
+
+    chat_member and my_chat_member updates adjust a seeded count by the
+    join or leave they carry. Telegram only sends those to admin bots and
+    an update can be missed, so counts are also re-fetched by
+    reconcile_stale() once they are ``reconcile_seconds`` old.
+    """
+
+    def __init__(self, reconcile_seconds: float = 3600, max_chats: int = 1000, clock: Callable[[], float] = time.monotonic):
+        self.reconcile_seconds = reconcile_seconds
+        self._clock = clock
+        self._counts = LRUDict(max_chats)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.seeds = 0
+        self.deltas = 0
+        self.drift = 0
+
+    def get(self, chat_id, fetch: Callable[[object], int]) -> int:
+        """The chat's member count, calling ``fetch(chat_id)`` only the first time a chat is seen."""
+        key = str(chat_id)
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is not None:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        count = fetch(chat_id)
+        with self._lock:
+            self.seeds += 1
+        self._store(key, count)
+        return count
+
+    def _store(self, key: str, count: int):
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                self._counts.touch(key, lambda: [count, self._clock()])
+            else:
+                self.drift += abs(entry[0] - count)
+                entry[0], entry[1] = count, self._clock()
+
+    def apply_update(self, chat_id, old_member: Optional[dict], new_member: Optional[dict]):
+        """Adjust a seeded count by the join or leave in a chat_member/my_chat_member update."""
+        delta = int(counts_as_member(new_member)) - int(counts_as_member(old_member))
+        if not delta:
+            return
+        with self._lock:
+            entry = self._counts.get(str(chat_id))
+            if entry is not None:
+                entry[0] = max(0, entry[0] + delta)
+                self.deltas += 1
+
+    def forget(self, chat_id):
+        with self._lock:
+            self._counts.pop(str(chat_id), None)
+
+    def reconcile_stale(self, fetch: Callable[[object], int]):
+        """Re-fetch every count older than ``reconcile_seconds``; drift found is added to ``drift``."""
+        cutoff = self._clock() - self.reconcile_seconds
+        with self._lock:
+            stale = [key for key, (_, seeded_at) in self._counts.items() if seeded_at <= cutoff]
+        for key in stale:
+            try:
+                self._store(key, fetch(key))
+            except Exception as exc:
+                logging.warning("Unable to reconcile member count for chat %s: %s", key, exc)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {key: entry[0] for key, entry in self._counts.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"chats": len(self._counts), "hits": self.hits, "seeds": self.seeds, "deltas": self.deltas, "drift": self.drift}
+
+
+def get_member_counts() -> MemberCountCache:
+    """Lazily build the process-wide member-count cache from MEMBER_COUNT_* settings."""
+    global _counts
+    if _counts is not None:
+        return _counts
+
+    with _counts_lock:
+        if _counts is None:
+            _counts = MemberCountCache(reconcile_seconds=float(os.getenv("MEMBER_COUNT_RECONCILE_SECONDS", 3600)))
+    return _counts
+
+
+def _reconcile_loop(fetch: Callable[[object], int], interval_seconds: float):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            get_member_counts().reconcile_stale(fetch)
+        except Exception as exc:
+            logging.error("Member count reconciler error: %s", exc)
+
+
+def start_member_count_reconciler(fetch: Callable[[object], int]) -> Optional[threading.Thread]:
+    """Re-fetch cached member counts once they are MEMBER_COUNT_RECONCILE_SECONDS old (<= 0 disables)."""
+    interval_seconds = get_member_counts().reconcile_seconds
+    if interval_seconds <= 0:
+        logging.info("MEMBER_COUNT_RECONCILE_SECONDS <= 0; member counts are only adjusted from updates")
+        return None
+    # Check a few times per interval so a count is never much older than the setting
+    thread = threading.Thread(
+        target=_reconcile_loop,
+        args=(fetch, max(1.0, interval_seconds / 4)),
+        daemon=True,
+        name="member-count-reconciler",
+    )
+    thread.start()
+    return thread
@@ -0,0 +1,223 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds in seconds; Telegram/OpenAI calls land in the upper half, regex in the lower
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+STAGE_SECONDS = "bot_stage_duration_seconds"
+STAGE_ERRORS = "bot_stage_errors_total"
+DEPENDENCY_SECONDS = "bot_dependency_duration_seconds"
+DEPENDENCY_REQUESTS = "bot_dependency_requests_total"
+DEPENDENCY_ERRORS = "bot_dependency_errors_total"
+DEPENDENCY_THROTTLED = "bot_dependency_throttled_total"
+DEPENDENCY_RETRIES = "bot_dependency_retries_total"
+OUTBOUND_WAIT_SECONDS = "bot_outbound_wait_seconds"
+
+METRIC_HELP = {
+    STAGE_SECONDS: "Time spent in each stage of update handling",
+    STAGE_ERRORS: "Exceptions raised out of a stage",
+    DEPENDENCY_SECONDS: "Latency of outbound calls by service and operation",
+    DEPENDENCY_REQUESTS: "Outbound calls by service and operation",
+    DEPENDENCY_ERRORS: "Outbound calls that raised or returned an error status",
+    DEPENDENCY_THROTTLED: "Outbound calls rejected with HTTP 429",
+    DEPENDENCY_RETRIES: "Outbound calls retried after a failure",
+    OUTBOUND_WAIT_SECONDS: "Time Telegram sends waited in the outbound scheduler, by priority lane",
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and three additions."""
+
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Iterable[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """In-process counters, histograms and callback gauges rendered as Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauge_sources: List[Callable[[], Iterable[Tuple[str, dict, float]]]] = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def register_gauges(self, source: Callable[[], Iterable[Tuple[str, dict, float]]]):
+        """Add a callback returning ``(name, labels, value)`` tuples, read at scrape time."""
+        self._gauge_sources.append(source)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        with self._lock:
+            return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (h.bounds, list(h.counts), h.total, h.count) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+
+        for name in sorted(counters):
+            _header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+
+        for name in sorted(histograms):
+            _header(lines, name, "histogram")
+            for key, (bounds, counts, total, count) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(bounds, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels(key, le=_number(bound))} {cumulative}")
+                lines.append(f'{name}_bucket{_labels(key, le="+Inf")} {count}')
+                lines.append(f"{name}_sum{_labels(key)} {_number(total)}")
+                lines.append(f"{name}_count{_labels(key)} {count}")
+
+        gauges: Dict[str, List[Tuple[LabelKey, float]]] = {}
+        for source in list(self._gauge_sources):
+            try:
+                for name, labels, value in source():
+                    gauges.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception:  # pragma: no cover - a broken source must not break the scrape
+                continue
+        for name in sorted(gauges):
+            _header(lines, name, "gauge")
+            for key, value in sorted(gauges[name]):
+                lines.append(f"{name}{_labels(key)} {_number(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _header(lines: List[str], name: str, metric_type: str):
+    if name in METRIC_HELP:
+        lines.append(f"# HELP {name} {METRIC_HELP[name]}")
+    lines.append(f"# TYPE {name} {metric_type}")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key: LabelKey, **extra) -> str:
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage of update handling (e.g. ``parse``, ``moderation``, ``extraction``)."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        REGISTRY.inc(STAGE_ERRORS, stage=stage)
+        raise
+    finally:
+        REGISTRY.observe(STAGE_SECONDS, time.perf_counter() - started, stage=stage)
+
+
+def _status_of(exc: BaseException) -> Optional[int]:
+    """Best-effort HTTP status from requests, openai and googleapiclient exceptions."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    if status is None:
+        status = getattr(getattr(exc, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DependencyCall:
+    """Handle yielded by dependency_call(); pass responses through record()."""
+
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status: Optional[int] = None
+
+    def record(self, response):
+        self.status = getattr(response, "status_code", None) or getattr(response, "status", None)
+        return response
+
+
+@contextmanager
+def dependency_call(service: str, operation: str):
+    """Time an outbound call and count it, along with errors and 429s."""
+    call = DependencyCall()
+    started = time.perf_counter()
+    failed = False
+    try:
+        yield call
+    except Exception as exc:
+        failed = True
+        if call.status is None:
+            call.status = _status_of(exc)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        REGISTRY.observe(DEPENDENCY_SECONDS, elapsed, service=service, operation=operation)
+        REGISTRY.inc(DEPENDENCY_REQUESTS, service=service, operation=operation)
+        status = call.status
+        if failed or (status is not None and status >= 400):
+            REGISTRY.inc(DEPENDENCY_ERRORS, service=service, operation=operation)
+        if status == 429:
+            REGISTRY.inc(DEPENDENCY_THROTTLED, service=service, operation=operation)
+
+
+def count_retry(service: str, operation: str):
+    REGISTRY.inc(DEPENDENCY_RETRIES, service=service, operation=operation)
+
+
+def register_gauges(source: Callable[[], Iterable[Tuple[str, dict, float]]]):
+    REGISTRY.register_gauges(source)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,841 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import deque
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Union
+
+import yaml
+
+from src import helpers_spam
+
+CATEGORY_AUTO_POOF = "auto_poof"
+CATEGORY_BANNED_TOPIC = "banned_topic"
+CATEGORY_NEWBIE_REPLY = "newbie_reply"
+CATEGORY_GROUP_TEST_LINK = "group_test_link"
+CATEGORY_DONT_LINK = "dont_link"
+
+LINK_RULE_BLOCK = "block"
+LINK_RULE_IGNORE = "ignore"
+
+# Files in mod_topics/ that make up the moderation config (and are watched for reloads)
+MODERATION_CONFIG_FILES = ("moderated_topics.yml", "dont_link.yml", "spam_control.yml")
+
+# msgs.banned_topic() expects this marker when a regex (not a substance) matched
+PATTERN_MATCH_TERM = "Pattern match"
+
+
+@dataclass(frozen=True)
+class RuleMatch:
+    """The first rule that fired for a message.
+
+    ``term`` is what the reply is built from: the matched auto-poof word,
+    the substance tuple, or ``PATTERN_MATCH_TERM`` for regex patterns.
+    """
+
+    category: str
+    topic: str
+    message: str
+    term: object
+
+
+@dataclass
+class AutoPoofTopic:
+    name: str
+    message: str
+    gate: Optional[Pattern]
+    terms: List[Tuple[str, Pattern]]
+
+    def check(self, ctx: "MessageContext") -> Optional[RuleMatch]:
+        normalized_text = ctx.nfkc
+        if self.gate is None or not self.gate.search(normalized_text):
+            return None
+        for word, rx in self.terms:
+            if rx.search(normalized_text):
+                return RuleMatch(CATEGORY_AUTO_POOF, self.name, self.message, word)
+        return None
+
+
+@dataclass
+class BannedTopic:
+    name: str
+    message: str
+    gate: Optional[Pattern]
+    substances: List[Tuple[object, Pattern]]
+    patterns: List[Pattern]
+
+    def check_substances(self, ctx: "MessageContext") -> Optional[RuleMatch]:
+        lowered = ctx.lowered
+        if self.gate is None or not self.gate.search(lowered):
+            return None
+        for tuple_topic, rx in self.substances:
+            if rx.search(lowered):
+                return RuleMatch(CATEGORY_BANNED_TOPIC, self.name, self.message, tuple_topic)
+        return None
+
+    def check_patterns(self, ctx: "MessageContext") -> Optional[RuleMatch]:
+        for rx in self.patterns:
+            if rx.search(ctx.content):
+                return RuleMatch(CATEGORY_BANNED_TOPIC, self.name, self.message, PATTERN_MATCH_TERM)
+        return None
+
+
+@dataclass
+class NewbieTopic:
+    name: str
+    message: str
+    patterns: List[Pattern]
+
+    def check(self, ctx: "MessageContext") -> Optional[RuleMatch]:
+        for rx in self.patterns:
+            if rx.search(ctx.content):
+                return RuleMatch(CATEGORY_NEWBIE_REPLY, self.name, self.message, rx.pattern)
+        return None
+
+
+RULE_KIND_TERMS = "terms"
+RULE_KIND_SUBSTANCES = "substances"
+RULE_KIND_PATTERNS = "patterns"
+
+# Rule evaluation time is sampled on one message in this many to keep the hot path cheap
+RULE_TIMING_SAMPLE_EVERY = 16
+
+
+@dataclass
+class RuleCheck:
+    """One independently evaluable rule within a tier, with live hit and cost counters.
+
+    Counters are updated without a lock from several worker threads, so they
+    are approximate; they only steer ordering and never change a result.
+    """
+
+    category: str
+    name: str
+    kind: str
+    index: int
+    check: Callable[["MessageContext"], Optional[RuleMatch]]
+    evaluations: int = 0
+    hits: int = 0
+    timed: int = 0
+    time_ns: int = 0
+
+    def mean_cost_ns(self) -> Optional[float]:
+        return self.time_ns / self.timed if self.timed else None
+
+    def stats(self) -> dict:
+        cost = self.mean_cost_ns()
+        return {
+            "rule": f"{self.name}:{self.kind}",
+            "yaml_index": self.index,
+            "evaluations": self.evaluations,
+            "hits": self.hits,
+            "hit_rate": self.hits / self.evaluations if self.evaluations else 0.0,
+            "mean_cost_us": round(cost / 1000, 3) if cost is not None else None,
+        }
+
+
+class RuleTier:
+    """Rules of one precedence tier, evaluated in an adaptive order with YAML-order results.
+
+    Whatever order the rules run in, the match returned is the one with the
+    lowest YAML index, exactly as a front-to-back scan would find. Once a
+    rule fires, rules that come after it in the YAML are skipped, so running
+    likely, cheap rules first cuts the work on messages that hit. Messages
+    that hit nothing still evaluate every rule.
+    """
+
+    def __init__(self, category: str, rules: List[RuleCheck]):
+        self.category = category
+        self.rules = rules
+        self.order: Tuple[RuleCheck, ...] = tuple(rules)
+        self.messages = 0
+        self.reorders = 0
+
+    def first_match(self, ctx: "MessageContext", skip_kinds: Tuple[str, ...] = ()) -> Optional[RuleMatch]:
+        self.messages += 1
+        timed = self.messages % RULE_TIMING_SAMPLE_EVERY == 0
+        best: Optional[RuleMatch] = None
+        best_index = len(self.rules)
+        for rule in self.order:
+            if rule.index > best_index or rule.kind in skip_kinds:
+                continue
+            rule.evaluations += 1
+            if timed:
+                started = time.perf_counter_ns()
+                match = rule.check(ctx)
+                rule.time_ns += time.perf_counter_ns() - started
+                rule.timed += 1
+            else:
+                match = rule.check(ctx)
+            if match is not None:
+                rule.hits += 1
+                best, best_index = match, rule.index
+                if best_index == 0:
+                    break
+        return best
+
+    def reorder(self, min_evaluations: int = 200) -> bool:
+        """Sort rules by expected hits per unit of cost; returns True if the order changed."""
+        if sum(rule.evaluations for rule in self.rules) < min_evaluations:
+            return False
+        costs = [rule.mean_cost_ns() for rule in self.rules if rule.mean_cost_ns()]
+        default_cost = sorted(costs)[len(costs) // 2] if costs else 1.0
+
+        def score(rule: RuleCheck) -> float:
+            # Laplace-smoothed hit rate so unseen rules are neither favoured nor buried
+            hit_rate = (rule.hits + 1) / (rule.evaluations + 2)
+            return hit_rate / (rule.mean_cost_ns() or default_cost)
+
+        new_order = tuple(sorted(self.rules, key=lambda rule: (-score(rule), rule.index)))
+        if new_order == self.order:
+            return False
+        self.order = new_order
+        self.reorders += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "messages": self.messages,
+            "reorders": self.reorders,
+            "order": [f"{rule.name}:{rule.kind}" for rule in self.order],
+            "rules": [rule.stats() for rule in self.rules],
+        }
+
+
+def _words_regex(words: Iterable[str], flags: int = 0) -> Optional[Pattern]:
+    """One ``\\b(?:a|b|...)\\b`` alternation; matches iff any ``\\bword\\b`` would."""
+    unique = sorted(set(words), key=len, reverse=True)
+    if not unique:
+        return None
+    alternation = "|".join(re.escape(word) for word in unique)
+    return re.compile(rf"\b(?:{alternation})\b", flags)
+
+
+def _compile_patterns(patterns, flags: int, where: str, strict: bool) -> List[Pattern]:
+    compiled = []
+    for rx in patterns or []:
+        try:
+            compiled.append(re.compile(rx, flags))
+        except re.error as e:
+            if strict:
+                raise ValueError(f"Invalid regex in {where} '{rx}': {e}") from e
+            logging.error(f"Invalid regex in {where} '{rx}': {e}")
+    return compiled
+
+
+class MessageContext:
+    """Features of one message that moderation rules read, each derived at most once.
+
+    ``content`` is the message text, which is all the term, topic and newbie
+    rules read; a media caption is never matched against them, so a
+    test-result upload captioned "test e" still reaches extraction. URLs come
+    from the ``url``/``text_link`` entities of the text and the caption plus a
+    scan of both, so links Telegram didn't mark up are still seen.
+    """
+
+    def __init__(
+        self,
+        content: str = "",
+        entities: Iterable[dict] = (),
+        message_thread_id=None,
+        username: Optional[str] = None,
+        user_id=None,
+        mod_accounts: Iterable[str] = (),
+        caption: str = "",
+        caption_entities: Iterable[dict] = (),
+    ):
+        self.content = content or ""
+        self.entities = list(entities or [])
+        self.caption = caption or ""
+        self.caption_entities = list(caption_entities or [])
+        self.thread = str(message_thread_id)
+        self.username = username
+        self.user_id = user_id
+        self._mod_accounts = mod_accounts
+
+    @classmethod
+    def from_message(cls, message: dict, mod_accounts: Iterable[str] = ()) -> "MessageContext":
+        sender = message.get("from") or {}
+        return cls(
+            (message.get("text") or "").strip(),
+            message.get("entities"),
+            message_thread_id=message.get("message_thread_id"),
+            username=sender.get("username"),
+            user_id=sender.get("id"),
+            mod_accounts=mod_accounts,
+            caption=message.get("caption"),
+            caption_entities=message.get("caption_entities"),
+        )
+
+    @cached_property
+    def nfkc(self) -> str:
+        return unicodedata.normalize("NFKC", self.content)
+
+    @cached_property
+    def lowered(self) -> str:
+        return self.content.lower()
+
+    @cached_property
+    def casefolded(self) -> str:
+        # What the spam wave detector indexes, so re-cased and full-width copies still match
+        return self.nfkc.casefold()
+
+    @cached_property
+    def _utf16(self) -> bytes:
+        return self.content.encode("utf-16-le")
+
+    @cached_property
+    def _caption_utf16(self) -> bytes:
+        return self.caption.encode("utf-16-le")
+
+    def entity_text(self, entity: dict, caption: bool = False) -> str:
+        """The slice an entity covers; Telegram offsets count UTF-16 code units."""
+        start = int(entity.get("offset", 0)) * 2
+        end = start + int(entity.get("length", 0)) * 2
+        utf16 = self._caption_utf16 if caption else self._utf16
+        return utf16[start:end].decode("utf-16-le", errors="ignore")
+
+    @cached_property
+    def urls(self) -> Tuple[str, ...]:
+        found: List[str] = []
+        for entities, caption in ((self.entities, False), (self.caption_entities, True)):
+            for entity in entities:
+                if entity.get("type") == "text_link" and entity.get("url"):
+                    found.append(entity["url"])
+                elif entity.get("type") == "url":
+                    found.append(self.entity_text(entity, caption))
+        found.extend(extract_urls(self.content))
+        if self.caption:
+            found.extend(extract_urls(self.caption))
+        return tuple(dict.fromkeys(url for url in found if url))
+
+    @cached_property
+    def is_mod(self) -> bool:
+        return self.username in self._mod_accounts
+
+
+def as_context(message: Union[str, MessageContext]) -> MessageContext:
+    return message if isinstance(message, MessageContext) else MessageContext(message)
+
+
+@dataclass
+class ModerationRuleset:
+    """Moderation rules from moderated_topics.yml, compiled once.
+
+    Each category has a single merged regex over all of its literal terms.
+    Messages that miss it (the common case) cost one regex pass; a hit is
+    resolved against the per-topic rules in YAML order so the reply is the
+    same one the original nested loops produced.
+    """
+
+    auto_poof_topics: List[AutoPoofTopic] = field(default_factory=list)
+    banned_topics: List[BannedTopic] = field(default_factory=list)
+    newbie_topics: List[NewbieTopic] = field(default_factory=list)
+    auto_poof_gate: Optional[Pattern] = None
+    banned_gate: Optional[Pattern] = None
+    tiers: Dict[str, RuleTier] = field(default_factory=dict)
+
+    def build_tiers(self):
+        """Flatten topics into per-category tiers; a rule's index is its position in the YAML scan."""
+        poof_rules = [
+            RuleCheck(CATEGORY_AUTO_POOF, topic.name, RULE_KIND_TERMS, idx, topic.check)
+            for idx, topic in enumerate(self.auto_poof_topics)
+        ]
+        banned_rules = []
+        for topic in self.banned_topics:
+            for kind, check in ((RULE_KIND_SUBSTANCES, topic.check_substances), (RULE_KIND_PATTERNS, topic.check_patterns)):
+                banned_rules.append(RuleCheck(CATEGORY_BANNED_TOPIC, topic.name, kind, len(banned_rules), check))
+        newbie_rules = [
+            RuleCheck(CATEGORY_NEWBIE_REPLY, topic.name, RULE_KIND_PATTERNS, idx, topic.check)
+            for idx, topic in enumerate(self.newbie_topics)
+        ]
+        self.tiers = {
+            CATEGORY_AUTO_POOF: RuleTier(CATEGORY_AUTO_POOF, poof_rules),
+            CATEGORY_BANNED_TOPIC: RuleTier(CATEGORY_BANNED_TOPIC, banned_rules),
+            CATEGORY_NEWBIE_REPLY: RuleTier(CATEGORY_NEWBIE_REPLY, newbie_rules),
+        }
+
+    def match_auto_poof(self, message: Union[str, MessageContext]) -> Optional[RuleMatch]:
+        """Whole-word, case-insensitive poof terms over NFKC-normalized text."""
+        ctx = as_context(message)
+        if self.auto_poof_gate is None or not self.auto_poof_gate.search(ctx.nfkc):
+            return None
+        return self.tiers[CATEGORY_AUTO_POOF].first_match(ctx)
+
+    def match_banned(self, message: Union[str, MessageContext]) -> Optional[RuleMatch]:
+        """Banned substances (whole word on lowercased text), then each topic's regex patterns."""
+        ctx = as_context(message)
+        substance_hit = self.banned_gate is not None and self.banned_gate.search(ctx.lowered) is not None
+        skip_kinds = () if substance_hit else (RULE_KIND_SUBSTANCES,)
+        return self.tiers[CATEGORY_BANNED_TOPIC].first_match(ctx, skip_kinds)
+
+    def match_newbie(self, message: Union[str, MessageContext]) -> Optional[RuleMatch]:
+        return self.tiers[CATEGORY_NEWBIE_REPLY].first_match(as_context(message))
+
+    def reorder(self, min_evaluations: int = 200) -> List[str]:
+        """Re-rank every tier from its live stats; returns the categories whose order changed."""
+        return [category for category, tier in self.tiers.items() if tier.reorder(min_evaluations)]
+
+    def rule_stats(self) -> dict:
+        return {category: tier.stats() for category, tier in self.tiers.items()}
+
+    def rule_counts(self) -> dict:
+        return {
+            CATEGORY_AUTO_POOF: sum(len(t.terms) for t in self.auto_poof_topics),
+            CATEGORY_BANNED_TOPIC: sum(len(t.substances) + len(t.patterns) for t in self.banned_topics),
+            CATEGORY_NEWBIE_REPLY: sum(len(t.patterns) for t in self.newbie_topics),
+        }
+
+
+def compile_ruleset(mod_topics_data: dict, strict: bool = False) -> ModerationRuleset:
+    """Build a ModerationRuleset from the parsed moderated_topics.yml.
+
+    With ``strict=False`` invalid regexes are logged and skipped (as the
+    webhook always did); with ``strict=True`` they raise ValueError.
+    """
+    mod_topics_data = mod_topics_data or {}
+    ruleset = ModerationRuleset()
+
+    all_poof_words: List[str] = []
+    for name, data in (mod_topics_data.get('Auto_Poof_Topics') or {}).items():
+        words = [str(word) for word in data.get('patterns') or []]
+        terms = [(word, re.compile(rf"\b{re.escape(word)}\b", re.IGNORECASE)) for word in words]
+        ruleset.auto_poof_topics.append(
+            AutoPoofTopic(name, data.get('message'), _words_regex(words, re.IGNORECASE), terms)
+        )
+        all_poof_words.extend(words)
+    ruleset.auto_poof_gate = _words_regex(all_poof_words, re.IGNORECASE)
+
+    all_substances: List[str] = []
+    for name, data in (mod_topics_data.get('Banned_Topics') or {}).items():
+        substances = []
+        topic_words: List[str] = []
+        for tuple_topic in data.get('substances') or []:
+            if isinstance(tuple_topic, str):
+                tuple_topic = [tuple_topic]
+            words = [str(word).lower() for word in tuple_topic]
+            rx = _words_regex(words)
+            if rx is not None:
+                substances.append((tuple_topic, rx))
+                topic_words.extend(words)
+        patterns = _compile_patterns(
+            data.get('patterns'), re.IGNORECASE | re.DOTALL, f"banned pattern for {name}", strict
+        )
+        ruleset.banned_topics.append(
+            BannedTopic(name, data.get('message'), _words_regex(topic_words), substances, patterns)
+        )
+        all_substances.extend(topic_words)
+    ruleset.banned_gate = _words_regex(all_substances)
+
+    for name, data in (mod_topics_data.get('Newbies_Auto_Reply') or {}).items():
+        patterns = _compile_patterns(data.get('patterns'), 0, f"newbie pattern for {name}", strict)
+        ruleset.newbie_topics.append(NewbieTopic(name, data.get('message'), patterns))
+
+    ruleset.build_tiers()
+    return ruleset
+
+
+### LINK / DOMAIN MATCHING ###
+
+# Bare or schemed URLs: optional scheme, dotted host with a 2+ letter TLD, optional port and path
+URL_PATTERN = re.compile(
+    r"(?:https?://)?(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}(?::\d+)?(?:[/?#][^\s<>\"']*)?",
+    re.IGNORECASE,
+)
+_TRAILING_PUNCTUATION = ".,;:!?)]}>'\""
+
+
+class AhoCorasick:
+    """Minimal Aho-Corasick automaton: finds every keyword occurrence in one pass."""
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(keywords)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+        for idx, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(idx)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int]]:
+        """Yield ``(start, keyword_index)`` for every occurrence in ``text``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for pos, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for idx in out[state]:
+                yield pos - len(self.keywords[idx]) + 1, idx
+
+
+def normalize_url(url: str) -> Optional[Tuple[str, str]]:
+    """Split a URL into a lowercased ``(host, path)`` without scheme, ``www.`` or port."""
+    url = url.strip().rstrip(_TRAILING_PUNCTUATION).lower()
+    url = re.sub(r"^[a-z][a-z0-9+.-]*://", "", url)
+    split_at = min((url.find(ch) for ch in "/?#" if ch in url), default=len(url))
+    host, path = url[:split_at], url[split_at:]
+    host = host.rsplit("@", 1)[-1].split(":", 1)[0].rstrip(".")
+    while host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return None
+    return host, path
+
+
+def extract_urls(text: str) -> List[str]:
+    return [m.group(0).rstrip(_TRAILING_PUNCTUATION) for m in URL_PATTERN.finditer(text or "")]
+
+
+@dataclass(frozen=True)
+class LinkRule:
+    rule: str
+    kind: str
+    host: str
+    path: str
+    wildcard: bool
+
+
+@dataclass(frozen=True)
+class LinkMatch:
+    """A URL in the message and the dont_link.yml rule it hit."""
+
+    category: str
+    rule: str
+    kind: str
+    url: str
+
+
+class DomainMatcher:
+    """Blocked and ignored URL prefixes from dont_link.yml in a single automaton.
+
+    Rules are ``host[/path-prefix]``; a leading ``*.`` also matches any
+    subdomain. Matching is case-insensitive and ignores ``http(s)://`` and
+    ``www.``. An ignored rule takes precedence over a blocked one for the
+    same URL.
+    """
+
+    def __init__(self, domain_urls: Iterable[str], ignore_urls: Iterable[str]):
+        self.rules: List[LinkRule] = []
+        for kind, entries in ((LINK_RULE_IGNORE, ignore_urls), (LINK_RULE_BLOCK, domain_urls)):
+            for entry in entries or []:
+                entry = str(entry).strip()
+                wildcard = entry.startswith("*.")
+                normalized = normalize_url(entry[2:] if wildcard else entry)
+                if normalized is None:
+                    logging.warning(f"Skipping empty link rule: {entry!r}")
+                    continue
+                host, path = normalized
+                self.rules.append(LinkRule(entry, kind, host, path, wildcard))
+        # Every key starts with "." so wildcard rules only match on a label boundary
+        self._automaton = AhoCorasick("." + rule.host + rule.path for rule in self.rules)
+
+    def _url_matches(self, host: str, path: str) -> List[LinkRule]:
+        host_end = len(host) + 1
+        hits = []
+        for start, idx in self._automaton.iter_matches("." + host + path):
+            rule = self.rules[idx]
+            rule_host_end = start + len(rule.host) + 1
+            if rule_host_end != host_end:
+                continue
+            if start != 0 and not rule.wildcard:
+                continue
+            hits.append(rule)
+        return hits
+
+    def matches(self, urls: Iterable[str]) -> List[LinkMatch]:
+        """Every (url, rule) hit, ignored rules included."""
+        found = []
+        for url in urls:
+            normalized = normalize_url(url)
+            if normalized is None:
+                continue
+            for rule in self._url_matches(*normalized):
+                found.append(LinkMatch(CATEGORY_DONT_LINK, rule.rule, rule.kind, url))
+        return found
+
+    def first_blocked(self, urls: Iterable[str]) -> Optional[LinkMatch]:
+        """The first URL that hits a blocked rule and no ignored rule."""
+        for url in urls:
+            normalized = normalize_url(url)
+            if normalized is None:
+                continue
+            hits = self._url_matches(*normalized)
+            if any(rule.kind == LINK_RULE_IGNORE for rule in hits):
+                continue
+            blocked = [rule for rule in hits if rule.kind == LINK_RULE_BLOCK]
+            if blocked:
+                first = min(blocked, key=self.rules.index)
+                return LinkMatch(CATEGORY_DONT_LINK, first.rule, first.kind, url)
+        return None
+
+    def match_text(self, text: str) -> Optional[LinkMatch]:
+        return self.first_blocked(extract_urls(text))
+
+    def match_context(self, ctx: MessageContext) -> Optional[LinkMatch]:
+        return self.first_blocked(ctx.urls)
+
+    def rule_counts(self) -> dict:
+        return {
+            LINK_RULE_BLOCK: sum(1 for rule in self.rules if rule.kind == LINK_RULE_BLOCK),
+            LINK_RULE_IGNORE: sum(1 for rule in self.rules if rule.kind == LINK_RULE_IGNORE),
+        }
+
+
+def compile_link_rules(domain_urls: Iterable[str], ignore_urls: Iterable[str]) -> DomainMatcher:
+    return DomainMatcher(domain_urls, ignore_urls)
+
+
+### MODERATION CHAIN ###
+
+@dataclass(frozen=True)
+class ModerationPolicy:
+    """Which channels and accounts each moderation step applies to (from TELEGRAM_CONFIG)."""
+
+    newbie_channel: str
+    group_test_channel: str
+    ignore_automod_channels: frozenset = frozenset()
+    mod_accounts: frozenset = frozenset()
+
+
+def moderate_message(
+    config: "ModerationConfig",
+    policy: ModerationPolicy,
+    ctx: MessageContext,
+    skip_links: bool = False,
+):
+    """Run the webhook's moderation chain and return the first match (or None).
+
+    Order: auto-poof terms, banned topics, newbie auto-replies, then (unless
+    ``skip_links``, used for test-result uploads) t.me links in the group test
+    channel and dont_link.yml domains. The caller acts on ``match.category``.
+    """
+    ### AUTO POOF MESSAGES WITH SPECIFIC TERMS ###
+    if ctx.thread not in policy.ignore_automod_channels and not ctx.is_mod:
+        match = config.rules.match_auto_poof(ctx)
+        if match:
+            return match
+
+    ### BANNED TOPICS (substances, then regex patterns per topic) ###
+    match = config.rules.match_banned(ctx)
+    if match:
+        return match
+
+    ### SPECIFIC QUESTIONS IN NEWBIES CHANNEL ###
+    if ctx.thread == policy.newbie_channel and not ctx.is_mod:
+        match = config.rules.match_newbie(ctx)
+        if match:
+            return match
+
+    if skip_links or ctx.is_mod:
+        return None
+
+    ### LINKED COMMUNITIES ###
+    if ctx.thread == policy.group_test_channel and any("t.me/" in url for url in (ctx.content, *ctx.urls)):
+        return RuleMatch(CATEGORY_GROUP_TEST_LINK, "t.me", None, "t.me/")
+    return config.links.match_context(ctx)
+
+
+def check_spam_wave(
+    config: "ModerationConfig",
+    policy: ModerationPolicy,
+    ctx: MessageContext,
+    detector: helpers_spam.SpamWaveDetector,
+    chat_id,
+    message_id,
+) -> Optional[helpers_spam.WaveVerdict]:
+    """Index the message for near-duplicate detection; returns a WaveVerdict if it's part of a spam wave.
+
+    Mods, threads exempt from automod and disabled waves (``wave_limits`` is
+    None) are never indexed, and neither is the group test channel, where
+    members post the same group-buy template on purpose.
+    """
+    if (
+        config.wave_limits is None
+        or ctx.is_mod
+        or ctx.thread in policy.ignore_automod_channels
+        or ctx.thread == policy.group_test_channel
+    ):
+        return None
+    return detector.observe(ctx.casefolded, ctx.user_id, chat_id, message_id)
+
+
+### LOADING & HOT RELOAD ###
+
+@dataclass(frozen=True)
+class ModerationConfig:
+    """Everything the webhook moderates with, swapped as one reference on reload."""
+
+    mod_topics_data: dict
+    dont_link_data: dict
+    rules: ModerationRuleset
+    links: DomainMatcher
+    fingerprint: str
+    flood_limits: helpers_spam.FloodLimits = helpers_spam.FloodLimits()
+    wave_limits: Optional[helpers_spam.WaveLimits] = helpers_spam.WaveLimits()
+
+    def rule_counts(self) -> dict:
+        return {**self.rules.rule_counts(), **self.links.rule_counts()}
+
+
+def config_fingerprint(directory: str) -> str:
+    """Content hash of the moderation config files."""
+    digest = hashlib.sha256()
+    for name in MODERATION_CONFIG_FILES:
+        digest.update(name.encode())
+        try:
+            with open(os.path.join(directory, name), "rb") as file:
+                digest.update(file.read())
+        except FileNotFoundError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def _load_yaml_mapping(path: str) -> dict:
+    with open(path, "r") as file:
+        data = yaml.safe_load(file)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{path} must contain a non-empty YAML mapping")
+    return data
+
+
+def load_moderation_config(directory: str, strict: bool = False) -> ModerationConfig:
+    """Read and compile mod_topics/. Raises on unreadable YAML (and, if strict, invalid regexes)."""
+    fingerprint = config_fingerprint(directory)
+    mod_topics_data = _load_yaml_mapping(os.path.join(directory, "moderated_topics.yml"))
+    dont_link_data = _load_yaml_mapping(os.path.join(directory, "dont_link.yml"))
+
+    # spam_control.yml is optional; without it flood control runs on the FloodLimits defaults
+    spam_control_path = os.path.join(directory, "spam_control.yml")
+    spam_control_data = _load_yaml_mapping(spam_control_path) if os.path.exists(spam_control_path) else {}
+
+    rules = compile_ruleset(mod_topics_data, strict=strict)
+    links = compile_link_rules(dont_link_data.get('domain_urls', []), dont_link_data.get('ignore_urls', []))
+    flood_limits = helpers_spam.parse_flood_limits(spam_control_data)
+    wave_limits = helpers_spam.parse_wave_limits(spam_control_data)
+    return ModerationConfig(mod_topics_data, dont_link_data, rules, links, fingerprint, flood_limits, wave_limits)
+
+
+def _file_signature(directory: str) -> tuple:
+    signature = []
+    for name in MODERATION_CONFIG_FILES:
+        try:
+            stat = os.stat(os.path.join(directory, name))
+            signature.append((name, stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append((name, None, None))
+    return tuple(signature)
+
+
+def _watch_config(directory: str, fingerprint: str, on_change: Callable[[], bool], interval_seconds: float):
+    signature = _file_signature(directory)
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            current_signature = _file_signature(directory)
+            if current_signature == signature:
+                continue
+            signature = current_signature
+
+            # mtime alone changes on a touch or a git checkout; only reload on new content
+            current_fingerprint = config_fingerprint(directory)
+            if current_fingerprint == fingerprint:
+                continue
+
+            logging.info("Moderation config changed in %s; reloading", directory)
+            if on_change():
+                fingerprint = current_fingerprint
+        except Exception as exc:
+            logging.error("Moderation config watcher error: %s", exc)
+
+
+def start_config_watcher(
+    directory: str,
+    fingerprint: str,
+    on_change: Callable[[], bool],
+    interval_seconds: Optional[float] = None,
+) -> Optional[threading.Thread]:
+    """Poll mod_topics/ and call ``on_change`` when its content changes.
+
+    ``on_change`` returns True once the new config is live; on False the
+    watcher keeps the old fingerprint and retries on the next edit.
+    """
+    if interval_seconds is None:
+        interval_seconds = float(os.getenv("MOD_TOPICS_RELOAD_SECONDS", 30))
+    if interval_seconds <= 0:
+        logging.info("MOD_TOPICS_RELOAD_SECONDS <= 0; moderation config hot reload disabled")
+        return None
+
+    logging.info("Watching %s for moderation config changes every %ss", directory, interval_seconds)
+    thread = threading.Thread(
+        target=_watch_config,
+        args=(directory, fingerprint, on_change, interval_seconds),
+        daemon=True,
+        name="mod-topics-watcher",
+    )
+    thread.start()
+    return thread
+
+
+def _optimize_loop(get_config: Callable[[], "ModerationConfig"], interval_seconds: float, min_evaluations: int):
+    while True:
+        time.sleep(interval_seconds)
+        try:
+            rules = get_config().rules
+            changed = rules.reorder(min_evaluations)
+            for category in changed:
+                logging.info("Reordered %s rules: %s", category, rules.tiers[category].stats()["order"])
+        except Exception as exc:
+            logging.error("Moderation rule optimizer error: %s", exc)
+
+
+def start_rule_optimizer(
+    get_config: Callable[[], "ModerationConfig"],
+    interval_seconds: Optional[float] = None,
+) -> Optional[threading.Thread]:
+    """Periodically re-rank rules within each tier from their hit-rate and cost counters.
+
+    ``get_config`` is called on every pass so a hot-reloaded ruleset (which
+    starts with fresh counters in YAML order) is picked up.
+    """
+    if interval_seconds is None:
+        interval_seconds = float(os.getenv("MODERATION_REORDER_SECONDS", 300))
+    if interval_seconds <= 0:
+        logging.info("MODERATION_REORDER_SECONDS <= 0; moderation rules keep their YAML order")
+        return None
+
+    min_evaluations = int(os.getenv("MODERATION_REORDER_MIN_EVALUATIONS", 200))
+    thread = threading.Thread(
+        target=_optimize_loop,
+        args=(get_config, interval_seconds, min_evaluations),
+        daemon=True,
+        name="mod-rule-optimizer",
+    )
+    thread.start()
+    return thread
@@ -1,4 +1,5 @@
 import base64
+import hashlib
 import os
 import sys
 import json
@@ -11,6 +12,9 @@ from openai import OpenAI
 from pydantic import BaseModel, Field
 
 import bot
+from src import helpers_metrics
+from src import helpers_logging
+from src import helpers_extraction_cache
 
 # Setup basic logging configuration
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stdout)
@@ -19,6 +23,18 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 MODEL_ID = "gpt-4.1-mini"
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 VENDOR_CONFIG_PATH = os.path.join(BASE_DIR, "mod_topics", "vendor_disambiguations.yml")
+# Bump when extraction behaviour changes without the prompt text changing, to retire cached extractions
+PROMPT_VERSION = "1"
+SYSTEM_PROMPT = """You are a data extraction engine.\
+                Your task:
+                - Read text from the provided image (and optional caption text).
+                - Extract values exactly as defined by the schema.
+                - Output ONLY valid JSON that matches the schema.
+                - Never explain, apologize, or include extra text.
+
+                If the image does not contain mass, purity, TFA, or endotoxin test results,
+                output exactly: Unsupported Test
+                """
 
 
 def load_vendor_disambiguations() -> dict:
@@ -69,8 +85,17 @@ def extract_data_with_openai(file_path, text, model_id=MODEL_ID):
     Returns:
         list: A list containing extracted data (e.g., mass and purity).
     """
-    client = OpenAI(api_key=bot.OPENAI_TOKEN)
+    return extract_test_results(file_path, text, model_id).results
+
+
+def extract_test_results(file_path, text, model_id=MODEL_ID):
+    """
+    Like extract_data_with_openai, but returns a helpers_extraction_cache.Extraction.
 
+    An image already extracted with the same model and prompt is answered from
+    the extraction cache without calling OpenAI. Callers record the rows with
+    create_messages.record_test_results, which skips cache hits.
+    """
     vendor_disambiguations = load_vendor_disambiguations()
 
     # Create the schema
@@ -94,6 +119,18 @@ def extract_data_with_openai(file_path, text, model_id=MODEL_ID):
         test_key: str = Field(alias="test_key", description="If present, extract the Verification Key or Unique Key. If no Key is present use NA. Janoshik puts their Key at the bottom of the image in a gray rectangle. Peptide Test puts their Verification Key at the top right of the image. Chromate puts their Access Code at the bottom right of the image.")
 
 
+    # Reposts of the same image (however captioned) share one extraction
+    cache = helpers_extraction_cache.get_extraction_cache()
+    key = helpers_extraction_cache.extraction_key(
+        helpers_extraction_cache.image_digest(file_path), model_id, prompt_fingerprint(TestResult)
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        test_results = [TestResult(**result) for result in cached]
+        return helpers_extraction_cache.Extraction(test_results or None, key, cached=True)
+
+    client = OpenAI(api_key=bot.OPENAI_TOKEN)
+
     # if the uploaded doc is a pdf, first convert to image
     if file_path.endswith('.pdf') or file_path.endswith('.PDF'):
         file_path = convert_first_page_to_image(file_path)
@@ -104,41 +141,33 @@ def extract_data_with_openai(file_path, text, model_id=MODEL_ID):
     instructions = generate_parser_instructions(TestResult, text)
 
     # Send image and instructions to openai gpt model
-    response = client.chat.completions.create(
-        model=model_id,
-        max_completion_tokens=1000,
-        temperature=0,
-        messages=[
-            {"role": "system", "content": """You are a data extraction engine.\
-                Your task:
-                - Read text from the provided image (and optional caption text).
-                - Extract values exactly as defined by the schema.
-                - Output ONLY valid JSON that matches the schema.
-                - Never explain, apologize, or include extra text.
-
-                If the image does not contain mass, purity, TFA, or endotoxin test results,
-                output exactly: Unsupported Test
-                """},
-            {
-                "role": "user",
-                "content": [
-                    {
-                    "type": "text",
-                    "text": instructions,
-                    },
-                    {
-                    "type": "image_url",
-                    "image_url": {
-                        "url":  f"data:image/jpeg;base64,{base64_image}"
+    with helpers_metrics.dependency_call("openai", "chat.completions"):
+        response = client.chat.completions.create(
+            model=model_id,
+            max_completion_tokens=1000,
+            temperature=0,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                        "type": "text",
+                        "text": instructions,
                         },
-                    },
-                ]
-            }
-        ]
-    )
+                        {
+                        "type": "image_url",
+                        "image_url": {
+                            "url":  f"data:image/jpeg;base64,{base64_image}"
+                            },
+                        },
+                    ]
+                }
+            ]
+        )
     # Extract the message content, which should be a JSON string wrapped in markdown
     json_response = response.choices[0].message.content
-    logging.info(f"model response: {json_response}")
+    logging.info("model response: %s", json_response, extra={"category": helpers_logging.CATEGORY_MODEL_RESPONSE})
     
     if "Unsupported Test" not in json_response:
         # Try to extract JSON from a ```json ... ``` block
@@ -162,12 +191,22 @@ def extract_data_with_openai(file_path, text, model_id=MODEL_ID):
 
         # Convert each JSON object into a TestResult instance
         test_results = [TestResult(**result) for result in parsed_json]
-        return test_results
+        # A concurrent extraction of the same image may have landed first; use its rows
+        stored = cache.put_if_complete(key, [result.model_dump(by_alias=True) for result in test_results])
+        test_results = [TestResult(**result) for result in stored]
+        return helpers_extraction_cache.Extraction(test_results, key)
     
     else:
-        return None
+        # Not cached, so a repost with a more helpful caption is tried again
+        return helpers_extraction_cache.Extraction(None, key)
     
 
+def prompt_fingerprint(schema):
+    """Short hash of everything in the prompt except the caption, so prompt or schema edits miss the cache."""
+    prompt = PROMPT_VERSION + SYSTEM_PROMPT + generate_parser_instructions(schema, "")
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+
+
 def generate_parser_instructions(schema, text):
     instructions = f"""\
         EXTRACT STRUCTURED DATA FROM THE IMAGE.
@@ -0,0 +1,310 @@
+import bisect
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from src import helpers_metrics
+from src import helpers_workers
+from src.helpers_lru import LRUDict
+
+# Lanes in priority order: scam deletes and warnings, then replies, then everything that can wait
+LANE_MODERATION = "moderation"
+LANE_REPLY = "reply"
+LANE_BULK = "bulk"
+LANES = (LANE_MODERATION, LANE_REPLY, LANE_BULK)
+LANE_PRIORITY = {lane: priority for priority, lane in enumerate(LANES)}
+
+# Methods that post into a chat count against its per-chat limit; other writes only the global one
+CHAT_SEND_METHODS = frozenset({"sendMessage", "sendPhoto", "sendDocument", "sendAnimation", "sendMediaGroup"})
+DEFAULT_LANES = {
+    "deleteMessage": LANE_MODERATION,
+    "restrictChatMember": LANE_MODERATION,
+    "sendMessage": LANE_REPLY,
+    "pinChatMessage": LANE_REPLY,
+}
+SCHEDULED_METHODS = CHAT_SEND_METHODS | frozenset(DEFAULT_LANES)
+
+# Longest a waiter sleeps before re-checking its buckets, so a long retry_after can't strand it
+MAX_WAIT_SECONDS = 1.0
+# Longest a send waits for its turn before acquire() gives up; bulk sends are dropped first
+DEFAULT_MAX_QUEUE_SECONDS = {LANE_MODERATION: 30.0, LANE_REPLY: 30.0, LANE_BULK: 10.0}
+# Longest a send inside deferrable() waits before it is handed to the deferred send queue
+DEFAULT_DEFER_AFTER_SECONDS = 0.5
+
+_lane: contextvars.ContextVar = contextvars.ContextVar("outbound_lane", default=None)
+_defer_after: contextvars.ContextVar = contextvars.ContextVar("outbound_defer_after", default=None)
+_scheduler: Optional["OutboundScheduler"] = None
+_scheduler_lock = threading.Lock()
+_deferred: Optional[helpers_workers.WorkerLane] = None
+_deferred_lock = threading.Lock()
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``capacity``, optionally blocked outright until a deadline."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token can be taken (0 if one is available now)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, until: float):
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class _Waiter:
+    __slots__ = ("key", "lane", "chat_id", "per_chat")
+
+    def __init__(self, priority: int, seq: int, lane: str, chat_id, per_chat: bool):
+        self.key = (priority, seq)
+        self.lane = lane
+        self.chat_id = chat_id
+        self.per_chat = per_chat
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.key < other.key
+
+
+@contextmanager
+def lane(name: str):
+    """Send every Telegram call made inside the block in lane ``name``."""
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def lane_for(method: str) -> str:
+    return _lane.get() or DEFAULT_LANES.get(method, LANE_BULK)
+
+
+@contextmanager
+def deferrable(max_wait: Optional[float] = None):
+    """Defer, rather than wait for, sends in the block that aren't granted within ``max_wait`` seconds.
+
+    For threads that must not sit in the send queue, such as inline webhook
+    requests. ``max_wait`` defaults to TELEGRAM_INLINE_SEND_MAX_WAIT_SECONDS.
+    """
+    if max_wait is None:
+        max_wait = float(os.getenv("TELEGRAM_INLINE_SEND_MAX_WAIT_SECONDS", DEFAULT_DEFER_AFTER_SECONDS))
+    token = _defer_after.set(max(0.0, max_wait))
+    try:
+        yield
+    finally:
+        _defer_after.reset(token)
+
+
+def defer_after() -> Optional[float]:
+    """The wait after which a send is deferred; None outside deferrable()."""
+    return _defer_after.get()
+
+
+class OutboundScheduler:
+    """Grant Bot API sends in priority order within Telegram's global and per-chat limits.
+
+    Callers block in acquire() until they are the highest-priority waiter
+    whose buckets have a token, then send on their own thread, so return
+    values and error handling stay with the caller. A waiter held back by
+    its own chat's limit does not hold up waiters for other chats.
+    throttle() blocks a chat (or everything) until a 429's ``retry_after``
+    has passed. A waiter that isn't granted within its lane's
+    ``max_queue_seconds`` gets a TimeoutError, so a long ``retry_after`` or
+    a saturated bucket can't hold webhook and worker threads forever.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate_per_minute: float = 20.0,
+        chat_burst: float = 5.0,
+        max_chats: int = 1000,
+        max_queue_seconds: Optional[Dict[str, float]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._clock = clock
+        self.max_queue_seconds = dict(DEFAULT_MAX_QUEUE_SECONDS, **(max_queue_seconds or {}))
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiting: List[_Waiter] = []
+        self.global_bucket = TokenBucket(global_rate, max(1.0, global_rate), clock())
+        self.chat_rate = chat_rate_per_minute / 60.0
+        self.chat_burst = max(1.0, chat_burst)
+        self._chats = LRUDict(max_chats)
+        self.granted: Dict[str, int] = {name: 0 for name in LANES}
+        self.timed_out: Dict[str, int] = {name: 0 for name in LANES}
+        self.deferred: Dict[str, int] = {name: 0 for name in LANES}
+
+    def _chat_bucket(self, chat_id, now: float) -> TokenBucket:
+        return self._chats.touch(str(chat_id), lambda: TokenBucket(self.chat_rate, self.chat_burst, now))
+
+    def _next_grant(self, now: float):
+        """The first waiter, in priority order, that may send now; else None and how long to wait."""
+        global_wait = self.global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+        soonest = None
+        for waiter in self._waiting:
+            chat_wait = self._chat_bucket(waiter.chat_id, now).wait_time(now) if waiter.per_chat else 0.0
+            if chat_wait <= 0:
+                return waiter, 0.0
+            soonest = chat_wait if soonest is None else min(soonest, chat_wait)
+        return None, soonest
+
+    def acquire(
+        self,
+        chat_id,
+        method: str,
+        lane_name: Optional[str] = None,
+        max_wait: Optional[float] = None,
+        deferring: bool = False,
+    ) -> float:
+        """Block until this call may be sent; returns the seconds spent waiting.
+
+        Raises TimeoutError if the call isn't granted within ``max_wait``
+        seconds (the lane's ``max_queue_seconds`` by default). Pass
+        ``deferring`` when the caller will defer the send on timeout, so it
+        is counted as deferred rather than timed out.
+        """
+        lane_name = lane_name or lane_for(method)
+        per_chat = chat_id is not None and method in CHAT_SEND_METHODS
+        waiter = _Waiter(LANE_PRIORITY.get(lane_name, len(LANES)), next(self._seq), lane_name, chat_id, per_chat)
+        started = self._clock()
+        if max_wait is None:
+            max_wait = self.max_queue_seconds.get(lane_name, DEFAULT_MAX_QUEUE_SECONDS[LANE_BULK])
+        deadline = started + max_wait
+
+        with self._cond:
+            bisect.insort(self._waiting, waiter)
+            try:
+                while True:
+                    now = self._clock()
+                    chosen, wait = self._next_grant(now)
+                    if chosen is waiter:
+                        self.global_bucket.take()
+                        if per_chat:
+                            self._chat_bucket(chat_id, now).take()
+                        break
+                    if now >= deadline:
+                        missed = self.deferred if deferring else self.timed_out
+                        missed[lane_name] = missed.get(lane_name, 0) + 1
+                        raise TimeoutError(
+                            f"{method} to {chat_id} not sent after waiting {max_wait:.0f}s in the {lane_name} lane"
+                        )
+                    if chosen is not None:
+                        # Someone ahead of us can go; wake them and wait for our turn
+                        self._cond.notify_all()
+                        wait = 0.05
+                    self._cond.wait(min(wait, MAX_WAIT_SECONDS, deadline - now))
+            finally:
+                self._waiting.remove(waiter)
+                self._cond.notify_all()
+            self.granted[lane_name] = self.granted.get(lane_name, 0) + 1
+
+        waited = self._clock() - started
+        helpers_metrics.REGISTRY.observe(helpers_metrics.OUTBOUND_WAIT_SECONDS, waited, lane=lane_name)
+        return waited
+
+    def throttle(self, chat_id, retry_after: float):
+        """Hold every send to ``chat_id`` (all sends if None) until ``retry_after`` seconds from now."""
+        with self._cond:
+            until = self._clock() + retry_after
+            if chat_id is None:
+                self.global_bucket.block(until)
+            else:
+                self._chat_bucket(chat_id, self._clock()).block(until)
+
+    def stats(self) -> Dict[str, dict]:
+        with self._cond:
+            depth = {name: 0 for name in LANES}
+            for waiter in self._waiting:
+                depth[waiter.lane] = depth.get(waiter.lane, 0) + 1
+            return {
+                name: {
+                    "depth": depth[name],
+                    "granted": self.granted.get(name, 0),
+                    "timed_out": self.timed_out.get(name, 0),
+                    "deferred": self.deferred.get(name, 0),
+                }
+                for name in depth
+            }
+
+
+def get_scheduler() -> Optional[OutboundScheduler]:
+    """Build the process-wide scheduler from TELEGRAM_* rate settings; None if TELEGRAM_SEND_QUEUE=0."""
+    global _scheduler
+    if os.getenv("TELEGRAM_SEND_QUEUE", "1") == "0":
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = OutboundScheduler(
+                    global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", 30)),
+                    chat_rate_per_minute=float(os.getenv("TELEGRAM_CHAT_RATE_PER_MINUTE", 20)),
+                    chat_burst=float(os.getenv("TELEGRAM_CHAT_BURST", 5)),
+                    max_queue_seconds={
+                        LANE_MODERATION: float(os.getenv("TELEGRAM_SEND_MAX_WAIT_SECONDS", 30)),
+                        LANE_REPLY: float(os.getenv("TELEGRAM_SEND_MAX_WAIT_SECONDS", 30)),
+                        LANE_BULK: float(os.getenv("TELEGRAM_BULK_MAX_WAIT_SECONDS", 10)),
+                    },
+                )
+    return _scheduler
+
+
+def _run_deferred(job: dict):
+    # Deferred sends wait their lane's full max_queue_seconds, on this thread rather than a request's
+    token = _defer_after.set(None)
+    try:
+        with lane(job["lane"]):
+            job["send"]()
+    finally:
+        _defer_after.reset(token)
+
+
+def get_deferred_sends() -> helpers_workers.WorkerLane:
+    """The background queue for deferred sends, sized by TELEGRAM_DEFERRED_SEND_* settings."""
+    global _deferred
+    if _deferred is None:
+        with _deferred_lock:
+            if _deferred is None:
+                deferred = helpers_workers.WorkerLane(
+                    "deferred-sends",
+                    _run_deferred,
+                    workers=int(os.getenv("TELEGRAM_DEFERRED_SEND_WORKERS", 2)),
+                    max_queue=int(os.getenv("TELEGRAM_DEFERRED_SEND_QUEUE", 200)),
+                )
+                deferred.start()
+                _deferred = deferred
+    return _deferred
+
+
+def defer(send: Callable[[], object], lane_name: str) -> bool:
+    """Run ``send`` later on a deferred send worker, in ``lane_name``; False if that queue is full."""
+    return get_deferred_sends().submit({"lane": lane_name, "send": send})
+
+
+def deferred_send_stats() -> Dict[str, Dict[str, float]]:
+    """WorkerLane stats for the deferred send queue, keyed by its name; empty until something is deferred."""
+    if _deferred is None:
+        return {}
+    return {_deferred.name: _deferred.stats()}
@@ -0,0 +1,110 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from src.helpers_telegram_api import TelegramAPI
+
+POLL_LIMIT = 100
+POLL_TIMEOUT_SECONDS = 50
+POLL_OFFSET_PATH = Path(os.getenv("POLL_OFFSET_PATH", ".poll_offset.json")).expanduser()
+
+
+def load_offset(state_path: Optional[Path] = None) -> Optional[int]:
+    path = state_path or POLL_OFFSET_PATH
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+    except Exception as exc:  # pragma: no cover - defensive
+        logging.warning("Unable to read poll offset state %s: %s", path, exc)
+        return None
+
+    offset = data.get("offset") if isinstance(data, dict) else None
+    return int(offset) if offset is not None else None
+
+
+def persist_offset(offset: int, state_path: Optional[Path] = None) -> None:
+    path = state_path or POLL_OFFSET_PATH
+    payload = {
+        "offset": offset,
+        "updated_at": datetime.utcnow().isoformat() + "Z",
+    }
+    try:
+        if path.parent and not path.parent.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        tmp_path.write_text(json.dumps(payload))
+        os.replace(tmp_path, path)
+    except Exception as exc:  # pragma: no cover - defensive
+        logging.warning("Unable to persist poll offset to %s: %s", path, exc)
+
+
+def fetch_updates(
+    client: TelegramAPI,
+    offset: Optional[int],
+    allowed_updates: List[str],
+    timeout: int = POLL_TIMEOUT_SECONDS,
+    limit: int = POLL_LIMIT,
+) -> List[dict]:
+    """Long-poll getUpdates once and return the (possibly empty) batch."""
+    payload = {
+        "timeout": timeout,
+        "limit": limit,
+        "allowed_updates": allowed_updates,
+    }
+    if offset is not None:
+        payload["offset"] = offset
+
+    # Give the HTTP read a margin over Telegram's own long-poll timeout; poll_updates() does the retrying
+    response = client.call("getUpdates", json=payload, timeout=(client.connect_timeout, timeout + 10))
+    data = response.json()
+    if not data.get("ok"):
+        raise RuntimeError(f"getUpdates failed: {data}")
+    return data.get("result", [])
+
+
+def poll_updates(
+    process_batch: Callable[[List[dict]], None],
+    *,
+    client: TelegramAPI,
+    allowed_updates: List[str],
+    timeout: int = POLL_TIMEOUT_SECONDS,
+    limit: int = POLL_LIMIT,
+    state_path: Optional[Path] = None,
+):
+    """Run the getUpdates loop forever, persisting the offset after each batch."""
+    state_file = state_path or POLL_OFFSET_PATH
+    offset = load_offset(state_file)
+    logging.info("Starting getUpdates polling (offset=%s, limit=%d, timeout=%ds)", offset, limit, timeout)
+
+    backoff_seconds = 1
+    while True:
+        try:
+            updates = fetch_updates(client, offset, allowed_updates, timeout=timeout, limit=limit)
+        except Exception as exc:
+            logging.error("Polling getUpdates failed: %s; retrying in %ds", exc, backoff_seconds)
+            time.sleep(backoff_seconds)
+            backoff_seconds = min(60, backoff_seconds * 2)
+            continue
+        backoff_seconds = 1
+
+        if not updates:
+            continue
+
+        logging.info("Polled %d update(s)", len(updates))
+        try:
+            process_batch(updates)
+        except Exception as exc:
+            # Keep the offset so Telegram hands the batch out again; updates already handled are deduplicated
+            logging.error("Error processing polled batch: %s; retrying in %ds", exc, backoff_seconds)
+            time.sleep(backoff_seconds)
+            backoff_seconds = min(60, backoff_seconds * 2)
+            continue
+
+        # Confirm the batch with Telegram on the next call and remember it locally
+        offset = max(update["update_id"] for update in updates) + 1
+        persist_offset(offset, state_file)
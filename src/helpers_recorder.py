@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+# Identity fields replaced with a salted pseudonym; text, entities and file_ids are kept for replay
+NAME_FIELDS = ("first_name", "last_name", "username")
+DROPPED_FIELDS = ("phone_number", "contact", "location", "venue")
+
+_recorder: Optional["UpdateRecorder"] = None
+_recorder_lock = threading.Lock()
+
+
+class UpdateRecorder:
+    """Append sanitized Telegram updates to a JSONL file for later replay.
+
+    User ids and names are replaced with stable salted pseudonyms so the same
+    person maps to the same fake user across a recording, while chat ids,
+    thread ids, message text and file ids are kept so moderation and
+    extraction behave the same on replay.
+    """
+
+    def __init__(self, path: Path, salt: str = "", sample_rate: float = 1.0):
+        self.path = path
+        self.salt = salt
+        self.sample_rate = sample_rate
+        self.recorded = 0
+        self._seen = 0
+        self._lock = threading.Lock()
+
+    def _pseudonym(self, value) -> str:
+        return hashlib.sha256(f"{self.salt}:{value}".encode("utf-8")).hexdigest()[:12]
+
+    def _sanitize_identity(self, identity: dict) -> dict:
+        pseudonym = self._pseudonym(identity.get("id"))
+        identity = dict(identity)
+        if "id" in identity:
+            identity["id"] = int(pseudonym, 16) % 10**10
+        for field in NAME_FIELDS:
+            if field in identity:
+                identity[field] = f"user_{pseudonym[:8]}"
+        return identity
+
+    def sanitize(self, value):
+        if isinstance(value, list):
+            return [self.sanitize(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+        # Telegram User objects always carry is_bot; private chats are keyed by the user's id
+        if ("is_bot" in value and not value.get("is_bot")) or value.get("type") == "private":
+            return self._sanitize_identity(value)
+        return {key: self.sanitize(item) for key, item in value.items() if key not in DROPPED_FIELDS}
+
+    def record(self, update: dict):
+        with self._lock:
+            self._seen += 1
+            # Deterministic sampling keeps every n-th update instead of random gaps
+            if self.sample_rate < 1.0 and int(self._seen * self.sample_rate) == int((self._seen - 1) * self.sample_rate):
+                return
+            line = json.dumps({"recorded_at": time.time(), "update": self.sanitize(update)}, ensure_ascii=False)
+            try:
+                if self.path.parent and not self.path.parent.exists():
+                    self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+                self.recorded += 1
+            except Exception as exc:  # pragma: no cover - defensive
+                logging.warning("Unable to record update to %s: %s", self.path, exc)
+
+
+def get_recorder() -> Optional[UpdateRecorder]:
+    """Build the recorder from UPDATE_RECORD_PATH on first use; None when recording is off."""
+    global _recorder
+    path = os.getenv("UPDATE_RECORD_PATH")
+    if not path:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = UpdateRecorder(
+                    Path(path).expanduser(),
+                    salt=os.getenv("UPDATE_RECORD_SALT", ""),
+                    sample_rate=min(1.0, max(0.0, float(os.getenv("UPDATE_RECORD_SAMPLE_RATE", 1.0)))),
+                )
+                logging.info("Recording sanitized updates to %s", _recorder.path)
+    return _recorder
+
+
+def record_update(update: dict):
+    recorder = get_recorder()
+    if recorder is not None:
+        recorder.record(update)
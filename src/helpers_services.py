@@ -0,0 +1,28 @@
+import logging
+import threading
+from typing import Callable, Dict, List
+
+_started: Dict[str, object] = {}
+_lock = threading.RLock()
+
+
+def start_once(name: str, start: Callable, *args, **kwargs):
+    """Run ``start(*args, **kwargs)`` the first time ``name`` is started in this process.
+
+    ``python bot.py`` executes bot.py twice (as ``__main__`` and again as
+    the ``bot`` module the helpers import), so every background service is
+    started through here to keep it to one thread per process. Later calls
+    return the first call's result.
+    """
+    with _lock:
+        if name in _started:
+            logging.debug("Background service %s already started", name)
+            return _started[name]
+        result = start(*args, **kwargs)
+        _started[name] = result
+        return result
+
+
+def started_services() -> List[str]:
+    with _lock:
+        return list(_started)
@@ -0,0 +1,419 @@
+import hashlib
+import itertools
+import random
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from src.helpers_lru import LRUDict
+
+ACTION_POOF = "poof"
+ACTION_MUTE = "mute"
+FLOOD_ACTIONS = (ACTION_POOF, ACTION_MUTE)
+
+
+class SlidingWindowCounter:
+    """Approximate sliding-window message count in constant time and space.
+
+    Keeps the count of the current fixed window and the one before it, and
+    weights the previous window by how much of it still overlaps the sliding
+    window ending now. Unlike a deque of timestamps, a key never costs more
+    than these four slots however fast it posts.
+    """
+
+    __slots__ = ("window_seconds", "window_start", "current", "previous")
+
+    def __init__(self, window_seconds: float, now: float):
+        self.window_seconds = float(window_seconds)
+        self.window_start = now
+        self.current = 0
+        self.previous = 0
+
+    def _advance(self, now: float):
+        elapsed = now - self.window_start
+        if elapsed < self.window_seconds:
+            return
+        windows = int(elapsed // self.window_seconds)
+        # Skipping two or more windows means nothing from the last one overlaps any more
+        self.previous = self.current if windows == 1 else 0
+        self.current = 0
+        self.window_start += windows * self.window_seconds
+
+    def rate(self, now: float) -> float:
+        self._advance(now)
+        overlap = 1.0 - (now - self.window_start) / self.window_seconds
+        return self.current + self.previous * overlap
+
+    def add(self, now: float) -> float:
+        self._advance(now)
+        self.current += 1
+        return self.rate(now)
+
+
+@dataclass(frozen=True)
+class FloodRule:
+    max_messages: int
+    window_seconds: float
+
+
+@dataclass(frozen=True)
+class FloodLimits:
+    """Thresholds from mod_topics/spam_control.yml; ``None`` rules are switched off."""
+
+    user: Optional[FloodRule] = FloodRule(8, 10)
+    thread: Optional[FloodRule] = FloodRule(40, 10)
+    action: str = ACTION_POOF
+    mute_after_strikes: int = 2
+    strike_window_seconds: float = 3600
+    mute_seconds: int = 600
+    reply_cooldown_seconds: float = 60
+    max_tracked_keys: int = 5000
+
+
+@dataclass(frozen=True)
+class WaveLimits:
+    """Near-duplicate spam wave settings from spam_control.yml."""
+
+    window_seconds: float = 1800
+    min_distinct_users: int = 3
+    min_similarity: float = 0.6
+    min_chars: int = 40
+    max_entries: int = 5000
+
+
+def _parse_rule(data, default: Optional[FloodRule]) -> Optional[FloodRule]:
+    if data is None:
+        return default
+    if data is False or not data.get("enabled", True):
+        return None
+    max_messages = int(data.get("max_messages", default.max_messages if default else 0))
+    window_seconds = float(data.get("window_seconds", default.window_seconds if default else 0))
+    if max_messages <= 0 or window_seconds <= 0:
+        raise ValueError("flood limits need a positive max_messages and window_seconds")
+    return FloodRule(max_messages, window_seconds)
+
+
+def parse_flood_limits(data: Optional[dict]) -> FloodLimits:
+    """Build FloodLimits from the spam_control.yml mapping; missing keys keep the defaults."""
+    defaults = FloodLimits()
+    data = (data or {}).get("Flood_Control") or {}
+    action = str(data.get("action", defaults.action)).lower()
+    if action not in FLOOD_ACTIONS:
+        raise ValueError(f"flood action must be one of {FLOOD_ACTIONS}, got {action!r}")
+    mute_seconds = int(data.get("mute_seconds", defaults.mute_seconds))
+    if mute_seconds < 30:
+        # Telegram treats restrictions shorter than 30 seconds as permanent
+        raise ValueError("mute_seconds must be at least 30")
+    return FloodLimits(
+        user=_parse_rule(data.get("per_user"), defaults.user),
+        thread=_parse_rule(data.get("per_thread"), defaults.thread),
+        action=action,
+        mute_after_strikes=int(data.get("mute_after_strikes", defaults.mute_after_strikes)),
+        strike_window_seconds=float(data.get("strike_window_seconds", defaults.strike_window_seconds)),
+        mute_seconds=mute_seconds,
+        reply_cooldown_seconds=float(data.get("reply_cooldown_seconds", defaults.reply_cooldown_seconds)),
+        max_tracked_keys=int(data.get("max_tracked_keys", defaults.max_tracked_keys)),
+    )
+
+
+def parse_wave_limits(data: Optional[dict]) -> Optional[WaveLimits]:
+    """Build WaveLimits from the spam_control.yml mapping; None when ``enabled: false``."""
+    defaults = WaveLimits()
+    data = (data or {}).get("Spam_Waves") or {}
+    if not data.get("enabled", True):
+        return None
+    limits = WaveLimits(
+        window_seconds=float(data.get("window_seconds", defaults.window_seconds)),
+        min_distinct_users=int(data.get("min_distinct_users", defaults.min_distinct_users)),
+        min_similarity=float(data.get("min_similarity", defaults.min_similarity)),
+        min_chars=int(data.get("min_chars", defaults.min_chars)),
+        max_entries=int(data.get("max_entries", defaults.max_entries)),
+    )
+    if not 0 < limits.min_similarity <= 1:
+        raise ValueError("min_similarity must be in (0, 1]")
+    if limits.min_distinct_users < 2:
+        raise ValueError("min_distinct_users must be at least 2")
+    return limits
+
+
+@dataclass
+class FloodVerdict:
+    """What the tracker saw for one message.
+
+    ``action`` is set while the sender is over the per-user limit; ``new_episode``
+    is True only for the first message of a flood, so the bot mutes and posts
+    its notice once instead of once per message.
+    """
+
+    action: Optional[str] = None
+    new_episode: bool = False
+    strikes: int = 0
+    user_rate: float = 0.0
+    thread_flooding: bool = False
+
+
+@dataclass
+class _UserState:
+    window: SlidingWindowCounter
+    episode_at: float = float("-inf")
+    strikes: int = 0
+    strike_at: float = float("-inf")
+    replied_at: Dict[str, float] = field(default_factory=dict)
+    media_group_id: Optional[str] = None
+
+
+class FloodTracker:
+    """Per-user and per-thread message rates with LRU-bounded memory.
+
+    Users are keyed by user_id across all threads and threads by
+    message_thread_id across all users. Each key holds one
+    SlidingWindowCounter, and the least recently active keys are dropped
+    once ``max_tracked_keys`` is reached, so a raid by thousands of fresh
+    accounts costs a fixed amount of memory.
+    """
+
+    def __init__(self, limits: Optional[FloodLimits] = None, clock: Callable[[], float] = time.monotonic):
+        self.limits = limits or FloodLimits()
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._users = LRUDict(self.limits.max_tracked_keys)
+        self._threads = LRUDict(self.limits.max_tracked_keys)
+        self.floods = 0
+        self.suppressed_replies = 0
+
+    def configure(self, limits: FloodLimits):
+        """Apply reloaded limits; counters restart only if the limits actually changed."""
+        with self._lock:
+            if limits == self.limits:
+                return
+            self.limits = limits
+            self._users = LRUDict(limits.max_tracked_keys)
+            self._threads = LRUDict(limits.max_tracked_keys)
+
+    def record(self, user_id, thread_id=None, media_group_id: Optional[str] = None, now: Optional[float] = None) -> FloodVerdict:
+        """Count one message from ``user_id`` in ``thread_id`` and judge whether either is flooding."""
+        now = self._clock() if now is None else now
+        limits = self.limits
+        verdict = FloodVerdict()
+        with self._lock:
+            if limits.thread is not None and thread_id is not None:
+                window = self._threads.touch(thread_id, lambda: SlidingWindowCounter(limits.thread.window_seconds, now))
+                verdict.thread_flooding = window.add(now) > limits.thread.max_messages
+
+            if limits.user is None or user_id is None:
+                return verdict
+            state = self._users.touch(user_id, lambda: _UserState(SlidingWindowCounter(limits.user.window_seconds, now)))
+            # An album arrives as one message per item; count it once
+            if media_group_id is not None and media_group_id == state.media_group_id:
+                verdict.user_rate = state.window.rate(now)
+            else:
+                state.media_group_id = media_group_id
+                verdict.user_rate = state.window.add(now)
+            if verdict.user_rate <= limits.user.max_messages:
+                return verdict
+
+            if now - state.episode_at > limits.user.window_seconds:
+                verdict.new_episode = True
+                self.floods += 1
+                state.strikes = state.strikes + 1 if now - state.strike_at <= limits.strike_window_seconds else 1
+                state.strike_at = now
+            state.episode_at = now
+            verdict.strikes = state.strikes
+            escalate = limits.mute_after_strikes > 0 and state.strikes >= limits.mute_after_strikes
+            verdict.action = ACTION_MUTE if escalate else limits.action
+        return verdict
+
+    def allow_reply(self, user_id, category: str, thread_flooding: bool = False, now: Optional[float] = None) -> bool:
+        """False if the bot already replied to this user for ``category`` within the cooldown.
+
+        Keeps a flooding account from turning the bot into an amplifier: the
+        message is still deleted, only the repeat notice is skipped. Every
+        reply is skipped while the thread itself is flooding.
+        """
+        now = self._clock() if now is None else now
+        limits = self.limits
+        with self._lock:
+            if thread_flooding:
+                self.suppressed_replies += 1
+                return False
+            if user_id is None or limits.user is None:
+                return True
+            state = self._users.touch(user_id, lambda: _UserState(SlidingWindowCounter(limits.user.window_seconds, now)))
+            last = state.replied_at.get(category)
+            if last is not None and now - last < limits.reply_cooldown_seconds:
+                self.suppressed_replies += 1
+                return False
+            state.replied_at[category] = now
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tracked_users": len(self._users),
+                "tracked_threads": len(self._threads),
+                "evicted": self._users.evicted + self._threads.evicted,
+                "floods": self.floods,
+                "suppressed_replies": self.suppressed_replies,
+            }
+
+
+### NEAR-DUPLICATE SPAM WAVES ###
+
+MINHASH_PERMUTATIONS = 32
+LSH_BANDS = 8
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+_WORD = re.compile(r"\w+")
+_SALTS = [random.Random(1729 + slot).getrandbits(64) for slot in range(MINHASH_PERMUTATIONS)]
+
+
+def _feature_hash(feature: str) -> int:
+    # Not hash(): str hashes are salted per process, which would change signatures on every restart and per worker
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    """MinHash signature over the word unigrams and bigrams of ``text``.
+
+    Each feature is hashed once; the permutations are XORs with fixed salts,
+    so every signature slot is one ``min(map(...))`` running in C.
+    """
+    words = _WORD.findall(text)
+    features = {_feature_hash(feature) for feature in words}
+    features.update(_feature_hash(f"{first} {second}") for first, second in zip(words, words[1:]))
+    if not features:
+        return ()
+    return tuple(min(map(salt.__xor__, features)) for salt in _SALTS)
+
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of the feature sets behind two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / MINHASH_PERMUTATIONS
+
+
+@dataclass(eq=False)
+class SpamWave:
+    wave_id: int
+    started_at: float
+    users: Set = field(default_factory=set)
+    poofed: int = 0
+
+
+@dataclass(eq=False)
+class _IndexedMessage:
+    signature: Tuple[int, ...]
+    seen_at: float
+    user_id: object
+    chat_id: object
+    message_id: object
+    bands: Tuple[Tuple[int, Tuple[int, ...]], ...]
+    wave: Optional[SpamWave] = None
+
+
+@dataclass
+class WaveVerdict:
+    """A message that belongs to a spam wave.
+
+    ``poof`` lists the (chat_id, message_id) pairs to delete: every indexed
+    copy when the wave is first detected, afterwards just the new message.
+    """
+
+    wave: SpamWave
+    new_wave: bool
+    poof: List[Tuple[object, object]]
+
+
+class SpamWaveDetector:
+    """Streaming near-duplicate index over recent messages.
+
+    Signatures are split into LSH_BANDS bands of LSH_ROWS slots and bucketed
+    by band, so a lookup only compares against messages that agree on a
+    whole band (likely above ~0.6 similarity, rare below ~0.3) instead of
+    the whole window. Entries leave the index after ``window_seconds`` or
+    once ``max_entries`` is reached.
+    """
+
+    def __init__(self, limits: Optional[WaveLimits] = None, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._wave_ids = itertools.count(1)
+        self.waves = 0
+        self.poofed = 0
+        self._reset(limits or WaveLimits())
+
+    def _reset(self, limits: WaveLimits):
+        self.limits = limits
+        self._ring: Deque[_IndexedMessage] = deque()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[_IndexedMessage]] = {}
+
+    def configure(self, limits: WaveLimits):
+        with self._lock:
+            if limits != self.limits:
+                self._reset(limits)
+
+    def __len__(self):
+        return len(self._ring)
+
+    def _evict(self, now: float):
+        cutoff = now - self.limits.window_seconds
+        while self._ring and (self._ring[0].seen_at < cutoff or len(self._ring) >= self.limits.max_entries):
+            entry = self._ring.popleft()
+            for band in entry.bands:
+                bucket = self._buckets.get(band)
+                if bucket is not None:
+                    bucket.discard(entry)
+                    if not bucket:
+                        del self._buckets[band]
+
+    def observe(self, text: str, user_id, chat_id, message_id, now: Optional[float] = None) -> Optional[WaveVerdict]:
+        """Index a message and return a WaveVerdict if it belongs to a spam wave."""
+        if len(text) < self.limits.min_chars:
+            return None
+        signature = minhash(text)
+        if not signature:
+            return None
+        bands = tuple((band, signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]) for band in range(LSH_BANDS))
+        now = self._clock() if now is None else now
+
+        with self._lock:
+            self._evict(now)
+            limits = self.limits
+            entry = _IndexedMessage(signature, now, user_id, chat_id, message_id, bands)
+
+            neighbours: Set[_IndexedMessage] = set()
+            for band in bands:
+                for candidate in self._buckets.get(band, ()):
+                    if candidate not in neighbours and similarity(candidate.signature, signature) >= limits.min_similarity:
+                        neighbours.add(candidate)
+
+            self._ring.append(entry)
+            for band in bands:
+                self._buckets.setdefault(band, set()).add(entry)
+
+            wave = next((neighbour.wave for neighbour in neighbours if neighbour.wave is not None), None)
+            if wave is not None:
+                # Once a wave is known, any further copy is poofed, whoever posts it
+                entry.wave = wave
+                wave.users.add(user_id)
+                wave.poofed += 1
+                self.poofed += 1
+                return WaveVerdict(wave, False, [(chat_id, message_id)])
+
+            users = {neighbour.user_id for neighbour in neighbours} | {user_id}
+            if len(users) < limits.min_distinct_users:
+                return None
+
+            wave = SpamWave(next(self._wave_ids), now, users)
+            members = sorted(neighbours, key=lambda neighbour: neighbour.seen_at) + [entry]
+            for member in members:
+                member.wave = wave
+            wave.poofed = len(members)
+            self.waves += 1
+            self.poofed += len(members)
+            return WaveVerdict(wave, True, [(member.chat_id, member.message_id) for member in members])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"indexed": len(self._ring), "waves": self.waves, "poofed": self.poofed}
@@ -5,6 +5,10 @@ import sys
 from PIL import Image
 from io import BytesIO
 import os
+from src import helpers_metrics
+from src import helpers_file_ids
+from src import helpers_membership
+from src import helpers_telegram_api
 
 
 # Setup basic logging configuration
@@ -15,24 +19,47 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 # Function to check if user is a member of the supergroup
 def is_user_in_supergroup(user_id):
-    url = f"{bot.TELEGRAM_API_URL}/getChatMember"
+    # Answers are cached and kept current by chat_member updates (see bot._handle_update)
+    membership = helpers_membership.get_membership_cache()
+    cached = membership.get(user_id)
+    if cached is not None:
+        return cached
+
+    started = membership.now()
     params = {
         'chat_id': bot.SUPERGROUP_ID,
         'user_id': user_id
     }
-    response = requests.get(url, params=params)
+    response = bot.TELEGRAM_API.call("getChatMember", params=params, http_method="GET")
     data = response.json()
 
     if response.status_code == 200 and 'result' in data:
         status = data['result']['status']
-        return status in ['member', 'administrator', 'creator']
+        is_member = status in helpers_membership.MEMBER_STATUSES
+        membership.put(user_id, is_member, observed_at=started)
+        return is_member
+    elif response.status_code == 400:
+        # Telegram doesn't know this user in the group: a definite "no"
+        membership.put(user_id, False, observed_at=started)
+        return False
     else:
+        # Throttled or failing: deny this once but don't cache the answer
         return False
 
+# Function to ask Telegram for a chat's current member count
+def fetch_member_count(chat_id):
+    response = bot.TELEGRAM_API.call("getChatMemberCount", params={'chat_id': chat_id}, http_method="GET")
+    response.raise_for_status()
+    return int(response.json()["result"])
+
+# Function to get a chat's member count without a round trip once the chat has been seen
+def get_member_count(chat_id):
+    # Kept current by chat_member/my_chat_member updates (see bot._handle_update) and reconciled periodically
+    return helpers_membership.get_member_counts().get(chat_id, fetch_member_count)
+
 # Helper function to send a message
 def send_message(chat_id, text, message_thread_id=None, reply_to_message_id=None, parse_mode='HTML'):
     try:
-        url = f"{bot.TELEGRAM_API_URL}/sendMessage"
         payload = {
             "chat_id": chat_id,
             "text": text,
@@ -46,7 +73,7 @@ def send_message(chat_id, text, message_thread_id=None, reply_to_message_id=None
         if not parse_mode:
             payload.pop('parse_mode', None)
 
-        response = requests.post(url, json=payload)
+        response = bot.TELEGRAM_API.call("sendMessage", json=payload)
         if response.status_code != 200:
             logging.error(f"Telegram API returned an error: {response.text}")
 
@@ -62,7 +89,8 @@ def send_message(chat_id, text, message_thread_id=None, reply_to_message_id=None
             ):
                 logging.warning("Message thread not found. Retrying without message_thread_id.")
                 payload.pop('message_thread_id', None)
-                response = requests.post(url, json=payload)
+                helpers_metrics.count_retry("telegram", "sendMessage")
+                response = bot.TELEGRAM_API.call("sendMessage", json=payload)
                 response.raise_for_status()
                 return response.json()
 
@@ -78,6 +106,12 @@ def send_image(chat_id, image_path=None, image_url=None, message_thread_id=None,
     """
     Sends an image to a Telegram chat from a local file OR remote URL.
 
+    A remote image is first sent by reference: the cached file_id from an
+    earlier send of the same URL, then the URL itself for Telegram to fetch.
+    Only if Telegram can't use either is it streamed down (up to the upload
+    cap). Bytes identical to something already uploaded are sent by that
+    upload's file_id instead of being uploaded again.
+
     Args:
         chat_id (int or str): The chat ID or username to send the image to.
         image_path (str): Local file path to the image.
@@ -87,26 +121,24 @@ def send_image(chat_id, image_path=None, image_url=None, message_thread_id=None,
         reply_to_message_id (int): Optional message ID to reply to.
     """
     try:
-        url = f"{bot.TELEGRAM_API_URL}/sendPhoto"
         payload = {
             "chat_id": chat_id,
             "parse_mode": "HTML"
         }
+        if caption:
+            payload['caption'] = caption
+        if message_thread_id:
+            payload['message_thread_id'] = message_thread_id
+        if reply_to_message_id:
+            payload['reply_to_message_id'] = reply_to_message_id
 
         # Determine image source
         if image_path:
             with open(image_path, "rb") as img_file:
-                files = {"photo": (os.path.basename(image_path), img_file)}
-                return _send_telegram_photo(url, payload, files, caption, message_thread_id, reply_to_message_id)
+                return _upload_photo(payload, os.path.basename(image_path), img_file)
 
         elif image_url:
-            response = requests.get(image_url, stream=True)
-            response.raise_for_status()
-            image_content = BytesIO(response.content)
-            image_content.name = "image.jpg"
-            image_content.seek(0)
-            files = {"photo": image_content}
-            return _send_telegram_photo(url, payload, files, caption, message_thread_id, reply_to_message_id)
+            return _relay_photo(payload, image_url)
 
         else:
             raise ValueError("Either image_path or image_url must be provided.")
@@ -115,32 +147,68 @@ def send_image(chat_id, image_path=None, image_url=None, message_thread_id=None,
         logging.error(f"send_image failed: {e}")
         raise RuntimeError(f"send_image failed: {e}")
 
-def _send_telegram_photo(url, payload, files, caption, message_thread_id, reply_to_message_id):
-    if caption:
-        payload['caption'] = caption
-    if message_thread_id:
-        payload['message_thread_id'] = message_thread_id
-    if reply_to_message_id:
-        payload['reply_to_message_id'] = reply_to_message_id
-
-    try:
-        response = requests.post(url, data=payload, files=files)
-        if response.status_code != 200:
-            logging.error(f"Telegram API returned an error: {response.text}")
-            if "Bad Request: message to be replied not found" in response.text:
-                logging.warning("Reply message not found. Skipping sending photo.")
-                return
-            response.raise_for_status()
-        return response.json()
-    finally:
-        if isinstance(files["photo"], BytesIO):
-            files["photo"].close()
+def _send_cached(method, field, payload, key):
+    """Send by the file_id cached under ``key``; None if there isn't one or it has gone stale."""
+    file_ids = helpers_file_ids.get_file_id_cache()
+    file_id = file_ids.get(key)
+    if not file_id:
+        return None
+    response = bot.TELEGRAM_API.call(method, json=dict(payload, **{field: file_id}))
+    if response.status_code == 400 and helpers_file_ids.is_stale_file_id_error(response.text):
+        logging.info(f"Telegram rejected the cached file_id for {key} ({response.text}); sending the media again")
+        file_ids.invalidate(key)
+        return None
+    return response
+
+def _relay_photo(payload, image_url):
+    key = helpers_file_ids.url_key(image_url)
+    cached = _send_cached("sendPhoto", "photo", payload, key)
+    response = cached if cached is not None else bot.TELEGRAM_API.call("sendPhoto", json=dict(payload, photo=image_url))
+    if response.status_code == 200:
+        result = response.json()
+        helpers_file_ids.get_file_id_cache().put(key, helpers_file_ids.sent_file_id(result.get("result")))
+        return result
+    if cached is not None or response.status_code != 400 or "Bad Request: message to be replied not found" in response.text:
+        return _checked_photo(response)
+    logging.info(f"Telegram couldn't send {image_url} by reference ({response.text}); uploading it instead")
+
+    response = bot.TELEGRAM_API.fetch(image_url, stream=True, service="http", operation="image_download")
+    response.raise_for_status()
+    with helpers_telegram_api.spool(response) as image_file:
+        result = _upload_photo(payload, "image.jpg", image_file)
+    if result:
+        helpers_file_ids.get_file_id_cache().put(key, helpers_file_ids.sent_file_id(result.get("result")))
+    return result
+
+def _upload_photo(payload, filename, image_file):
+    # Identical bytes uploaded before are resent by file_id
+    key = helpers_file_ids.content_key(image_file)
+    response = _send_cached("sendPhoto", "photo", payload, key)
+    if response is None:
+        response = bot.TELEGRAM_API.call("sendPhoto", data=payload, files={"photo": (filename, image_file)})
+    result = _checked_photo(response)
+    if result:
+        helpers_file_ids.get_file_id_cache().put(key, helpers_file_ids.sent_file_id(result.get("result")))
+    return result
+
+def _checked_photo(response):
+    if response.status_code != 200:
+        logging.error(f"Telegram API returned an error: {response.text}")
+        if "Bad Request: message to be replied not found" in response.text:
+            logging.warning("Reply message not found. Skipping sending photo.")
+            return
+        response.raise_for_status()
+    return response.json()
 
 # Helper function to send a document or GIF with or without a caption
 def send_gif(chat_id, document_url, message_thread_id=None, reply_to_message_id=None, caption=None):
     """
     Sends a document to a Telegram chat.
 
+    The converted GIF's file_id is cached under both the source URL and the
+    source bytes, so a repeat is sent without downloading (same URL) or
+    without converting and uploading (same sticker from another URL).
+
     Args:
         chat_id (int or str): The chat ID or username to send the document to.
         document_url (str): The URL of the document to send.
@@ -149,26 +217,11 @@ def send_gif(chat_id, document_url, message_thread_id=None, reply_to_message_id=
         reply_to_message_id (int): Optional message ID to reply to.
     """
     try:
-        url = f"{bot.TELEGRAM_API_URL}/sendDocument"
         payload = {
             "chat_id": chat_id,
             "parse_mode": "HTML",
             "disable_web_page_preview": True
         }
-
-        # Step 1: Download the .webp file
-        response = requests.get(document_url, stream=True)
-        response.raise_for_status()
-        webp_content = BytesIO(response.content)
-
-        # Step 2: Convert .webp to .gif
-        gif_content = BytesIO()
-        with Image.open(webp_content) as img:
-            img.save(gif_content, format="GIF")
-        gif_content.name = "converted.gif"  # Set a name for the file
-        gif_content.seek(0)  # Reset the pointer to the start of the file
-        files = {"document": gif_content}
-
         if caption:
             payload['caption'] = caption
         if message_thread_id:
@@ -176,7 +229,27 @@ def send_gif(chat_id, document_url, message_thread_id=None, reply_to_message_id=
         if reply_to_message_id:
             payload['reply_to_message_id'] = reply_to_message_id
 
-        response = requests.post(url, data=payload, files=files)
+        url_key = helpers_file_ids.url_key(document_url)
+        content_key = None
+        response = _send_cached("sendDocument", "document", payload, url_key)
+        if response is None:
+            # Step 1: Stream the .webp file down, refusing anything over the upload cap
+            response = bot.TELEGRAM_API.fetch(document_url, stream=True, service="http", operation="gif_download")
+            response.raise_for_status()
+            with helpers_telegram_api.spool(response) as webp_content:
+                # Keyed on the source bytes: the same sticker always converts to the same GIF
+                content_key = "gif:" + helpers_file_ids.content_key(webp_content)
+                response = _send_cached("sendDocument", "document", payload, content_key)
+                if response is None:
+                    # Step 2: Convert .webp to .gif
+                    gif_content = BytesIO()
+                    with Image.open(webp_content) as img:
+                        img.save(gif_content, format="GIF")
+                    gif_content.name = "converted.gif"  # Set a name for the file
+                    gif_content.seek(0)  # Reset the pointer to the start of the file
+                    files = {"document": gif_content}
+
+                    response = bot.TELEGRAM_API.call("sendDocument", data=payload, files=files)
 
         if response.status_code != 200:
             logging.error(f"Telegram API returned an error: {response.text}")
@@ -188,7 +261,12 @@ def send_gif(chat_id, document_url, message_thread_id=None, reply_to_message_id=
 
             response.raise_for_status()  # Raise for other non-2xx errors
 
-        return response.json()
+        result = response.json()
+        file_id = helpers_file_ids.sent_file_id(result.get("result"))
+        file_ids = helpers_file_ids.get_file_id_cache()
+        file_ids.put(url_key, file_id)
+        file_ids.put(content_key, file_id)
+        return result
 
     except requests.exceptions.RequestException as e:
         logging.error(f"send_document failed: {e}")
@@ -203,9 +281,8 @@ def send_gif(chat_id, document_url, message_thread_id=None, reply_to_message_id=
 # Helper function to pin a message
 def pin_message(chat_id, message_id):
     try:
-        url = f"{bot.TELEGRAM_API_URL}/pinChatMessage"
         payload = {"chat_id": chat_id, "message_id": message_id}
-        response = requests.post(url, json=payload)
+        response = bot.TELEGRAM_API.call("pinChatMessage", json=payload)
         if response.status_code != 200:
             logging.error(f"Telegram API returned an error: {response.text}")
             response.raise_for_status()  # This raises an exception for non-2xx responses
@@ -216,15 +293,35 @@ def pin_message(chat_id, message_id):
         raise RuntimeError(f"pin_message failed: {e}")
     
 
+# Helper function to mute a member until a unix timestamp
+def restrict_chat_member(chat_id, user_id, until_date):
+    try:
+        payload = {
+            "chat_id": chat_id,
+            "user_id": user_id,
+            # can_send_messages=False also revokes media, polls and other sends
+            "permissions": {"can_send_messages": False},
+            "until_date": int(until_date)
+        }
+        response = bot.TELEGRAM_API.call("restrictChatMember", json=payload)
+        if response.status_code != 200:
+            logging.error(f"Telegram API returned an error: {response.text}")
+            response.raise_for_status()
+        return response.json()
+
+    except requests.exceptions.RequestException as e:
+        logging.error(f"restrict_chat_member failed: {e}")
+        raise RuntimeError(f"restrict_chat_member failed: {e}")
+
+
 # Helper function to delete a message
 def delete_message(chat_id, message_id):
     try:
-        url = f"{bot.TELEGRAM_API_URL}/deleteMessage"
         payload = {
             "chat_id": chat_id,
             "message_id": message_id
         }
-        response = requests.post(url, json=payload)
+        response = bot.TELEGRAM_API.call("deleteMessage", json=payload)
         json_response = response.json()
 
         if response.status_code != 200:
@@ -0,0 +1,324 @@
+import functools
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from src import helpers_metrics
+from src import helpers_outbound
+
+# Methods that are safe to send twice: reads, and writes whose repeat is a no-op or a handled error
+IDEMPOTENT_METHODS = frozenset({
+    "getMe",
+    "getChat",
+    "getChatMember",
+    "getChatMemberCount",
+    "getFile",
+    "getWebhookInfo",
+    "setWebhook",
+    "deleteWebhook",
+    "deleteMessage",
+    "pinChatMessage",
+    "restrictChatMember",
+    "revokeChatInviteLink",
+})
+# Uploads and downloads move file bodies and get a longer read timeout
+UPLOAD_METHODS = frozenset({"sendPhoto", "sendDocument", "sendAnimation", "sendMediaGroup"})
+
+# Telegram's limit for photos uploaded as multipart; larger sources are refused before download
+UPLOAD_MAX_BYTES = int(os.getenv("TELEGRAM_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+# Downloads stay in memory up to this size, then spill to a temp file
+SPOOL_MAX_MEMORY = 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+
+Timeout = Union[float, Tuple[float, float]]
+
+_client: Optional["TelegramAPI"] = None
+_client_lock = threading.Lock()
+
+
+def _never_sent(exc) -> bool:
+    """True if the request failed before a connection was made, so Telegram can't have acted on it."""
+    if isinstance(exc, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(exc, requests.exceptions.ConnectionError) and exc.args:
+        return isinstance(getattr(exc.args[0], "reason", None), NewConnectionError)
+    return False
+
+
+class TelegramAPI:
+    """Bot API client sharing one keep-alive connection pool across every caller.
+
+    Every request has a timeout, so a hung socket fails the call instead of
+    parking a greenlet forever. Idempotent methods are retried on connection
+    errors, timeouts and 5xx responses with jittered exponential backoff.
+    Any method is retried after a 429 whose ``retry_after`` is short enough
+    to wait out, and after a failed connect, because then Telegram never
+    saw the request. Each attempt is timed and counted in helpers_metrics.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_root: str = "https://api.telegram.org",
+        pool_size: int = 20,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        upload_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        max_retry_after: float = 10.0,
+        scheduler: Optional[helpers_outbound.OutboundScheduler] = None,
+    ):
+        api_root = api_root.rstrip("/")
+        self.base_url = f"{api_root}/bot{token}"
+        self.file_url = f"{api_root}/file/bot{token}"
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.upload_timeout = upload_timeout
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_seconds = backoff_seconds
+        self.max_retry_after = max_retry_after
+        self.scheduler = scheduler
+
+        self.session = requests.Session()
+        # Retries are handled here so they can honour retry_after and be counted
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def timeout_for(self, method: str) -> Tuple[float, float]:
+        read_timeout = self.upload_timeout if method in UPLOAD_METHODS else self.read_timeout
+        return (self.connect_timeout, read_timeout)
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: spread retries from many greenlets instead of stampeding together
+        return random.uniform(0, self.backoff_seconds * (2 ** attempt))
+
+    @staticmethod
+    def _rewind(files):
+        for value in (files or {}).values():
+            file = value[1] if isinstance(value, tuple) else value
+            if hasattr(file, "seek"):
+                file.seek(0)
+
+    def _retry_delay(
+        self, idempotent: bool, attempt: int, response=None, exc=None, chat_id=None, scheduled: bool = False
+    ) -> Optional[float]:
+        """Seconds to wait before retrying, or None if this failure should be returned/raised."""
+        if response is not None and response.status_code == 429:
+            try:
+                retry_after = float(response.json().get("parameters", {}).get("retry_after", 1))
+            except ValueError:
+                retry_after = 1.0
+            if scheduled and self.scheduler is not None:
+                # Hold every queued send to this chat, not just this one
+                self.scheduler.throttle(chat_id, retry_after)
+            if attempt >= self.max_retries or retry_after > self.max_retry_after:
+                return None
+            # A scheduled retry does its waiting in acquire()
+            return 0.0 if scheduled and self.scheduler is not None else retry_after
+        if attempt >= self.max_retries:
+            return None
+        if _never_sent(exc):
+            return self._backoff(attempt)
+        if not idempotent:
+            return None
+        if exc is not None or (response is not None and response.status_code >= 500):
+            return self._backoff(attempt)
+        return None
+
+    def _acquire_or_defer(self, chat_id, operation: str, files, send_later) -> bool:
+        """Wait for a scheduler grant; True if ``send_later`` was deferred instead (see helpers_outbound.deferrable)."""
+        # Uploads can't be deferred: the caller closes their files once call() returns
+        defer_after = None if files else helpers_outbound.defer_after()
+        if defer_after is not None:
+            try:
+                self.scheduler.acquire(chat_id, operation, max_wait=defer_after, deferring=True)
+                return False
+            except TimeoutError:
+                if helpers_outbound.defer(send_later, helpers_outbound.lane_for(operation)):
+                    logging.info("%s to %s deferred to the background send queue", operation, chat_id)
+                    return True
+                # The deferred queue is full: wait for a grant here after all
+        self.scheduler.acquire(chat_id, operation)
+        return False
+
+    def _send(
+        self,
+        service: str,
+        operation: str,
+        idempotent: bool,
+        http_method: str,
+        url: str,
+        timeout: Timeout,
+        files=None,
+        chat_id=None,
+        scheduled: bool = False,
+        **kwargs,
+    ) -> requests.Response:
+        attempt = 0
+        while True:
+            response, error = None, None
+            if scheduled and self.scheduler is not None:
+                send_later = functools.partial(
+                    self._send, service, operation, idempotent, http_method, url, timeout,
+                    chat_id=chat_id, scheduled=scheduled, **kwargs
+                )
+                try:
+                    if self._acquire_or_defer(chat_id, operation, files, send_later):
+                        return _deferred_response(url)
+                except TimeoutError as exc:
+                    # Callers already handle a request that never went out
+                    raise requests.exceptions.Timeout(str(exc)) from exc
+            try:
+                with helpers_metrics.dependency_call(service, operation) as call:
+                    response = call.record(
+                        self.session.request(http_method, url, files=files, timeout=timeout, **kwargs)
+                    )
+            except requests.exceptions.RequestException as exc:
+                error = exc
+
+            delay = self._retry_delay(idempotent, attempt, response, error, chat_id, scheduled)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return response
+
+            logging.warning(
+                "%s %s failed (%s); retry %d/%d in %.1fs",
+                service,
+                operation,
+                error or response.status_code,
+                attempt + 1,
+                self.max_retries,
+                delay,
+            )
+            helpers_metrics.count_retry(service, operation)
+            time.sleep(delay)
+            self._rewind(files)
+            attempt += 1
+
+    def call(
+        self,
+        method: str,
+        *,
+        params: Optional[dict] = None,
+        json: Optional[dict] = None,
+        data: Optional[dict] = None,
+        files: Optional[dict] = None,
+        http_method: str = "POST",
+        timeout: Optional[Timeout] = None,
+    ) -> requests.Response:
+        """Call a Bot API method and return the raw response (callers check ``ok`` themselves).
+
+        Sends and moderation writes wait their turn in the outbound scheduler;
+        wrap a call in ``helpers_outbound.lane(...)`` to change its priority.
+        Inside ``helpers_outbound.deferrable()`` a send that has to wait is
+        queued to go out later and an ok response with a null result is
+        returned straight away.
+        """
+        chat_id = next((source["chat_id"] for source in (json, data, params) if source and "chat_id" in source), None)
+        return self._send(
+            "telegram",
+            method,
+            method in IDEMPOTENT_METHODS,
+            http_method,
+            f"{self.base_url}/{method}",
+            timeout or self.timeout_for(method),
+            files=files,
+            chat_id=chat_id,
+            scheduled=method in helpers_outbound.SCHEDULED_METHODS,
+            params=params,
+            json=json,
+            data=data,
+        )
+
+    def download(self, file_path: str, stream: bool = False) -> requests.Response:
+        """Download a file returned by getFile; downloads are always safe to retry."""
+        return self.fetch(f"{self.file_url}/{file_path}", stream=stream)
+
+    def fetch(
+        self, url: str, stream: bool = False, service: str = "telegram", operation: str = "file_download"
+    ) -> requests.Response:
+        """GET an absolute URL (a Telegram file URL built elsewhere, or media to re-upload) with retries."""
+        return self._send(
+            service,
+            operation,
+            True,
+            "GET",
+            url,
+            (self.connect_timeout, self.upload_timeout),
+            stream=stream,
+        )
+
+
+def _deferred_response(url: str) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = b'{"ok": true, "result": null}'
+    return response
+
+
+def too_large(content_length, max_bytes: int = UPLOAD_MAX_BYTES) -> bool:
+    try:
+        return content_length is not None and int(content_length) > max_bytes
+    except ValueError:
+        return False
+
+
+def spool(response: requests.Response, max_bytes: int = UPLOAD_MAX_BYTES):
+    """Copy a streamed response into a rewound temp file in chunks, refusing bodies over ``max_bytes``.
+
+    Only SPOOL_MAX_MEMORY of the body is ever held in memory; the rest goes
+    to disk. Raises ValueError if the source is too large to upload.
+    """
+    if too_large(response.headers.get("Content-Length"), max_bytes):
+        response.close()
+        raise ValueError(f"source is larger than the {max_bytes} byte upload limit")
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+    try:
+        for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if size > max_bytes:
+                raise ValueError(f"source is larger than the {max_bytes} byte upload limit")
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    finally:
+        response.close()
+    spooled.seek(0)
+    return spooled
+
+
+def get_client() -> TelegramAPI:
+    """Lazily build the process-wide client from BOT_TOKEN, TELEGRAM_API_ROOT and TELEGRAM_* settings."""
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            bot_token = os.getenv("BOT_TOKEN")
+            if not bot_token:
+                raise RuntimeError("BOT_TOKEN must be set to call the Telegram Bot API")
+            _client = TelegramAPI(
+                bot_token,
+                api_root=os.getenv("TELEGRAM_API_ROOT", "https://api.telegram.org"),
+                pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", 20)),
+                read_timeout=float(os.getenv("TELEGRAM_TIMEOUT_SECONDS", 10)),
+                upload_timeout=float(os.getenv("TELEGRAM_UPLOAD_TIMEOUT_SECONDS", 60)),
+                max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", 3)),
+                scheduler=helpers_outbound.get_scheduler(),
+            )
+    return _client
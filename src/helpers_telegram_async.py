@@ -0,0 +1,414 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import aiohttp
+
+from src import helpers_file_ids
+from src import helpers_metrics
+from src import helpers_outbound
+from src import helpers_telegram_api
+from src.helpers_telegram_api import IDEMPOTENT_METHODS, UPLOAD_METHODS
+
+# Telegram accepts 2-10 items per album
+MEDIA_GROUP_MAX = 10
+
+_client: Optional["AsyncTelegramAPI"] = None
+_client_lock = threading.Lock()
+
+
+class AsyncTelegramAPI:
+    """asyncio counterpart of helpers_telegram for code running on an event loop (the Discord bridge).
+
+    Calls await the network instead of blocking the loop, share one aiohttp
+    connection pool, and follow the same retry policy as
+    helpers_telegram_api.TelegramAPI. Sends still queue in the process-wide
+    outbound scheduler; the wait for a grant runs on an executor thread so
+    the loop keeps serving other events meanwhile.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        api_root: str = "https://api.telegram.org",
+        pool_size: int = 20,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 10.0,
+        upload_timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_seconds: float = 0.5,
+        max_retry_after: float = 10.0,
+        scheduler: Optional[helpers_outbound.OutboundScheduler] = None,
+    ):
+        self.base_url = f"{api_root.rstrip('/')}/bot{token}"
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.upload_timeout = upload_timeout
+        self.max_retries = max(0, int(max_retries))
+        self.backoff_seconds = backoff_seconds
+        self.max_retry_after = max_retry_after
+        self.scheduler = scheduler
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        # Created on first use so it binds to the loop that uses it
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    def timeout_for(self, method: str) -> aiohttp.ClientTimeout:
+        read_timeout = self.upload_timeout if method in UPLOAD_METHODS else self.read_timeout
+        return aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=read_timeout)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, self.backoff_seconds * (2 ** attempt))
+
+    async def _acquire(self, chat_id, method: str):
+        if self.scheduler is None or method not in helpers_outbound.SCHEDULED_METHODS:
+            return
+        # Executor threads don't see this task's context, so resolve the lane here
+        lane_name = helpers_outbound.lane_for(method)
+        await asyncio.get_running_loop().run_in_executor(None, self.scheduler.acquire, chat_id, method, lane_name)
+
+    def _retry_delay(self, method: str, attempt: int, status=None, payload=None, exc=None, chat_id=None) -> Optional[float]:
+        """Seconds to wait before retrying, or None if this outcome should be returned/raised."""
+        if status == 429:
+            retry_after = float(((payload or {}).get("parameters") or {}).get("retry_after", 1))
+            scheduled = self.scheduler is not None and method in helpers_outbound.SCHEDULED_METHODS
+            if scheduled:
+                self.scheduler.throttle(chat_id, retry_after)
+            if attempt >= self.max_retries or retry_after > self.max_retry_after:
+                return None
+            return 0.0 if scheduled else retry_after
+        if attempt >= self.max_retries:
+            return None
+        if isinstance(exc, aiohttp.ClientConnectorError):
+            # The connection never opened, so Telegram can't have acted on the request
+            return self._backoff(attempt)
+        if method not in IDEMPOTENT_METHODS:
+            return None
+        if exc is not None or (status is not None and status >= 500):
+            return self._backoff(attempt)
+        return None
+
+    async def call(self, method: str, payload: Optional[dict] = None, files: Sequence[Tuple] = ()) -> Tuple[int, dict]:
+        """Call a Bot API method; returns ``(status, result)`` and leaves checking ``ok`` to the caller.
+
+        ``files`` is a sequence of ``(field, filename, bytes)``; when present,
+        ``payload`` is sent as multipart form fields alongside them.
+        """
+        payload = payload or {}
+        chat_id = payload.get("chat_id")
+        url = f"{self.base_url}/{method}"
+        attempt = 0
+        while True:
+            status, result, error = None, None, None
+            await self._acquire(chat_id, method)
+            try:
+                with helpers_metrics.dependency_call("telegram", method) as call:
+                    if files:
+                        request = self.session().post(url, data=_form(payload, files), timeout=self.timeout_for(method))
+                    else:
+                        request = self.session().post(url, json=payload, timeout=self.timeout_for(method))
+                    async with request as response:
+                        call.record(response)
+                        status = response.status
+                        body = await response.text()
+                try:
+                    result = json.loads(body)
+                except ValueError:
+                    # e.g. an HTML error page from a proxy in front of the API
+                    result = {"ok": False, "description": body[:200]}
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                error = exc
+
+            delay = self._retry_delay(method, attempt, status, result, error, chat_id)
+            if delay is None:
+                if error is not None:
+                    raise error
+                return status, result
+
+            logging.warning(
+                "telegram %s failed (%s); retry %d/%d in %.1fs",
+                method,
+                error or status,
+                attempt + 1,
+                self.max_retries,
+                delay,
+            )
+            helpers_metrics.count_retry("telegram", method)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def fetch(
+        self,
+        url: str,
+        service: str = "http",
+        operation: str = "image_download",
+        headers=None,
+        max_bytes: Optional[int] = None,
+        spool: bool = False,
+    ):
+        """GET an absolute URL, retrying connection errors and 5xx responses.
+
+        Returns the body as bytes, or with ``spool`` a rewound temp file the
+        caller closes. The body is read in chunks and refused with ValueError
+        once it passes ``max_bytes``.
+        """
+        attempt = 0
+        while True:
+            try:
+                with helpers_metrics.dependency_call(service, operation) as call:
+                    timeout = aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.upload_timeout)
+                    async with self.session().get(url, headers=headers, timeout=timeout) as response:
+                        call.record(response)
+                        response.raise_for_status()
+                        return await _read_body(response, max_bytes, spool)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+                status = getattr(exc, "status", None)
+                if attempt >= self.max_retries or (status is not None and status < 500):
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning("%s %s failed (%s); retry %d/%d in %.1fs", service, operation, exc, attempt + 1, self.max_retries, delay)
+                helpers_metrics.count_retry(service, operation)
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def send_message(self, chat_id, text, message_thread_id=None, reply_to_message_id=None, parse_mode="HTML"):
+        payload = {
+            "chat_id": chat_id,
+            "text": text,
+            "disable_web_page_preview": True,
+        }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        if message_thread_id:
+            payload["message_thread_id"] = message_thread_id
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+
+        status, result = await self.call("sendMessage", payload)
+        if status != 200:
+            description = result.get("description", "")
+            if "message to be replied not found" in description:
+                logging.warning("Reply message not found. Skipping sending message.")
+                return None
+            if "message thread not found" in description and payload.get("message_thread_id") is not None:
+                logging.warning("Message thread not found. Retrying without message_thread_id.")
+                payload.pop("message_thread_id")
+                helpers_metrics.count_retry("telegram", "sendMessage")
+                status, result = await self.call("sendMessage", payload)
+        return _checked("send_message", status, result)
+
+    async def send_image(self, chat_id, image_path=None, image_url=None, message_thread_id=None, reply_to_message_id=None, caption=None):
+        """Send one photo from a local file or a remote URL.
+
+        A URL is sent by reference first (a cached file_id, then the URL for
+        Telegram to fetch) and only streamed through here if Telegram can't
+        use either.
+        """
+        payload = {"chat_id": chat_id, "parse_mode": "HTML"}
+        if caption:
+            payload["caption"] = caption
+        if message_thread_id:
+            payload["message_thread_id"] = message_thread_id
+        if reply_to_message_id:
+            payload["reply_to_message_id"] = reply_to_message_id
+
+        file_ids = helpers_file_ids.get_file_id_cache()
+        if image_path:
+            with open(image_path, "rb") as img_file:
+                status, result = await self._upload_photo(payload, os.path.basename(image_path), img_file)
+        elif image_url:
+            key = helpers_file_ids.url_key(image_url)
+            cached = await self._send_cached("sendPhoto", "photo", payload, key)
+            status, result = cached or await self.call("sendPhoto", dict(payload, photo=image_url))
+            if cached is None and status == 400 and "message to be replied not found" not in result.get("description", ""):
+                logging.info("Telegram couldn't send %s by reference (%s); uploading it instead", image_url, result.get("description"))
+                image_file = await self.fetch(image_url, max_bytes=helpers_telegram_api.UPLOAD_MAX_BYTES, spool=True)
+                with image_file:
+                    status, result = await self._upload_photo(payload, "image.jpg", image_file)
+            if status == 200:
+                file_ids.put(key, helpers_file_ids.sent_file_id(result.get("result")))
+        else:
+            raise ValueError("Either image_path or image_url must be provided.")
+
+        if status != 200 and "message to be replied not found" in result.get("description", ""):
+            logging.warning("Reply message not found. Skipping sending photo.")
+            return None
+        return _checked("send_image", status, result)
+
+    async def _send_cached(self, method: str, field: str, payload: dict, key: str) -> Optional[Tuple[int, dict]]:
+        """Send by the file_id cached under ``key``; None if there isn't one or it has gone stale."""
+        file_ids = helpers_file_ids.get_file_id_cache()
+        file_id = file_ids.get(key)
+        if not file_id:
+            return None
+        status, result = await self.call(method, dict(payload, **{field: file_id}))
+        if status == 400 and helpers_file_ids.is_stale_file_id_error(result.get("description")):
+            logging.info("Telegram rejected the cached file_id for %s (%s); sending the media again", key, result.get("description"))
+            file_ids.invalidate(key)
+            return None
+        return status, result
+
+    async def _upload_photo(self, payload: dict, filename: str, image_file) -> Tuple[int, dict]:
+        # Identical bytes uploaded before are resent by file_id
+        key = helpers_file_ids.content_key(image_file)
+        cached = await self._send_cached("sendPhoto", "photo", payload, key)
+        status, result = cached or await self.call("sendPhoto", payload, files=[("photo", filename, image_file)])
+        if status == 200:
+            helpers_file_ids.get_file_id_cache().put(key, helpers_file_ids.sent_file_id(result.get("result")))
+        return status, result
+
+    async def send_media_group(
+        self, chat_id, image_urls: List[str], message_thread_id=None, reply_to_message_id=None, captions=None
+    ):
+        """Send images as albums of up to MEDIA_GROUP_MAX; ``captions`` holds one caption (or None) per image.
+
+        Each album is sent by reference first (cached file_ids or the URLs);
+        if Telegram can't fetch them, its images are streamed down
+        concurrently and uploaded, except those whose bytes were uploaded
+        before. A single image is sent with send_image, since Telegram
+        rejects one-item albums. Returns the sent messages.
+        """
+        if len(image_urls) == 1:
+            return [await self.send_image(chat_id, image_url=image_urls[0], message_thread_id=message_thread_id,
+                                          reply_to_message_id=reply_to_message_id, caption=(captions or [None])[0])]
+
+        file_ids = helpers_file_ids.get_file_id_cache()
+        sent = []
+        for start in range(0, len(image_urls), MEDIA_GROUP_MAX):
+            chunk = image_urls[start:start + MEDIA_GROUP_MAX]
+            chunk_captions = (captions or [])[start:start + MEDIA_GROUP_MAX]
+            payload = {"chat_id": chat_id}
+            if message_thread_id:
+                payload["message_thread_id"] = message_thread_id
+            if reply_to_message_id:
+                payload["reply_to_message_id"] = reply_to_message_id
+
+            url_keys = [helpers_file_ids.url_key(url) for url in chunk]
+            content_keys = [None] * len(chunk)
+            sources = [file_ids.get(key) or url for key, url in zip(url_keys, chunk)]
+            status, result = await self.call("sendMediaGroup", dict(payload, media=_album(sources, chunk_captions)))
+            stale = status == 400 and helpers_file_ids.is_stale_file_id_error(result.get("description"))
+            # Only URLs can fail to fetch; an all-file_id album that isn't stale fails the same way uploaded
+            if stale or (status == 400 and any(source == url for source, url in zip(sources, chunk))):
+                logging.info("Telegram couldn't send album by reference (%s); uploading it instead", result.get("description"))
+                for key, source, url in zip(url_keys, sources, chunk):
+                    if stale and source != url:
+                        file_ids.invalidate(key)
+                bodies = await asyncio.gather(*(
+                    self.fetch(url, max_bytes=helpers_telegram_api.UPLOAD_MAX_BYTES, spool=True) for url in chunk
+                ))
+                try:
+                    content_keys = [helpers_file_ids.content_key(body) for body in bodies]
+                    status, result = await self._upload_album(payload, chunk_captions, bodies, content_keys, start)
+                finally:
+                    for body in bodies:
+                        body.close()
+
+            messages = _checked("send_media_group", status, result).get("result", [])
+            for url_key, content_key, message in zip(url_keys, content_keys, messages):
+                file_id = helpers_file_ids.sent_file_id(message)
+                file_ids.put(url_key, file_id)
+                file_ids.put(content_key, file_id)
+            sent.extend(messages)
+        return sent
+
+    async def _upload_album(self, payload: dict, captions, bodies: list, content_keys: list, start: int) -> Tuple[int, dict]:
+        """Upload an album, sending images whose bytes are already on Telegram by file_id."""
+        file_ids = helpers_file_ids.get_file_id_cache()
+        cached = [file_ids.get(key) for key in content_keys]
+        sources = [file_id or f"attach://photo{index}" for index, file_id in enumerate(cached)]
+        files = [(f"photo{index}", f"image{start + index}.jpg", body) for index, body in enumerate(bodies) if not cached[index]]
+        status, result = await self.call("sendMediaGroup", dict(payload, media=_album(sources, captions)), files=files)
+        if status == 400 and any(cached) and helpers_file_ids.is_stale_file_id_error(result.get("description")):
+            # One of the cached ids went stale; forget them and upload everything
+            for key, file_id in zip(content_keys, cached):
+                if file_id:
+                    file_ids.invalidate(key)
+            sources = [f"attach://photo{index}" for index in range(len(bodies))]
+            files = [(f"photo{index}", f"image{start + index}.jpg", body) for index, body in enumerate(bodies)]
+            status, result = await self.call("sendMediaGroup", dict(payload, media=_album(sources, captions)), files=files)
+        return status, result
+
+
+def _album(sources: List[str], captions: List[Optional[str]]) -> List[dict]:
+    media = [{"type": "photo", "media": source} for source in sources]
+    for item, caption in zip(media, captions):
+        if caption:
+            item.update(caption=caption, parse_mode="HTML")
+    return media
+
+
+async def _read_body(response: aiohttp.ClientResponse, max_bytes: Optional[int], spool: bool):
+    if max_bytes is not None and helpers_telegram_api.too_large(response.content_length, max_bytes):
+        raise ValueError(f"source is larger than the {max_bytes} byte upload limit")
+    body = tempfile.SpooledTemporaryFile(max_size=helpers_telegram_api.SPOOL_MAX_MEMORY) if spool else io.BytesIO()
+    size = 0
+    try:
+        async for chunk in response.content.iter_chunked(helpers_telegram_api.DOWNLOAD_CHUNK_BYTES):
+            size += len(chunk)
+            if max_bytes is not None and size > max_bytes:
+                raise ValueError(f"source is larger than the {max_bytes} byte upload limit")
+            body.write(chunk)
+    except BaseException:
+        body.close()
+        raise
+    if not spool:
+        return body.getvalue()
+    body.seek(0)
+    return body
+
+
+def _form(fields: dict, files: Sequence[Tuple]) -> aiohttp.FormData:
+    # Built per attempt: a FormData body can only be sent once
+    form = aiohttp.FormData()
+    for name, value in fields.items():
+        form.add_field(name, value if isinstance(value, str) else json.dumps(value))
+    for field, filename, body in files:
+        if hasattr(body, "seek"):
+            body.seek(0)  # rewind a file left at its end by a previous attempt
+        form.add_field(field, body, filename=filename)
+    return form
+
+
+def _checked(operation: str, status: int, result: dict) -> dict:
+    if status != 200:
+        logging.error("Telegram API returned an error: %s", result)
+        raise RuntimeError(f"{operation} failed: {status} {result.get('description', '')}")
+    return result
+
+
+def get_client() -> AsyncTelegramAPI:
+    """Lazily build the process-wide async client from the same settings as helpers_telegram_api."""
+    global _client
+    if _client is not None:
+        return _client
+
+    with _client_lock:
+        if _client is None:
+            bot_token = os.getenv("BOT_TOKEN")
+            if not bot_token:
+                raise RuntimeError("BOT_TOKEN must be set to call the Telegram Bot API")
+            _client = AsyncTelegramAPI(
+                bot_token,
+                api_root=os.getenv("TELEGRAM_API_ROOT", "https://api.telegram.org"),
+                pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", 20)),
+                read_timeout=float(os.getenv("TELEGRAM_TIMEOUT_SECONDS", 10)),
+                upload_timeout=float(os.getenv("TELEGRAM_UPLOAD_TIMEOUT_SECONDS", 60)),
+                max_retries=int(os.getenv("TELEGRAM_MAX_RETRIES", 3)),
+                scheduler=helpers_outbound.get_scheduler(),
+            )
+    return _client
@@ -6,12 +6,14 @@ from src import create_messages as msgs
 from src import helpers_telegram
 from src import helpers_openai
 from src import helpers_google
+from src import helpers_metrics
 
 def extract_test_results_from_image(image_url, chat_id, message_thread_id):
     """Manually trigger test results extraction for bridged images"""
     try:
         # Download the image
-        response = requests.get(image_url)
+        with helpers_metrics.dependency_call("http", "image_download") as call:
+            response = call.record(requests.get(image_url))
         response.raise_for_status()
         
         # Save to temp file
@@ -21,10 +23,12 @@ def extract_test_results_from_image(image_url, chat_id, message_thread_id):
             f.write(response.content)
         
         # Process with OpenAI
-        extracted_test_data = helpers_openai.extract_data_with_openai(local_path, "")
+        extraction = helpers_openai.extract_test_results(local_path, "")
+        extracted_test_data = extraction.results
         
         if extracted_test_data:
             # Process same as regular test results
+            data_rows = []
             for sample in extracted_test_data:
                 data_row = (
                     [sample.vendor] + [sample.peptide] + [sample.test_date] + [sample.batch] +
@@ -32,7 +36,8 @@ def extract_test_results_from_image(image_url, chat_id, message_thread_id):
                     [sample.tfa_present] + [sample.endotoxin] + [sample.test_lab] +
                     [local_path.split('/')[-1]] + [sample.test_link] + [sample.test_key] + [sample.test_task]
                 )
-                helpers_google.append_to_sheet(data_row)
+                data_rows.append(data_row)
+            msgs.record_test_results(extraction, data_rows)
             
             # Generate summary message
             if sample.mass_mg:
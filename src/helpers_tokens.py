@@ -0,0 +1,82 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+TOKEN_VERSION = "v1"
+
+
+class InvalidToken(ValueError):
+    """The token is malformed, was not signed with our secret, or has expired."""
+
+
+@dataclass(frozen=True)
+class TokenClaims:
+    user_id: str
+    issued_at: int
+    expires_at: int
+
+    def remaining(self, now: Optional[float] = None) -> float:
+        return self.expires_at - (time.time() if now is None else now)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(secret: str, signed: str) -> str:
+    return _b64encode(hmac.new(secret.encode(), signed.encode(), hashlib.sha256).digest())
+
+
+def issue_token(secret: str, user_id, ttl_seconds: float, now: Optional[float] = None) -> Tuple[str, TokenClaims]:
+    """Sign a membership token for ``user_id``; returns ``(token, TokenClaims)``."""
+    issued_at = int(time.time() if now is None else now)
+    claims = TokenClaims(str(user_id), issued_at, issued_at + int(ttl_seconds))
+    payload = _b64encode(json.dumps({"uid": claims.user_id, "iat": claims.issued_at, "exp": claims.expires_at}, separators=(",", ":")).encode())
+    signed = f"{TOKEN_VERSION}.{payload}"
+    return f"{signed}.{_sign(secret, signed)}", claims
+
+
+def verify_token(secret: str, token: str, now: Optional[float] = None) -> TokenClaims:
+    """Check a token's signature and expiry without any I/O; raises InvalidToken."""
+    try:
+        version, payload, signature = (token or "").split(".")
+    except ValueError:
+        raise InvalidToken("malformed token")
+    if version != TOKEN_VERSION:
+        raise InvalidToken("unsupported token version")
+    try:
+        # Compare bytes: compare_digest raises TypeError for non-ASCII str, and the token is client input
+        valid = hmac.compare_digest(signature.encode("utf-8"), _sign(secret, f"{version}.{payload}").encode())
+    except UnicodeError:
+        raise InvalidToken("malformed token")
+    if not valid:
+        raise InvalidToken("bad signature")
+    try:
+        data = json.loads(_b64decode(payload))
+        claims = TokenClaims(str(data["uid"]), int(data["iat"]), int(data["exp"]))
+    except (ValueError, KeyError, TypeError):
+        raise InvalidToken("malformed payload")
+    if claims.remaining(now) <= 0:
+        raise InvalidToken("token expired")
+    return claims
+
+
+def get_token_settings() -> Optional[dict]:
+    """LOGIN_TOKEN_* settings, or None when LOGIN_TOKEN_SECRET is unset (tokens disabled)."""
+    secret = os.getenv("LOGIN_TOKEN_SECRET")
+    if not secret:
+        return None
+    return {
+        "secret": secret,
+        "ttl_seconds": float(os.getenv("LOGIN_TOKEN_TTL_SECONDS", 3600)),
+        "refresh_seconds": float(os.getenv("LOGIN_TOKEN_REFRESH_SECONDS", 600)),
+    }
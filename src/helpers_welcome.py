@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from src.helpers_spam import SlidingWindowCounter
+
+_aggregator: Optional["WelcomeAggregator"] = None
+_aggregator_lock = threading.Lock()
+
+
+class WelcomeAggregator:
+    """Coalesce welcome messages while members join faster than ``individual_threshold`` per window.
+
+    At normal join rates each member is welcomed immediately on their own.
+    Once a chat sees more joins than that within ``window_seconds``, new
+    members are buffered and welcomed together when the window closes or the
+    batch reaches ``max_mentions``, so an invite post costs a handful of
+    sendMessage calls instead of one per join.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[object, List[dict]], None],
+        window_seconds: float = 30,
+        max_mentions: int = 20,
+        individual_threshold: int = 3,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.send = send
+        self.window_seconds = float(window_seconds)
+        self.max_mentions = max(1, int(max_mentions))
+        self.individual_threshold = max(0, int(individual_threshold))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._rates: Dict[object, SlidingWindowCounter] = {}
+        self._pending: Dict[object, List[dict]] = {}
+        self._timers: Dict[object, threading.Timer] = {}
+        self.welcomed = 0
+        self.messages_sent = 0
+
+    def add(self, chat_id, user: dict):
+        """Welcome ``user`` now, or queue them into this chat's current batch."""
+        if self.window_seconds <= 0:
+            self._send(chat_id, [user])
+            return
+
+        now = self._clock()
+        batch = None
+        with self._lock:
+            rate = self._rates.get(chat_id)
+            if rate is None:
+                rate = self._rates[chat_id] = SlidingWindowCounter(self.window_seconds, now)
+            joins = rate.add(now)
+
+            pending = self._pending.get(chat_id)
+            if pending is None and joins <= self.individual_threshold:
+                batch = [user]
+            else:
+                if pending is None:
+                    pending = self._pending[chat_id] = []
+                    timer = threading.Timer(self.window_seconds, self.flush, args=(chat_id,))
+                    timer.daemon = True
+                    self._timers[chat_id] = timer
+                    timer.start()
+                pending.append(user)
+                if len(pending) >= self.max_mentions:
+                    batch = self._take(chat_id)
+
+        if batch:
+            self._send(chat_id, batch)
+
+    def _take(self, chat_id) -> List[dict]:
+        timer = self._timers.pop(chat_id, None)
+        if timer is not None:
+            timer.cancel()
+        return self._pending.pop(chat_id, [])
+
+    def flush(self, chat_id):
+        with self._lock:
+            batch = self._take(chat_id)
+        if batch:
+            self._send(chat_id, batch)
+
+    def flush_all(self):
+        with self._lock:
+            chat_ids = list(self._pending)
+        for chat_id in chat_ids:
+            self.flush(chat_id)
+
+    def _send(self, chat_id, users: List[dict]):
+        try:
+            self.send(chat_id, users)
+            with self._lock:
+                self.welcomed += len(users)
+                self.messages_sent += 1
+            if len(users) > 1:
+                logging.info("Welcomed %d new members in one message in chat %s", len(users), chat_id)
+        except Exception as e:
+            logging.error("Failed to send welcome to %d member(s) in chat %s: %s", len(users), chat_id, e)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": sum(len(users) for users in self._pending.values()),
+                "welcomed": self.welcomed,
+                "messages_sent": self.messages_sent,
+            }
+
+
+def get_welcome_aggregator(send: Callable[[object, List[dict]], None]) -> WelcomeAggregator:
+    """Lazily build the process-wide aggregator from WELCOME_BATCH_* settings."""
+    global _aggregator
+    if _aggregator is not None:
+        return _aggregator
+
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = WelcomeAggregator(
+                send,
+                window_seconds=float(os.getenv("WELCOME_BATCH_SECONDS", 30)),
+                max_mentions=int(os.getenv("WELCOME_BATCH_MAX_MENTIONS", 20)),
+                individual_threshold=int(os.getenv("WELCOME_BATCH_THRESHOLD", 3)),
+            )
+            # Don't drop members still waiting in a batch on shutdown
+            atexit.register(_aggregator.flush_all)
+    return _aggregator
@@ -0,0 +1,162 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+LANE_MODERATION = "moderation"
+LANE_EXTRACTION = "extraction"
+
+_dispatcher: Optional["UpdateDispatcher"] = None
+
+
+class WorkerLane:
+    """A bounded queue drained by a fixed number of worker threads."""
+
+    def __init__(self, name: str, handler: Callable[[dict], None], workers: int, max_queue: int):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self._handler = handler
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._threads = []
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def start(self):
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._run, daemon=True, name=f"{self.name}-worker-{idx + 1}")
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, update: dict) -> bool:
+        try:
+            self._queue.put_nowait((time.monotonic(), update))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def _run(self):
+        while True:
+            enqueued_at, update = self._queue.get()
+            waited = time.monotonic() - enqueued_at
+            with self._lock:
+                self.busy += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            try:
+                self._handler(update)
+                with self._lock:
+                    self.processed += 1
+            except Exception as exc:
+                with self._lock:
+                    self.failed += 1
+                logging.error(f"Error processing update {update.get('update_id')} in {self.name} lane: {exc}")
+            finally:
+                with self._lock:
+                    self.busy -= 1
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            started = self.processed + self.failed
+            return {
+                "workers": self.workers,
+                "depth": self._queue.qsize(),
+                "busy": self.busy,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "wait_seconds_total": self.wait_seconds_total,
+                "wait_seconds_avg": self.wait_seconds_total / started if started else 0.0,
+                "wait_seconds_max": self.wait_seconds_max,
+            }
+
+
+class UpdateDispatcher:
+    """Routes updates to the fast moderation lane or the slow extraction lane."""
+
+    def __init__(
+        self,
+        handler: Callable[[dict], None],
+        classify: Callable[[dict], str],
+        moderation_workers: int,
+        extraction_workers: int,
+        max_queue: int,
+    ):
+        self._classify = classify
+        self.lanes = {
+            LANE_MODERATION: WorkerLane(LANE_MODERATION, handler, moderation_workers, max_queue),
+            LANE_EXTRACTION: WorkerLane(LANE_EXTRACTION, handler, extraction_workers, max_queue),
+        }
+
+    def start(self):
+        for lane in self.lanes.values():
+            lane.start()
+
+    def submit(self, update: dict) -> bool:
+        lane_name = self._classify(update)
+        lane = self.lanes.get(lane_name, self.lanes[LANE_MODERATION])
+        accepted = lane.submit(update)
+        if not accepted:
+            logging.warning(f"{lane.name} queue is full; rejecting update {update.get('update_id')}")
+        return accepted
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+
+def workers_enabled() -> bool:
+    return _dispatcher is not None
+
+
+def start_update_workers(handler: Callable[[dict], None], classify: Callable[[dict], str]):
+    """Start the update worker pool when UPDATE_INGESTION_MODE=queue."""
+    global _dispatcher
+
+    mode = os.getenv("UPDATE_INGESTION_MODE", "inline").strip().lower()
+    if mode != "queue":
+        logging.info("UPDATE_INGESTION_MODE is '%s'; updates are processed inline", mode)
+        return None
+
+    if _dispatcher is not None:
+        logging.debug("Update workers already running")
+        return _dispatcher
+
+    moderation_workers = int(os.getenv("UPDATE_MODERATION_WORKERS", 4))
+    extraction_workers = int(os.getenv("UPDATE_EXTRACTION_WORKERS", 2))
+    max_queue = int(os.getenv("UPDATE_QUEUE_SIZE", 500))
+
+    logging.info(
+        "Starting update workers: moderation=%d, extraction=%d, max_queue=%d",
+        moderation_workers,
+        extraction_workers,
+        max_queue,
+    )
+    _dispatcher = UpdateDispatcher(handler, classify, moderation_workers, extraction_workers, max_queue)
+    _dispatcher.start()
+    return _dispatcher
+
+
+def dispatch_update(update: dict) -> bool:
+    """Queue an update for background processing. Returns False if the lane is full."""
+    if _dispatcher is None:
+        raise RuntimeError("Update workers are not running")
+    return _dispatcher.submit(update)
+
+
+def worker_stats() -> Dict[str, Dict[str, float]]:
+    if _dispatcher is None:
+        return {}
+    return _dispatcher.stats()
@@ -0,0 +1,18 @@
+"""Shared fixtures for the unit tests."""
+
+import pytest
+
+
+class FakeClock:
+    """Stand-in for time.monotonic / time.time; tests move ``now`` by hand."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
@@ -0,0 +1,101 @@
+"""Unit tests for the update_id dedup window in helpers_dedup.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_dedup.py -q
+"""
+
+import pytest
+
+from src.helpers_dedup import UpdateDeduplicator
+
+
+def _message_update(update_id, message_id=10, chat_id=-100, update_type="message"):
+    return {
+        "update_id": update_id,
+        update_type: {"message_id": message_id, "chat": {"id": chat_id}, "text": "hi"},
+    }
+
+
+def test_redelivered_update_is_dropped():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    assert not dedup.is_duplicate(_message_update(1), now=100)
+    assert dedup.is_duplicate(_message_update(1), now=101)
+    assert dedup.duplicates == 1
+
+
+def test_same_message_under_new_update_id_is_dropped_only_with_message_keys():
+    keyed = UpdateDeduplicator(window_seconds=60, key_on_message=True)
+    assert not keyed.is_duplicate(_message_update(1), now=100)
+    assert keyed.is_duplicate(_message_update(2), now=101)
+
+    unkeyed = UpdateDeduplicator(window_seconds=60, key_on_message=False)
+    assert not unkeyed.is_duplicate(_message_update(1), now=100)
+    assert not unkeyed.is_duplicate(_message_update(2), now=101)
+
+
+def test_edit_of_seen_message_is_not_a_duplicate():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    assert not dedup.is_duplicate(_message_update(1), now=100)
+    assert not dedup.is_duplicate(_message_update(2, update_type="edited_message"), now=101)
+
+
+def test_repeat_edits_are_distinct_but_redelivered_edits_are_dropped():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    first_edit = _message_update(2, update_type="edited_message")
+    first_edit["edited_message"]["edit_date"] = 1000
+    second_edit = _message_update(3, update_type="edited_message")
+    second_edit["edited_message"]["edit_date"] = 1005
+    redelivered = _message_update(4, update_type="edited_message")
+    redelivered["edited_message"]["edit_date"] = 1005
+
+    assert not dedup.is_duplicate(first_edit, now=100)
+    assert not dedup.is_duplicate(second_edit, now=101)
+    assert dedup.is_duplicate(redelivered, now=102)
+
+
+def test_entries_expire_after_window():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    assert not dedup.is_duplicate(_message_update(1), now=100)
+    assert not dedup.is_duplicate(_message_update(1), now=161)
+
+
+def test_memory_cap_evicts_oldest_keys():
+    dedup = UpdateDeduplicator(window_seconds=600, max_entries=4, key_on_message=False)
+    for update_id in range(6):
+        assert not dedup.is_duplicate({"update_id": update_id}, now=100 + update_id)
+    assert len(dedup) == 4
+    assert not dedup.is_duplicate({"update_id": 0}, now=110)
+    assert dedup.is_duplicate({"update_id": 5}, now=110)
+
+
+def test_forget_allows_redelivery():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    update = _message_update(1)
+    assert not dedup.is_duplicate(update, now=100)
+    dedup.forget(update)
+    assert not dedup.is_duplicate(update, now=101)
+
+
+def test_update_that_fails_inline_is_handled_on_redelivery():
+    dedup = UpdateDeduplicator(window_seconds=60)
+    update = _message_update(1)
+    assert not dedup.is_duplicate(update, now=100)
+    with pytest.raises(RuntimeError):
+        with dedup.forget_on_error(update):
+            raise RuntimeError("handler failed")
+    assert not dedup.is_duplicate(update, now=101)
+
+    with dedup.forget_on_error(update):
+        pass
+    assert dedup.is_duplicate(update, now=102)
+
+
+def test_state_survives_restart(tmp_path):
+    state_path = tmp_path / "dedup.json"
+    dedup = UpdateDeduplicator(window_seconds=3600, state_path=state_path)
+    assert not dedup.is_duplicate(_message_update(1))
+    dedup.persist()
+
+    restarted = UpdateDeduplicator(window_seconds=3600, state_path=state_path)
+    assert restarted.is_duplicate(_message_update(1))
@@ -0,0 +1,76 @@
+"""Unit tests for the test-result extraction cache in helpers_extraction_cache.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_extraction_cache.py -q
+"""
+
+from src import helpers_extraction_cache as extraction_cache
+
+RESULT = {"vendor": "VA", "peptide": "Tirzepatide", "test_date": "05/02/2025", "expected_mass_mg": 60, "mass_mg": 58.4}
+
+
+def test_keys_change_with_model_and_prompt_but_not_file_name(tmp_path):
+    first, repost = tmp_path / "a.pdf", tmp_path / "b.pdf"
+    first.write_bytes(b"%PDF same report")
+    repost.write_bytes(b"%PDF same report")
+    digest = extraction_cache.image_digest(str(first))
+
+    assert digest == extraction_cache.image_digest(str(repost))
+    assert extraction_cache.extraction_key(digest, "m1", "p1") != extraction_cache.extraction_key(digest, "m2", "p1")
+    assert extraction_cache.extraction_key(digest, "m1", "p1") != extraction_cache.extraction_key(digest, "m1", "p2")
+
+
+def test_hits_expire_and_later_extractions_keep_the_first_result(clock):
+    cache = extraction_cache.ExtractionCache(ttl_seconds=60, clock=clock)
+    assert cache.get("k") is None
+
+    assert cache.put("k", [RESULT]) == [RESULT]
+    assert cache.put("k", [dict(RESULT, mass_mg=1.0)]) == [RESULT]
+    assert cache.get("k") == [RESULT]
+
+    clock.now += 61
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (1, 2, 1)
+    assert stats["hit_ratio"] == 1 / 3
+
+
+def test_persisted_entries_survive_a_restart_until_invalidated(tmp_path):
+    state_path = tmp_path / "extractions.json"
+    cache = extraction_cache.ExtractionCache(state_path=state_path)
+    cache.put("k", [RESULT, RESULT])
+    cache.persist()
+
+    restored = extraction_cache.ExtractionCache(state_path=state_path)
+    assert restored.get("k") == [RESULT, RESULT]
+
+    restored.invalidate()
+    assert restored.get("k") is None
+    assert restored.stats()["invalidated"] == 1
+
+
+def test_reposts_of_unsupported_or_incomplete_extractions_reach_the_model_again():
+    cache = extraction_cache.ExtractionCache()
+    answers = [[], [dict(RESULT, test_date="")], [RESULT], [dict(RESULT, mass_mg=1.0)]]
+    model_calls = []
+
+    def extract(key):
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        model_calls.append(key)
+        return cache.put_if_complete(key, answers[len(model_calls) - 1])
+
+    assert extract("k") == []
+    assert extract("k") == [dict(RESULT, test_date="")]
+    assert extract("k") == [RESULT]
+    assert extract("k") == [RESULT]
+    assert model_calls == ["k", "k", "k"]
+
+
+def test_the_shared_cache_stays_in_memory_unless_a_state_path_is_set(monkeypatch):
+    monkeypatch.delenv("EXTRACTION_CACHE_STATE_PATH", raising=False)
+    monkeypatch.setattr(extraction_cache, "_cache", None)
+
+    assert extraction_cache.get_extraction_cache().state_path is None
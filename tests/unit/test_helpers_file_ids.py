@@ -0,0 +1,66 @@
+"""Unit tests for the persistent media file_id cache in helpers_file_ids.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_file_ids.py -q
+"""
+
+import io
+
+from src import helpers_file_ids as file_ids
+
+
+def test_sent_file_id_prefers_the_largest_photo():
+    assert file_ids.sent_file_id({"photo": [{"file_id": "small"}, {"file_id": "large"}]}) == "large"
+    assert file_ids.sent_file_id({"animation": {"file_id": "gif"}, "document": {"file_id": "doc"}}) == "gif"
+    assert file_ids.sent_file_id({"text": "hi"}) is None
+
+
+def test_content_key_matches_for_bytes_and_files_and_rewinds():
+    stream = io.BytesIO(b"logo bytes")
+    stream.read()
+    assert file_ids.content_key(stream) == file_ids.content_key(b"logo bytes")
+    assert stream.tell() == 0
+    assert file_ids.content_key(b"other") != file_ids.content_key(b"logo bytes")
+
+
+def test_cache_is_bounded_lru_and_invalidates():
+    cache = file_ids.FileIdCache(max_entries=2)
+    cache.put("a", "id-a")
+    cache.put("b", "id-b")
+    assert cache.get("a") == "id-a"
+    cache.put("c", "id-c")
+    assert cache.get("b") is None
+    cache.invalidate("a")
+    assert cache.get("a") is None
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 2, "invalidated": 1, "evicted": 1}
+
+
+def test_cache_survives_a_restart_in_lru_order(tmp_path):
+    state_path = tmp_path / "file_ids.json"
+    cache = file_ids.FileIdCache(max_entries=2, state_path=state_path)
+    cache.put("old", "id-old")
+    cache.put("new", "id-new")
+    cache.get("old")
+    cache.persist()
+
+    restored = file_ids.FileIdCache(max_entries=2, state_path=state_path)
+    restored.put("newest", "id-newest")
+    # "old" was used after "new" before the restart, so "new" is the one evicted
+    assert restored.get("new") is None
+    assert restored.get("old") == "id-old"
+
+
+def test_the_shared_cache_stays_in_memory_unless_a_state_path_is_set(monkeypatch):
+    monkeypatch.delenv("TELEGRAM_FILE_ID_STATE_PATH", raising=False)
+    monkeypatch.setattr(file_ids, "_cache", None)
+
+    assert file_ids.get_file_id_cache().state_path is None
+
+
+def test_only_file_id_errors_count_as_stale():
+    assert file_ids.is_stale_file_id_error("Bad Request: wrong file identifier/HTTP URL specified")
+    assert file_ids.is_stale_file_id_error("Bad Request: FILE_REFERENCE_EXPIRED")
+    assert not file_ids.is_stale_file_id_error("Bad Request: message thread not found")
+    assert not file_ids.is_stale_file_id_error("Bad Request: can't parse entities: unsupported start tag")
+    assert not file_ids.is_stale_file_id_error(None)
@@ -0,0 +1,59 @@
+"""Unit tests for the queue-backed logging helpers in helpers_logging.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_logging.py -q
+"""
+
+import json
+import logging
+import queue
+import random
+
+from src import helpers_logging
+
+
+def _record(message, level=logging.INFO, category=None, args=None):
+    record = logging.LogRecord("bot", level, __file__, 1, message, args, None)
+    if category:
+        record.category = category
+    return record
+
+
+def test_parse_sample_rates_overrides_defaults_and_clamps():
+    rates = helpers_logging.parse_sample_rates("raw_update=0.5, model_response=7, junk, message_body=x")
+    assert rates["raw_update"] == 0.5
+    assert rates["model_response"] == 1.0
+    assert rates["message_body"] == helpers_logging.DEFAULT_SAMPLE_RATES["message_body"]
+
+
+def test_sampling_keeps_a_fraction_but_never_drops_warnings():
+    sampler = helpers_logging.SamplingFilter({"raw_update": 0.1, "off": 0.0}, rng=random.Random(1))
+    kept = sum(sampler.filter(_record("x", category="raw_update")) for _ in range(5000))
+    assert 350 < kept < 650
+    assert not sampler.filter(_record("x", category="off"))
+    assert sampler.filter(_record("x", level=logging.WARNING, category="off"))
+    assert sampler.filter(_record("uncategorized"))
+
+
+def test_queue_handler_truncates_formatted_message():
+    log_queue = queue.SimpleQueue()
+    handler = helpers_logging.TruncatingQueueHandler(log_queue, max_chars=10)
+    handler.emit(_record("body: %s", args=("y" * 50,)))
+    record = log_queue.get_nowait()
+    assert record.getMessage() == "body: yyyy... [truncated 46 chars]"
+
+
+def test_json_formatter_includes_correlation_fields():
+    record = _record("hello", category="raw_update")
+    with helpers_logging.update_log_context({"update_id": 42, "message": {"chat": {"id": -100}}}):
+        helpers_logging.CorrelationFilter().filter(record)
+    payload = json.loads(helpers_logging.JsonFormatter().format(record))
+    assert payload["msg"] == "hello"
+    assert payload["update_id"] == 42
+    assert payload["chat_id"] == -100
+    assert payload["category"] == "raw_update"
+
+    outside = _record("later")
+    helpers_logging.CorrelationFilter().filter(outside)
+    assert outside.update_id is None
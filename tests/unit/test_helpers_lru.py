@@ -0,0 +1,19 @@
+"""Unit tests for the bounded LRU mapping in helpers_lru.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_lru.py -q
+"""
+
+from src.helpers_lru import LRUDict
+
+
+def test_touch_creates_once_and_evicts_the_least_recently_used():
+    entries = LRUDict(2)
+    assert entries.touch("a", lambda: 1) == 1
+    entries.touch("b", lambda: 2)
+    assert entries.touch("a", lambda: 99) == 1
+
+    entries.touch("c", lambda: 3)
+    assert list(entries) == ["a", "c"]
+    assert entries.evicted == 1
@@ -0,0 +1,108 @@
+"""Unit tests for the per-update media fetcher in helpers_media.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_media.py -q
+"""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src import helpers_media as media  # noqa: E402
+
+
+class FakeJSON:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+class FakeDownload:
+    def __init__(self, body):
+        self.body = body
+        self.headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        return iter([self.body[i:i + chunk_size] for i in range(0, len(self.body), chunk_size)])
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, body=b"coa image bytes", file_size=None):
+        self.body = body
+        self.file_size = file_size
+        self.get_file_calls = 0
+        self.downloads = 0
+
+    def call(self, method, params=None, http_method="POST"):
+        assert method == "getFile"
+        self.get_file_calls += 1
+        result = {"file_id": params["file_id"], "file_path": f"photos/{params['file_id']}.jpg"}
+        if self.file_size is not None:
+            result["file_size"] = self.file_size
+        return FakeJSON({"ok": True, "result": result})
+
+    def download(self, file_path, stream=False):
+        self.downloads += 1
+        return FakeDownload(self.body)
+
+
+@pytest.fixture(autouse=True)
+def fresh_file_paths(monkeypatch, clock):
+    monkeypatch.setattr(media, "FILE_PATHS", media.FilePathCache(clock=clock))
+
+
+def _photo_message(file_id="AgAD", file_size=None):
+    sizes = [{"file_id": "thumb"}, {"file_id": file_id}]
+    if file_size is not None:
+        sizes[-1]["file_size"] = file_size
+    return {"message_id": 1, "photo": sizes}
+
+
+def test_every_consumer_shares_one_resolve_and_download(tmp_path):
+    client = FakeClient()
+    with media.message_media(client, _photo_message()) as handle:
+        assert handle.file_path == "photos/AgAD.jpg"
+        handle.save(str(tmp_path / "extract.jpg"))
+        assert handle.read() == b"coa image bytes"
+
+    assert (tmp_path / "extract.jpg").read_bytes() == b"coa image bytes"
+    assert client.get_file_calls == 1
+    assert client.downloads == 1
+
+
+def test_get_file_results_are_reused_until_they_expire(clock):
+    client = FakeClient()
+    assert media.message_media(client, _photo_message()).file_path == "photos/AgAD.jpg"
+    assert media.message_media(client, _photo_message()).file_path == "photos/AgAD.jpg"
+    assert client.get_file_calls == 1
+
+    clock.now += media.FILE_PATH_TTL_SECONDS
+    media.message_media(client, _photo_message()).file_path
+    assert client.get_file_calls == 2
+
+
+def test_oversized_media_is_refused_before_download():
+    client = FakeClient()
+    handle = media.MediaFile(client, "big", "scan.pdf", file_size=100, max_bytes=10)
+    with pytest.raises(ValueError):
+        handle.read()
+    assert client.downloads == 0
+
+    handle = media.MediaFile(FakeClient(body=b"x" * 11), "unsized", "scan.pdf", max_bytes=10)
+    with pytest.raises(ValueError):
+        handle.read()
+
+
+def test_messages_without_media_have_no_handle():
+    assert media.message_media(FakeClient(), {"message_id": 1, "text": "hi"}) is None
+    document = {"document": {"file_id": "BQAD", "file_name": "coa.pdf"}}
+    assert media.message_media(FakeClient(), document).filename == "coa.pdf"
@@ -0,0 +1,80 @@
+"""Unit tests for the membership and member-count caches in helpers_membership.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_membership.py -q
+"""
+
+from src import helpers_membership as membership
+
+
+def test_members_and_non_members_expire_on_their_own_ttls(clock):
+    cache = membership.MembershipCache(positive_ttl=600, negative_ttl=60, clock=clock)
+    cache.put(1, True)
+    cache.put(2, False)
+    assert cache.get(1) is True and cache.get("2") is False
+
+    clock.now = 61
+    assert cache.get(2) is None
+    assert cache.get(1) is True
+    clock.now = 601
+    assert cache.get(1) is None
+    assert cache.stats() == {"entries": 2, "hits": 3, "misses": 2, "updates": 0}
+
+
+def test_chat_member_updates_win_over_slower_lookups(clock):
+    cache = membership.MembershipCache(clock=clock)
+    lookup_started = clock()
+    clock.now = 1
+    cache.apply_status(7, "left")
+    # The getChatMember answer that began before the leave arrives last
+    cache.put(7, True, observed_at=lookup_started)
+    assert cache.get(7) is False
+
+    cache.apply_status(7, "member")
+    assert cache.get(7) is True
+    cache.apply_status(7, "kicked")
+    assert cache.get(7) is False
+
+
+def test_cache_is_bounded(clock):
+    cache = membership.MembershipCache(max_entries=2, clock=clock)
+    for user_id in range(3):
+        cache.put(user_id, True)
+    assert cache.get(0) is None
+    assert cache.get(2) is True
+
+
+def test_member_count_is_seeded_once_then_follows_updates(clock):
+    fetches = []
+
+    def fetch(chat_id):
+        fetches.append(chat_id)
+        return 10
+
+    counts = membership.MemberCountCache(clock=clock)
+    assert counts.get(-100, fetch) == 10
+    counts.apply_update(-100, {"status": "left"}, {"status": "member"})
+    counts.apply_update(-100, {"status": "member"}, {"status": "restricted", "is_member": True})
+    counts.apply_update(-100, {"status": "member"}, {"status": "kicked"})
+    counts.apply_update(-100, {"status": "left"}, {"status": "member"})
+    # Chats never asked about aren't tracked
+    counts.apply_update(-200, {"status": "left"}, {"status": "member"})
+
+    assert counts.get(-100, fetch) == 11
+    assert fetches == [-100]
+    assert counts.counts() == {"-100": 11}
+
+
+def test_reconcile_refetches_stale_counts_and_records_drift(clock):
+    counts = membership.MemberCountCache(reconcile_seconds=3600, clock=clock)
+    counts.get(-100, lambda chat_id: 10)
+    counts.apply_update(-100, {"status": "left"}, {"status": "member"})
+
+    counts.reconcile_stale(lambda chat_id: 99)
+    assert counts.get(-100, None) == 11
+
+    clock.now = 3600
+    counts.reconcile_stale(lambda chat_id: 13)
+    assert counts.get(-100, None) == 13
+    assert counts.stats()["drift"] == 2
@@ -0,0 +1,74 @@
+"""Unit tests for the in-process metrics in helpers_metrics.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_metrics.py -q
+"""
+
+import pytest
+
+from src import helpers_metrics as metrics
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
+
+
+def test_span_records_duration_and_errors(registry):
+    with metrics.span("moderation"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.span("moderation"):
+            raise RuntimeError("boom")
+
+    assert registry.histogram(metrics.STAGE_SECONDS, stage="moderation").count == 2
+    assert registry.counter_value(metrics.STAGE_ERRORS, stage="moderation") == 1
+
+
+def test_dependency_call_counts_errors_and_throttling(registry):
+    for status in (200, 429, 500):
+        with metrics.dependency_call("telegram", "sendMessage") as call:
+            call.record(FakeResponse(status))
+    metrics.count_retry("telegram", "sendMessage")
+
+    labels = {"service": "telegram", "operation": "sendMessage"}
+    assert registry.counter_value(metrics.DEPENDENCY_REQUESTS, **labels) == 3
+    assert registry.counter_value(metrics.DEPENDENCY_ERRORS, **labels) == 2
+    assert registry.counter_value(metrics.DEPENDENCY_THROTTLED, **labels) == 1
+    assert registry.counter_value(metrics.DEPENDENCY_RETRIES, **labels) == 1
+
+
+def test_dependency_call_reads_status_from_exceptions(registry):
+    class RateLimited(Exception):
+        status_code = 429
+
+    with pytest.raises(RateLimited):
+        with metrics.dependency_call("openai", "chat.completions"):
+            raise RateLimited()
+
+    labels = {"service": "openai", "operation": "chat.completions"}
+    assert registry.counter_value(metrics.DEPENDENCY_ERRORS, **labels) == 1
+    assert registry.counter_value(metrics.DEPENDENCY_THROTTLED, **labels) == 1
+
+
+def test_render_is_prometheus_text(registry):
+    registry.observe(metrics.STAGE_SECONDS, 0.003, stage="parse")
+    registry.inc(metrics.DEPENDENCY_REQUESTS, service="telegram", operation="getFile")
+    registry.register_gauges(lambda: [("bot_worker_depth", {"lane": "moderation"}, 4)])
+
+    text = registry.render()
+    assert "# TYPE bot_stage_duration_seconds histogram" in text
+    assert 'bot_stage_duration_seconds_bucket{stage="parse",le="0.0025"} 0' in text
+    assert 'bot_stage_duration_seconds_bucket{stage="parse",le="0.005"} 1' in text
+    assert 'bot_stage_duration_seconds_bucket{stage="parse",le="+Inf"} 1' in text
+    assert 'bot_stage_duration_seconds_count{stage="parse"} 1' in text
+    assert 'bot_dependency_requests_total{operation="getFile",service="telegram"} 1' in text
+    assert 'bot_worker_depth{lane="moderation"} 4' in text
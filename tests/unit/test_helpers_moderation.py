@@ -0,0 +1,345 @@
+"""Unit tests for the compiled moderation rules in helpers_moderation.py.
+
+The compiled ruleset must pick the same rule as the original nested loops
+in bot.webhook(), so each test compares against a reference copy of them.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_moderation.py -q
+"""
+
+import dataclasses
+import re
+import unicodedata
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src import helpers_moderation as moderation
+from src import helpers_spam
+
+MOD_TOPICS_PATH = Path(__file__).resolve().parents[2] / "mod_topics" / "moderated_topics.yml"
+
+SAMPLE_TEXTS = [
+    "",
+    "hey everyone, what's a good starting dose of tirz?",
+    "Anyone tried SNP lately?",
+    "shanghai nexa pharma is back",
+    "ｓｎｐ in fullwidth",
+    "nexaphh or nexa?",
+    "annex building",
+    "where can I get dnp",
+    "2,4-Dinitrophenol is dangerous",
+    "anyone running slu-pp-332?",
+    "SLUPP332 orally",
+    "my addy 20mg script ran out",
+    "Adderrall question",
+    "tren ace cycle",
+    "test e and trt",
+    "I have a Crypto question",
+    "I don't see ABC on the vendor list",
+    "is the spreadsheet safer than promos?",
+    "Magic mushrooms and LSD",
+    "PBS vs bac water",
+    "protest rally",
+    "THC gummies",
+    "Cain's vendor",
+    "multi\nline with Fentanyl inside",
+]
+
+
+def _load_topics():
+    with open(MOD_TOPICS_PATH, "r") as file:
+        return yaml.safe_load(file)
+
+
+def _reference_auto_poof(auto_poof_topics, normalized_text):
+    for _, data in auto_poof_topics.items():
+        for word in data.get("patterns"):
+            if re.search(rf"\b{re.escape(word)}\b", normalized_text, re.IGNORECASE):
+                return (data.get("message"), word)
+    return None
+
+
+def _reference_banned(banned_data, text):
+    for _, data in banned_data.items():
+        for tuple_topic in data.get("substances") or []:
+            for word in tuple_topic:
+                if re.search(r"\b" + re.escape(word.lower()) + r"\b", text.lower()):
+                    return (data.get("message"), tuple_topic)
+        for rx in data.get("patterns", []):
+            if re.search(rx, text, flags=re.IGNORECASE | re.DOTALL):
+                return (data.get("message"), "Pattern match")
+    return None
+
+
+def _reference_newbie(newbies_mod_topics, text):
+    for _, data in newbies_mod_topics.items():
+        if any(re.search(pattern, text) for pattern in data["patterns"]):
+            return data["message"]
+    return None
+
+
+@pytest.fixture(scope="module")
+def topics():
+    return _load_topics()
+
+
+@pytest.fixture(scope="module")
+def ruleset(topics):
+    return moderation.compile_ruleset(topics)
+
+
+@pytest.mark.parametrize("text", SAMPLE_TEXTS)
+def test_compiled_rules_match_original_first_match_order(topics, ruleset, text):
+    normalized_text = unicodedata.normalize("NFKC", text)
+
+    poof = ruleset.match_auto_poof(normalized_text)
+    expected_poof = _reference_auto_poof(topics["Auto_Poof_Topics"], normalized_text)
+    assert ((poof.message, poof.term) if poof else None) == expected_poof
+
+    banned = ruleset.match_banned(text)
+    expected_banned = _reference_banned(topics["Banned_Topics"], text)
+    assert ((banned.message, banned.term) if banned else None) == expected_banned
+
+    newbie = ruleset.match_newbie(text)
+    expected_newbie = _reference_newbie(topics["Newbies_Auto_Reply"], text)
+    assert (newbie.message if newbie else None) == expected_newbie
+
+
+def test_first_term_in_yaml_order_wins_over_earlier_text_position():
+    ruleset = moderation.compile_ruleset(
+        {"Auto_Poof_Topics": {"X": {"message": "poof", "patterns": ["nexa", "shanghai nexa pharma"]}}}
+    )
+    match = ruleset.match_auto_poof("shanghai nexa pharma")
+    assert match.category == moderation.CATEGORY_AUTO_POOF
+    assert match.term == "nexa"
+
+
+def test_invalid_regex_is_skipped_unless_strict():
+    topics = {"Banned_Topics": {"Bad": {"message": "nope", "patterns": ["(unclosed"]}}}
+    assert moderation.compile_ruleset(topics).match_banned("(unclosed") is None
+    with pytest.raises(ValueError):
+        moderation.compile_ruleset(topics, strict=True)
+
+
+@pytest.fixture(scope="module")
+def link_rules():
+    return moderation.compile_link_rules(
+        ["discord.gg", "t.me/+", "jotform.com", "*.evil.example", "peptide.chat/invite"],
+        ["discord.gg/WszTsF5s"],
+    )
+
+
+@pytest.mark.parametrize(
+    "text, rule",
+    [
+        ("join https://discord.gg/abc now", "discord.gg"),
+        ("HTTPS://WWW.JotForm.com/form/1", "jotform.com"),
+        ("t.me/+AbCdEf", "t.me/+"),
+        ("evil.example", "*.evil.example"),
+        ("see a.b.evil.example/x.", "*.evil.example"),
+        ("peptide.chat/invites/xyz", "peptide.chat/invite"),
+        ("ours discord.gg/WszTsF5s, theirs discord.gg/other", "discord.gg"),
+    ],
+)
+def test_blocked_links_report_the_rule(link_rules, text, rule):
+    match = link_rules.match_text(text)
+    assert match is not None
+    assert match.rule == rule
+    assert match.kind == moderation.LINK_RULE_BLOCK
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "no links here",
+        "our server: https://discord.gg/WszTsF5s",
+        "notdiscord.gg/abc",
+        "discord.ggx.com",
+        "t.me/joinchat",
+        "notevil.example",
+        "peptide.chat/about",
+    ],
+)
+def test_allowed_or_unrelated_links_pass(link_rules, text):
+    assert link_rules.match_text(text) is None
+
+
+def test_aho_corasick_finds_overlapping_keywords():
+    automaton = moderation.AhoCorasick(["he", "she", "his", "hers"])
+    found = {(start, automaton.keywords[idx]) for start, idx in automaton.iter_matches("ushers")}
+    assert found == {(1, "she"), (2, "he"), (2, "hers")}
+
+
+def _write_config(directory, poof_terms, banned_pattern="slu"):
+    (directory / "moderated_topics.yml").write_text(
+        yaml.safe_dump(
+            {
+                "Auto_Poof_Topics": {"X": {"message": "poof", "patterns": poof_terms}},
+                "Banned_Topics": {"Y": {"message": "no", "patterns": [banned_pattern]}},
+            }
+        )
+    )
+    (directory / "dont_link.yml").write_text(yaml.safe_dump({"domain_urls": ["discord.gg"], "ignore_urls": []}))
+
+
+def test_load_moderation_config_fingerprint_tracks_content(tmp_path):
+    _write_config(tmp_path, ["nexa"])
+    first = moderation.load_moderation_config(str(tmp_path))
+    assert first.rules.match_auto_poof("nexa") is not None
+    assert first.links.match_text("discord.gg/x") is not None
+
+    _write_config(tmp_path, ["snp"])
+    second = moderation.load_moderation_config(str(tmp_path))
+    assert second.fingerprint != first.fingerprint
+    assert second.rules.match_auto_poof("nexa") is None
+
+
+def test_strict_reload_rejects_invalid_regex(tmp_path):
+    _write_config(tmp_path, ["nexa"], banned_pattern="(unclosed")
+    with pytest.raises(ValueError):
+        moderation.load_moderation_config(str(tmp_path), strict=True)
+
+
+POLICY = moderation.ModerationPolicy(
+    newbie_channel="10",
+    group_test_channel="20",
+    ignore_automod_channels=frozenset({"30"}),
+    mod_accounts=frozenset({"a_mod"}),
+)
+TEST_RESULTS_THREAD = 40
+
+
+@pytest.mark.parametrize(
+    "text, thread, username, skip_links, category",
+    [
+        ("snp discord.gg/abc", 1, "user", False, moderation.CATEGORY_AUTO_POOF),
+        ("snp", 30, "user", False, None),
+        ("snp", 1, "a_mod", False, None),
+        ("slu-pp-332 please", 1, "a_mod", False, moderation.CATEGORY_BANNED_TOPIC),
+        ("bitcoin?", 10, "user", False, moderation.CATEGORY_NEWBIE_REPLY),
+        ("bitcoin?", 1, "user", False, None),
+        ("join t.me/somegroup", 20, "user", False, moderation.CATEGORY_GROUP_TEST_LINK),
+        ("join discord.gg/abc", 1, "user", False, moderation.CATEGORY_DONT_LINK),
+        ("join discord.gg/abc", 1, "user", True, None),
+        ("join discord.gg/abc", 1, "a_mod", False, None),
+    ],
+)
+def test_moderate_message_follows_webhook_chain(text, thread, username, skip_links, category):
+    config = moderation.load_moderation_config(str(MOD_TOPICS_PATH.parent))
+    ctx = moderation.MessageContext(text, message_thread_id=thread, username=username, mod_accounts=POLICY.mod_accounts)
+    match = moderation.moderate_message(config, POLICY, ctx, skip_links=skip_links)
+    assert (match.category if match else None) == category
+
+
+def test_message_context_reads_captions_and_entity_urls():
+    caption = "🧪 results → here"
+    message = {
+        "message_thread_id": 1,
+        "from": {"id": 5, "username": "a_mod"},
+        "caption": caption,
+        "caption_entities": [
+            # Offsets are UTF-16 code units: the emoji counts as two
+            {"type": "text_link", "offset": 3, "length": 7, "url": "https://discord.gg/hidden"},
+            {"type": "url", "offset": 13, "length": 4},
+        ],
+    }
+    ctx = moderation.MessageContext.from_message(message, mod_accounts={"a_mod"})
+    assert (ctx.content, ctx.caption) == ("", caption)
+    assert ctx.entity_text(message["caption_entities"][1], caption=True) == "here"
+    assert ctx.urls[0] == "https://discord.gg/hidden"
+    assert ctx.is_mod
+    assert ctx.thread == "1"
+
+    config = moderation.load_moderation_config(str(MOD_TOPICS_PATH.parent))
+    assert config.links.match_context(ctx).rule == "discord.gg"
+
+
+@pytest.mark.parametrize("caption", ["Testosterone", "TRT blood work", "test e 250"])
+def test_captioned_test_result_uploads_are_not_moderated(caption):
+    config = moderation.load_moderation_config(str(MOD_TOPICS_PATH.parent))
+    # The same words as message text do hit a rule
+    text_ctx = moderation.MessageContext(caption, message_thread_id=TEST_RESULTS_THREAD, username="user")
+    assert moderation.moderate_message(config, POLICY, text_ctx) is not None
+
+    upload = {
+        "message_thread_id": TEST_RESULTS_THREAD,
+        "from": {"id": 5, "username": "user"},
+        "photo": [{"file_id": "AgAD"}],
+        "caption": caption,
+    }
+    ctx = moderation.MessageContext.from_message(upload, mod_accounts=POLICY.mod_accounts)
+    assert moderation.moderate_message(config, POLICY, ctx, skip_links=True) is None
+
+
+def test_message_context_derives_each_feature_once():
+    ctx = moderation.MessageContext("ＳＮＰ and Tren Ace, see discord.gg/x")
+    assert ctx.nfkc is ctx.nfkc
+    assert ctx.lowered is ctx.lowered
+    assert ctx.urls == ("discord.gg/x",)
+
+
+def test_reordered_tiers_return_the_yaml_order_match(topics):
+    ruleset = moderation.compile_ruleset(topics)
+    reference = moderation.compile_ruleset(topics)
+    for tier in ruleset.tiers.values():
+        # Worst case for the optimizer: run the rules back to front
+        tier.order = tuple(reversed(tier.rules))
+
+    for text in SAMPLE_TEXTS + ["tren ace and dnp and slu-pp", "bitcoin and the vendor spreadsheet is safer"]:
+        assert ruleset.match_auto_poof(text) == reference.match_auto_poof(text)
+        assert ruleset.match_banned(text) == reference.match_banned(text)
+        assert ruleset.match_newbie(text) == reference.match_newbie(text)
+
+
+def test_reorder_promotes_rules_that_fire(topics):
+    ruleset = moderation.compile_ruleset(topics)
+    tier = ruleset.tiers[moderation.CATEGORY_BANNED_TOPIC]
+    for _ in range(300):
+        ruleset.match_banned("running test e this cycle")
+
+    assert ruleset.reorder(min_evaluations=100) == [moderation.CATEGORY_BANNED_TOPIC]
+    first = tier.order[0]
+    assert (first.name, first.kind) == ("DEA_Scheduled_Substance_3", moderation.RULE_KIND_PATTERNS)
+    stats = {rule["rule"]: rule for rule in ruleset.rule_stats()[moderation.CATEGORY_BANNED_TOPIC]["rules"]}
+    assert stats["DEA_Scheduled_Substance_3:patterns"]["hits"] == 300
+
+
+WAVE_TEXT = "Hey everyone, I found an amazing vendor with cheap tirz and reta, DM me for the price list today"
+
+
+def _wave_message(user_id, username, text, thread=1):
+    return {"message_thread_id": thread, "from": {"id": user_id, "username": username}, "text": text}
+
+
+def test_spam_wave_check_indexes_message_contexts():
+    config = moderation.load_moderation_config(str(MOD_TOPICS_PATH.parent))
+    detector = helpers_spam.SpamWaveDetector(config.wave_limits)
+    # Re-cased and full-width copies are the same message once casefolded
+    copies = [WAVE_TEXT, WAVE_TEXT.upper(), WAVE_TEXT.replace("DM", "ＤＭ")]
+
+    verdicts = []
+    for user_id, text in enumerate(copies, start=1):
+        ctx = moderation.MessageContext.from_message(_wave_message(user_id, f"user{user_id}", text), POLICY.mod_accounts)
+        verdicts.append(moderation.check_spam_wave(config, POLICY, ctx, detector, -100, user_id))
+
+    assert verdicts[:2] == [None, None]
+    assert verdicts[2].new_wave and verdicts[2].poof == [(-100, 1), (-100, 2), (-100, 3)]
+
+
+def test_spam_wave_check_skips_mods_exempt_threads_and_disabled_waves():
+    config = moderation.load_moderation_config(str(MOD_TOPICS_PATH.parent))
+    detector = helpers_spam.SpamWaveDetector(config.wave_limits)
+    messages = [_wave_message(1, "a_mod", WAVE_TEXT), _wave_message(2, "user2", WAVE_TEXT, thread=30)]
+    # Group-buy posts in the group test channel share a template on purpose
+    messages += [_wave_message(user_id, f"user{user_id}", WAVE_TEXT, thread=20) for user_id in (3, 4, 5)]
+    for message_id, message in enumerate(messages, start=1):
+        ctx = moderation.MessageContext.from_message(message, POLICY.mod_accounts)
+        assert moderation.check_spam_wave(config, POLICY, ctx, detector, -100, message_id) is None
+    assert len(detector) == 0
+
+    disabled = dataclasses.replace(config, wave_limits=None)
+    ctx = moderation.MessageContext.from_message(_wave_message(6, "user6", WAVE_TEXT), POLICY.mod_accounts)
+    assert moderation.check_spam_wave(disabled, POLICY, ctx, detector, -100, 6) is None
@@ -0,0 +1,150 @@
+"""Unit tests for the prioritised, rate-limited send scheduler in helpers_outbound.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_outbound.py -q
+"""
+
+import threading
+import time
+
+from src import helpers_outbound as outbound
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for the scheduler"
+        time.sleep(0.005)
+
+
+def _depth(scheduler):
+    return sum(stats["depth"] for stats in scheduler.stats().values())
+
+
+def _granted(scheduler):
+    return {lane: stats["granted"] for lane, stats in scheduler.stats().items()}
+
+
+def _start(scheduler, chat_id, method, lane_name=None):
+    thread = threading.Thread(target=scheduler.acquire, args=(chat_id, method, lane_name), daemon=True)
+    thread.start()
+    return thread
+
+
+def test_waiting_sends_are_granted_in_lane_priority_order(clock):
+    scheduler = outbound.OutboundScheduler(global_rate=5, clock=clock)
+    for _ in range(5):
+        scheduler.acquire(None, "getChat", outbound.LANE_BULK)
+
+    threads = [
+        _start(scheduler, 1, "sendMessage", outbound.LANE_BULK),
+        _start(scheduler, 2, "sendMessage", outbound.LANE_REPLY),
+        _start(scheduler, 3, "deleteMessage", outbound.LANE_MODERATION),
+    ]
+    _wait_for(lambda: _depth(scheduler) == 3)
+
+    order = []
+    for remaining in (2, 1, 0):
+        before = _granted(scheduler)
+        clock.now += 0.2  # one global token
+        _wait_for(lambda: _depth(scheduler) == remaining)
+        after = _granted(scheduler)
+        order.extend(lane for lane in outbound.LANES if after[lane] > before[lane])
+    for thread in threads:
+        thread.join(1)
+
+    assert order == [outbound.LANE_MODERATION, outbound.LANE_REPLY, outbound.LANE_BULK]
+
+
+def test_a_chat_at_its_limit_does_not_hold_up_other_chats(clock):
+    scheduler = outbound.OutboundScheduler(global_rate=100, chat_rate_per_minute=1, chat_burst=1, clock=clock)
+    scheduler.acquire(1, "sendMessage")
+
+    blocked = _start(scheduler, 1, "sendMessage", outbound.LANE_MODERATION)
+    _wait_for(lambda: _depth(scheduler) == 1)
+    other = _start(scheduler, 2, "sendMessage", outbound.LANE_BULK)
+    other.join(1)
+    assert not other.is_alive()
+    assert blocked.is_alive()
+
+    # Deletes only count against the global limit
+    scheduler.acquire(1, "deleteMessage")
+
+    clock.now += 60
+    blocked.join(2)
+    assert not blocked.is_alive()
+
+
+def test_throttle_holds_a_chat_until_retry_after_passes(clock):
+    scheduler = outbound.OutboundScheduler(clock=clock)
+    scheduler.throttle(7, 12)
+
+    thread = _start(scheduler, 7, "sendMessage")
+    _wait_for(lambda: _depth(scheduler) == 1)
+    clock.now += 11
+    thread.join(0.1)
+    assert thread.is_alive()
+
+    clock.now += 1
+    thread.join(2)
+    assert not thread.is_alive()
+
+
+def test_lane_context_overrides_the_method_default():
+    assert outbound.lane_for("deleteMessage") == outbound.LANE_MODERATION
+    assert outbound.lane_for("sendPhoto") == outbound.LANE_BULK
+    with outbound.lane(outbound.LANE_BULK):
+        assert outbound.lane_for("sendMessage") == outbound.LANE_BULK
+    assert outbound.lane_for("sendMessage") == outbound.LANE_REPLY
+
+
+def test_a_send_gives_up_after_its_lane_max_wait(clock):
+    scheduler = outbound.OutboundScheduler(clock=clock, max_queue_seconds={outbound.LANE_BULK: 5})
+    scheduler.throttle(7, 60)
+    errors = []
+
+    def send():
+        try:
+            scheduler.acquire(7, "sendPhoto", outbound.LANE_BULK)
+        except TimeoutError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=send, daemon=True)
+    thread.start()
+    _wait_for(lambda: _depth(scheduler) == 1)
+    clock.now += 5
+    thread.join(2)
+
+    assert not thread.is_alive()
+    assert len(errors) == 1
+    assert scheduler.stats()[outbound.LANE_BULK] == {"depth": 0, "granted": 0, "timed_out": 1, "deferred": 0}
+
+
+def test_a_deferrable_wait_is_counted_as_deferred(clock):
+    scheduler = outbound.OutboundScheduler(clock=clock)
+    scheduler.throttle(7, 60)
+
+    assert outbound.defer_after() is None
+    with outbound.deferrable(0):
+        try:
+            scheduler.acquire(7, "sendMessage", max_wait=outbound.defer_after(), deferring=True)
+        except TimeoutError:
+            pass
+    assert outbound.defer_after() is None
+    assert scheduler.stats()[outbound.LANE_REPLY] == {"depth": 0, "granted": 0, "timed_out": 0, "deferred": 1}
+
+
+def test_deferred_sends_run_in_their_lane_outside_deferrable():
+    seen = []
+    done = threading.Event()
+
+    def send():
+        seen.append((outbound.lane_for("sendMessage"), outbound.defer_after()))
+        done.set()
+
+    with outbound.deferrable(0):
+        assert outbound.defer(send, outbound.LANE_MODERATION)
+    assert done.wait(2)
+    assert seen == [(outbound.LANE_MODERATION, None)]
+    assert outbound.deferred_send_stats()["deferred-sends"]["enqueued"] >= 1
@@ -0,0 +1,80 @@
+"""Unit tests for the getUpdates loop in helpers_polling.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_polling.py -q
+"""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src import helpers_polling as polling  # noqa: E402
+
+
+class StopPolling(BaseException):
+    """Ends poll_updates()'s endless loop once the scripted batches run out."""
+
+
+class FakeResponse:
+    def __init__(self, updates):
+        self._updates = updates
+
+    def json(self):
+        return {"ok": True, "result": self._updates}
+
+
+class FakeClient:
+    connect_timeout = 1
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.offsets = []
+
+    def call(self, method, json=None, timeout=None):
+        if not self.batches:
+            raise StopPolling()
+        self.offsets.append(json.get("offset"))
+        return FakeResponse(self.batches.pop(0))
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(polling.time, "sleep", lambda seconds: None)
+
+
+def poll(client, process_batch, state_path):
+    with pytest.raises(StopPolling):
+        polling.poll_updates(process_batch, client=client, allowed_updates=["message"], state_path=state_path)
+
+
+def test_offset_is_persisted_after_each_batch_and_resumed(tmp_path):
+    state_path = tmp_path / "offset.json"
+    handled = []
+    poll(FakeClient([[{"update_id": 5}, {"update_id": 6}], [], [{"update_id": 7}]]), handled.append, state_path)
+
+    assert [[u["update_id"] for u in batch] for batch in handled] == [[5, 6], [7]]
+    assert polling.load_offset(state_path) == 8
+
+    restarted = FakeClient([[]])
+    poll(restarted, handled.append, state_path)
+    assert restarted.offsets == [8]
+
+
+def test_failed_batch_is_fetched_again_without_advancing_the_offset(tmp_path):
+    state_path = tmp_path / "offset.json"
+    polling.persist_offset(5, state_path)
+    attempts = []
+
+    def process_batch(updates):
+        attempts.append(updates)
+        if len(attempts) == 1:
+            raise RuntimeError("sheet unavailable")
+
+    batch = [{"update_id": 5}]
+    client = FakeClient([batch, batch])
+    poll(client, process_batch, state_path)
+
+    assert client.offsets == [5, 5]
+    assert len(attempts) == 2
+    assert polling.load_offset(state_path) == 6
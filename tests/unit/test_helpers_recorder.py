@@ -0,0 +1,51 @@
+"""Unit tests for the sanitizing update recorder in helpers_recorder.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_recorder.py -q
+"""
+
+import json
+
+from src import helpers_recorder
+
+UPDATE = {
+    "update_id": 7,
+    "message": {
+        "message_id": 55,
+        "message_thread_id": 48,
+        "chat": {"id": -1001, "type": "supergroup", "title": "STG"},
+        "from": {"id": 123, "is_bot": False, "first_name": "Alice", "username": "alice"},
+        "reply_to_message": {"from": {"id": 123, "is_bot": False, "first_name": "Alice"}},
+        "contact": {"phone_number": "+15550100"},
+        "text": "join discord.gg/abc",
+        "photo": [{"file_id": "AgAD", "file_unique_id": "u1"}],
+    },
+}
+
+
+def test_sanitize_pseudonymizes_users_and_keeps_replay_fields():
+    recorder = helpers_recorder.UpdateRecorder(path=None, salt="s")
+    sanitized = recorder.sanitize(UPDATE)
+    message = sanitized["message"]
+
+    assert message["from"]["id"] != 123
+    assert message["from"]["first_name"].startswith("user_")
+    assert message["from"]["username"] == message["from"]["first_name"]
+    assert message["reply_to_message"]["from"]["id"] == message["from"]["id"]
+    assert "contact" not in message
+    assert message["chat"] == UPDATE["message"]["chat"]
+    assert message["text"] == UPDATE["message"]["text"]
+    assert message["photo"] == UPDATE["message"]["photo"]
+    assert UPDATE["message"]["from"]["first_name"] == "Alice"
+
+
+def test_record_appends_jsonl_and_samples(tmp_path):
+    path = tmp_path / "updates.jsonl"
+    recorder = helpers_recorder.UpdateRecorder(path=path, sample_rate=0.5)
+    for update_id in range(10):
+        recorder.record({**UPDATE, "update_id": update_id})
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert recorder.recorded == len(lines) == 5
+    assert [line["update"]["update_id"] for line in lines] == [1, 3, 5, 7, 9]
@@ -0,0 +1,38 @@
+"""Unit tests for once-per-process background service startup in helpers_services.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_services.py -q
+"""
+
+from collections import Counter
+
+import pytest
+
+from src import helpers_services as services
+
+SERVICES = ("announcements", "config_watcher", "rule_optimizer", "discord_bridge", "update_workers")
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(services, "_started", {})
+
+
+def test_second_copy_of_bot_startup_starts_nothing():
+    starts = Counter()
+
+    def start(name):
+        starts[name] += 1
+        return f"{name}-thread"
+
+    def module_startup():
+        # What bot.py does at import; `python bot.py --poll` runs it as `bot` and again as `__main__`
+        return [services.start_once(name, start, name) for name in SERVICES]
+
+    first = module_startup()
+    second = module_startup()
+
+    assert starts == Counter(SERVICES)
+    assert second == first
+    assert services.started_services() == list(SERVICES)
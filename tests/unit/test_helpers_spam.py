@@ -0,0 +1,150 @@
+"""Unit tests for the flood tracker in helpers_spam.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_spam.py -q
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+import yaml
+
+from src import helpers_spam as spam
+
+SPAM_CONTROL_PATH = Path(__file__).resolve().parents[2] / "mod_topics" / "spam_control.yml"
+
+LIMITS = spam.FloodLimits(
+    user=spam.FloodRule(5, 10),
+    thread=spam.FloodRule(20, 10),
+    mute_after_strikes=2,
+    strike_window_seconds=600,
+    reply_cooldown_seconds=60,
+    max_tracked_keys=3,
+)
+
+
+def test_sliding_window_weights_the_previous_window():
+    window = spam.SlidingWindowCounter(10, now=0)
+    for second in range(10):
+        window.add(second)
+    assert window.rate(9.9) == 10
+    # Halfway into the next window half of the last one still counts
+    assert window.rate(15) == pytest.approx(5)
+    assert window.rate(35) == 0
+
+
+def test_user_over_limit_gets_one_episode_then_escalates_to_mute():
+    tracker = spam.FloodTracker(LIMITS)
+    verdicts = [tracker.record(1, "general", now=i * 0.1) for i in range(8)]
+    assert [v.action for v in verdicts[:5]] == [None] * 5
+    assert [v.action for v in verdicts[5:]] == [spam.ACTION_POOF] * 3
+    assert [v.new_episode for v in verdicts[5:]] == [True, False, False]
+
+    later = [tracker.record(1, "general", now=100 + i * 0.1) for i in range(6)]
+    assert later[-1].action == spam.ACTION_MUTE
+    assert later[-1].new_episode and later[-1].strikes == 2
+
+
+def test_album_items_count_once():
+    tracker = spam.FloodTracker(LIMITS)
+    verdicts = [tracker.record(1, "results", media_group_id="album", now=i * 0.01) for i in range(10)]
+    assert all(v.action is None for v in verdicts)
+
+
+def test_thread_flood_and_reply_cooldown():
+    tracker = spam.FloodTracker(LIMITS)
+    flooding = [tracker.record(user, "general", now=0).thread_flooding for user in range(25)]
+    assert flooding.index(True) == 20
+    assert not tracker.allow_reply(1, "banned_topic", thread_flooding=True, now=0)
+
+    assert tracker.allow_reply(1, "banned_topic", now=0)
+    assert not tracker.allow_reply(1, "banned_topic", now=30)
+    assert tracker.allow_reply(1, "dont_link", now=30)
+    assert tracker.allow_reply(1, "banned_topic", now=61)
+
+
+def test_memory_is_bounded_by_max_tracked_keys():
+    tracker = spam.FloodTracker(LIMITS)
+    for user in range(100):
+        tracker.record(user, f"thread-{user}", now=0)
+    stats = tracker.stats()
+    assert stats["tracked_users"] == 3 and stats["tracked_threads"] == 3
+    assert stats["evicted"] == 194
+
+
+def test_shipped_spam_control_parses():
+    limits = spam.parse_flood_limits(yaml.safe_load(SPAM_CONTROL_PATH.read_text()))
+    assert limits.user == spam.FloodRule(8, 10.0)
+    assert limits.action == spam.ACTION_POOF
+    assert spam.parse_flood_limits({}) == spam.FloodLimits()
+    with pytest.raises(ValueError):
+        spam.parse_flood_limits({"Flood_Control": {"action": "ban"}})
+
+
+SCAM = "Hey everyone, I found an amazing vendor with cheap tirz and reta, DM me for the price list and discount code today"
+SCAM_EDITS = [
+    SCAM,
+    SCAM.replace("amazing", "awesome"),
+    SCAM.replace("today", "today 🔥🔥"),
+    SCAM.replace("Hey everyone,", "Hi all,"),
+]
+
+
+def test_minhash_signatures_match_across_processes():
+    script = "from src import helpers_spam; print(helpers_spam.minhash('Hey everyone, price list inside'))"
+    root = str(Path(__file__).resolve().parents[2])
+    signatures = {
+        subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=root,
+            env={**os.environ, "PYTHONPATH": root, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in ("1", "2")
+    }
+    assert signatures == {f"{spam.minhash('Hey everyone, price list inside')}\n"}
+
+
+def test_wave_needs_distinct_users_then_poofs_every_copy():
+    detector = spam.SpamWaveDetector(spam.WaveLimits(min_distinct_users=3))
+    assert detector.observe(SCAM_EDITS[0].casefold(), 1, -100, 1, now=0) is None
+    # The same account repeating itself is flood control's job, not a wave
+    assert detector.observe(SCAM_EDITS[1].casefold(), 1, -100, 2, now=1) is None
+    assert detector.observe(SCAM_EDITS[1].casefold(), 2, -100, 3, now=2) is None
+
+    verdict = detector.observe(SCAM_EDITS[2].casefold(), 3, -100, 4, now=3)
+    assert verdict.new_wave
+    assert verdict.poof == [(-100, 1), (-100, 2), (-100, 3), (-100, 4)]
+
+    follow_up = detector.observe(SCAM_EDITS[3].casefold(), 4, -100, 5, now=4)
+    assert not follow_up.new_wave and follow_up.poof == [(-100, 5)]
+    assert follow_up.wave is verdict.wave
+
+
+def test_unrelated_and_expired_messages_do_not_form_waves():
+    detector = spam.SpamWaveDetector(spam.WaveLimits(min_distinct_users=2, window_seconds=60))
+    assert detector.observe(SCAM.casefold(), 1, -100, 1, now=0) is None
+    other = "does anyone know how long shipping usually takes from the domestic warehouse for reta orders"
+    assert detector.observe(other, 2, -100, 2, now=1) is None
+    assert detector.observe(SCAM_EDITS[1].casefold(), 3, -100, 3, now=120) is None
+    assert len(detector) == 1
+    assert detector.observe("too short to index", 4, -100, 4, now=121) is None
+
+
+def test_wave_index_is_bounded():
+    detector = spam.SpamWaveDetector(spam.WaveLimits(max_entries=50))
+    for message_id in range(200):
+        detector.observe(f"message number {message_id} with enough unique words {message_id * 7} to index", message_id, -100, message_id, now=0)
+    assert len(detector) == 50
+
+
+def test_shipped_spam_waves_parse():
+    limits = spam.parse_wave_limits(yaml.safe_load(SPAM_CONTROL_PATH.read_text()))
+    assert limits == spam.WaveLimits()
+    assert spam.parse_wave_limits({"Spam_Waves": {"enabled": False}}) is None
@@ -0,0 +1,136 @@
+"""Unit tests for the retry policy of the shared Bot API client in helpers_telegram_api.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_telegram_api.py -q
+"""
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from src import helpers_telegram_api as telegram_api  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self._payload = payload or {"ok": status_code == 200}
+
+    def json(self):
+        return self._payload
+
+
+class ScriptedSession:
+    """Stands in for requests.Session, replaying one outcome per request."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, http_method, url, **kwargs):
+        self.calls.append((http_method, url, kwargs))
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def _client(outcomes, monkeypatch):
+    client = telegram_api.TelegramAPI("TOKEN", api_root="http://fake", backoff_seconds=0, max_retries=2)
+    client.session = ScriptedSession(outcomes)
+    monkeypatch.setattr(telegram_api.time, "sleep", lambda seconds: None)
+    return client
+
+
+def test_idempotent_call_retries_server_errors(monkeypatch):
+    client = _client([FakeResponse(502), requests.exceptions.ReadTimeout(), FakeResponse(200)], monkeypatch)
+    response = client.call("getChatMember", params={"chat_id": 1, "user_id": 2}, http_method="GET")
+    assert response.status_code == 200
+    assert len(client.session.calls) == 3
+    assert client.session.calls[0][1] == "http://fake/botTOKEN/getChatMember"
+    assert client.session.calls[0][2]["timeout"] == (client.connect_timeout, client.read_timeout)
+
+
+def test_send_message_is_not_repeated_after_it_may_have_landed(monkeypatch):
+    client = _client([requests.exceptions.ReadTimeout()], monkeypatch)
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        client.call("sendMessage", json={"chat_id": 1, "text": "hi"})
+
+    client = _client([FakeResponse(500)], monkeypatch)
+    assert client.call("sendMessage", json={"chat_id": 1, "text": "hi"}).status_code == 500
+
+
+def test_short_429_is_waited_out_for_any_method(monkeypatch):
+    waits = []
+    client = _client(
+        [FakeResponse(429, {"ok": False, "parameters": {"retry_after": 3}}), FakeResponse(200)], monkeypatch
+    )
+    monkeypatch.setattr(telegram_api.time, "sleep", waits.append)
+    assert client.call("sendMessage", json={"chat_id": 1, "text": "hi"}).status_code == 200
+    assert waits == [3.0]
+
+    long_wait = FakeResponse(429, {"ok": False, "parameters": {"retry_after": 60}})
+    client = _client([long_wait], monkeypatch)
+    assert client.call("sendMessage", json={"chat_id": 1, "text": "hi"}) is long_wait
+
+
+def test_429_throttles_the_chat_in_the_send_scheduler(monkeypatch):
+    from src import helpers_outbound
+
+    clock_now = [0.0]
+    scheduler = helpers_outbound.OutboundScheduler(clock=lambda: clock_now[0])
+    long_wait = FakeResponse(429, {"ok": False, "parameters": {"retry_after": 30}})
+    client = _client([long_wait], monkeypatch)
+    client.scheduler = scheduler
+
+    assert client.call("sendMessage", json={"chat_id": 5, "text": "hi"}) is long_wait
+    assert scheduler._chat_bucket(5, 0.0).wait_time(0.0) == 30
+    assert scheduler._chat_bucket(6, 0.0).wait_time(0.0) == 0
+
+
+def test_inline_send_is_deferred_instead_of_waiting_for_the_scheduler(monkeypatch):
+    from src import helpers_outbound
+
+    scheduler = helpers_outbound.OutboundScheduler(clock=lambda: 0.0)
+    scheduler.throttle(5, 30)
+    deferred = []
+    monkeypatch.setattr(helpers_outbound, "defer", lambda send, lane_name: deferred.append((send, lane_name)) or True)
+    client = _client([FakeResponse(200)], monkeypatch)
+    client.scheduler = scheduler
+
+    with helpers_outbound.deferrable(0):
+        response = client.call("sendMessage", json={"chat_id": 5, "text": "hi"})
+
+    assert response.json() == {"ok": True, "result": None}
+    assert client.session.calls == []
+    assert [lane_name for _, lane_name in deferred] == [helpers_outbound.LANE_REPLY]
+    assert scheduler.stats()[helpers_outbound.LANE_REPLY]["deferred"] == 1
+
+
+class StreamedResponse:
+    def __init__(self, chunks, content_length=None):
+        self.chunks = chunks
+        self.headers = {} if content_length is None else {"Content-Length": str(content_length)}
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+def test_spool_streams_under_the_cap_and_refuses_over_it():
+    response = StreamedResponse([b"ab", b"cd"])
+    with telegram_api.spool(response, max_bytes=4) as spooled:
+        assert spooled.read() == b"abcd"
+    assert response.closed
+
+    with pytest.raises(ValueError):
+        telegram_api.spool(StreamedResponse([b"ab", b"cd", b"e"]), max_bytes=4)
+    refused = StreamedResponse([], content_length=5)
+    with pytest.raises(ValueError):
+        telegram_api.spool(refused, max_bytes=4)
+    assert refused.closed
+
@@ -0,0 +1,160 @@
+"""Unit tests for the asyncio Bot API client used by the Discord bridge (helpers_telegram_async.py).
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_telegram_async.py -q
+"""
+
+import asyncio
+import io
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from src import helpers_file_ids  # noqa: E402
+from src import helpers_telegram_async as telegram_async  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status, payload):
+        self.status = status
+        self._body = json.dumps(payload)
+
+    async def text(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class ScriptedSession:
+    """Stands in for aiohttp.ClientSession, replaying one response per POST."""
+
+    closed = False
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.posts = []
+
+    def post(self, url, **kwargs):
+        self.posts.append((url, kwargs))
+        return self.outcomes.pop(0)
+
+
+def _client(outcomes, monkeypatch):
+    client = telegram_async.AsyncTelegramAPI("TOKEN", api_root="http://fake", backoff_seconds=0)
+    client._session = ScriptedSession(outcomes)
+
+    async def no_sleep(seconds):
+        return None
+
+    monkeypatch.setattr(telegram_async.asyncio, "sleep", no_sleep)
+    return client
+
+
+def _fresh_file_ids(monkeypatch):
+    file_ids = helpers_file_ids.FileIdCache()
+    monkeypatch.setattr(helpers_file_ids, "_cache", file_ids)
+    return file_ids
+
+
+def test_send_message_waits_out_a_short_429(monkeypatch):
+    client = _client(
+        [
+            FakeResponse(429, {"ok": False, "parameters": {"retry_after": 2}}),
+            FakeResponse(200, {"ok": True, "result": {"message_id": 9}}),
+        ],
+        monkeypatch,
+    )
+    result = asyncio.run(client.send_message(-100, "hi", message_thread_id=48))
+    assert result["result"]["message_id"] == 9
+    url, kwargs = client._session.posts[0]
+    assert url == "http://fake/botTOKEN/sendMessage"
+    assert kwargs["json"]["message_thread_id"] == 48
+
+
+def test_send_message_raises_on_other_errors(monkeypatch):
+    client = _client([FakeResponse(400, {"ok": False, "description": "Bad Request: chat not found"})], monkeypatch)
+    with pytest.raises(RuntimeError, match="chat not found"):
+        asyncio.run(client.send_message(-100, "hi"))
+
+
+def test_media_group_is_sent_by_url_in_albums_of_ten(monkeypatch):
+    file_ids = _fresh_file_ids(monkeypatch)
+    photo = {"photo": [{"file_id": "small"}, {"file_id": "large"}]}
+    client = _client(
+        [FakeResponse(200, {"ok": True, "result": [photo] * 10}), FakeResponse(200, {"ok": True, "result": [photo] * 2})],
+        monkeypatch,
+    )
+    urls = [f"http://img/{i}" for i in range(12)]
+    captions = [f"📎 {i}.jpg" for i in range(12)]
+    sent = asyncio.run(client.send_media_group(-100, urls, captions=captions))
+
+    assert len(sent) == 12
+    first_album = client._session.posts[0][1]["json"]["media"]
+    assert [item["media"] for item in first_album] == urls[:10]
+    assert [item["caption"] for item in first_album] == captions[:10]
+    assert [item["caption"] for item in client._session.posts[1][1]["json"]["media"]] == captions[10:]
+    assert file_ids.get(helpers_file_ids.url_key(urls[11])) == "large"
+
+
+def test_photo_is_uploaded_when_telegram_cannot_fetch_the_url(monkeypatch):
+    file_ids = _fresh_file_ids(monkeypatch)
+    client = _client(
+        [
+            FakeResponse(400, {"ok": False, "description": "Bad Request: failed to get HTTP URL content"}),
+            FakeResponse(200, {"ok": True, "result": {"photo": [{"file_id": "uploaded"}]}}),
+        ],
+        monkeypatch,
+    )
+    downloads = []
+
+    async def fake_fetch(url, **kwargs):
+        downloads.append(url)
+        return io.BytesIO(b"jpeg")
+
+    monkeypatch.setattr(client, "fetch", fake_fetch)
+    asyncio.run(client.send_image(-100, image_url="http://img/private.jpg"))
+
+    assert downloads == ["http://img/private.jpg"]
+    assert client._session.posts[0][1]["json"]["photo"] == "http://img/private.jpg"
+    assert isinstance(client._session.posts[1][1]["data"], aiohttp.FormData)
+    assert file_ids.get(helpers_file_ids.url_key("http://img/private.jpg")) == "uploaded"
+    assert file_ids.get(helpers_file_ids.content_key(b"jpeg")) == "uploaded"
+
+
+def test_stale_cached_file_id_is_invalidated(monkeypatch):
+    file_ids = _fresh_file_ids(monkeypatch)
+    key = helpers_file_ids.url_key("http://img/logo.png")
+    file_ids.put(key, "stale")
+    client = _client(
+        [
+            FakeResponse(400, {"ok": False, "description": "Bad Request: wrong file identifier/HTTP URL specified"}),
+            FakeResponse(200, {"ok": True, "result": {"photo": [{"file_id": "fresh"}]}}),
+        ],
+        monkeypatch,
+    )
+    asyncio.run(client.send_image(-100, image_url="http://img/logo.png"))
+
+    assert [kwargs["json"]["photo"] for _, kwargs in client._session.posts] == ["stale", "http://img/logo.png"]
+    assert file_ids.get(key) == "fresh"
+    assert file_ids.invalidated == 1
+
+
+def test_cached_file_id_is_kept_when_the_send_fails_for_another_reason(monkeypatch):
+    file_ids = _fresh_file_ids(monkeypatch)
+    key = helpers_file_ids.url_key("http://img/logo.png")
+    file_ids.put(key, "good")
+    client = _client([FakeResponse(400, {"ok": False, "description": "Bad Request: message thread not found"})], monkeypatch)
+
+    with pytest.raises(RuntimeError, match="message thread not found"):
+        asyncio.run(client.send_image(-100, image_url="http://img/logo.png", message_thread_id=7))
+
+    assert len(client._session.posts) == 1
+    assert file_ids.get(key) == "good"
+    assert file_ids.invalidated == 0
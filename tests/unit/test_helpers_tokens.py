@@ -0,0 +1,41 @@
+"""Unit tests for the signed /login tokens in helpers_tokens.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_tokens.py -q
+"""
+
+import pytest
+
+from src import helpers_tokens as tokens
+
+SECRET = "s3cret"
+
+
+def test_issued_token_round_trips_until_it_expires():
+    token, claims = tokens.issue_token(SECRET, 12345, ttl_seconds=3600, now=1000)
+    assert claims == tokens.TokenClaims("12345", 1000, 4600)
+    assert tokens.verify_token(SECRET, token, now=4599) == claims
+    assert claims.remaining(now=4000) == 600
+
+    with pytest.raises(tokens.InvalidToken, match="expired"):
+        tokens.verify_token(SECRET, token, now=4600)
+
+
+def test_tampered_or_foreign_tokens_are_rejected():
+    token, _ = tokens.issue_token(SECRET, 12345, ttl_seconds=3600, now=1000)
+    _, forged_payload, _ = tokens.issue_token(SECRET, 99999, ttl_seconds=3600, now=1000)[0].split(".")
+    version, _, signature = token.split(".")
+
+    for bad in (
+        f"{version}.{forged_payload}.{signature}",
+        f"{version}.{forged_payload}.é",
+        f"{version}.\ud800.{signature}",
+        "v1.abc",
+        "",
+        None,
+    ):
+        with pytest.raises(tokens.InvalidToken):
+            tokens.verify_token(SECRET, bad, now=1001)
+    with pytest.raises(tokens.InvalidToken, match="signature"):
+        tokens.verify_token("other secret", token, now=1001)
@@ -0,0 +1,58 @@
+"""Unit tests for the join-burst welcome batching in helpers_welcome.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_welcome.py -q
+"""
+
+import threading
+
+from src import helpers_welcome as welcome
+
+
+def _user(user_id):
+    return {"id": user_id, "first_name": f"User{user_id}"}
+
+
+def _aggregator(sent, clock, **settings):
+    settings = {"window_seconds": 30, "max_mentions": 5, "individual_threshold": 2, **settings}
+    return welcome.WelcomeAggregator(lambda chat_id, users: sent.append([u["id"] for u in users]), clock=clock, **settings)
+
+
+def test_quiet_joins_are_welcomed_individually(clock):
+    sent = []
+    aggregator = _aggregator(sent, clock)
+    for user_id in range(4):
+        aggregator.add(-100, _user(user_id))
+        clock.now += 60
+    assert sent == [[0], [1], [2], [3]]
+
+
+def test_burst_is_batched_up_to_max_mentions(clock):
+    sent = []
+    aggregator = _aggregator(sent, clock)
+    for user_id in range(10):
+        aggregator.add(-100, _user(user_id))
+        clock.now += 0.5
+    # Two joins go out on their own, then batches of five
+    assert sent == [[0], [1], [2, 3, 4, 5, 6]]
+    assert aggregator.stats()["pending"] == 3
+
+    aggregator.flush_all()
+    assert sent[-1] == [7, 8, 9]
+    assert aggregator.stats() == {"pending": 0, "welcomed": 10, "messages_sent": 4}
+
+
+def test_batch_is_sent_when_the_window_closes():
+    sent, done = [], threading.Event()
+
+    def send(chat_id, users):
+        sent.append([u["id"] for u in users])
+        if len(users) > 1:
+            done.set()
+
+    aggregator = welcome.WelcomeAggregator(send, window_seconds=0.05, max_mentions=50, individual_threshold=0)
+    for user_id in range(3):
+        aggregator.add(-100, _user(user_id))
+    assert done.wait(2)
+    assert sent == [[0, 1, 2]]
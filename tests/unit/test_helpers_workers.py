@@ -0,0 +1,46 @@
+"""Unit tests for the update worker pool in helpers_workers.py.
+
+Run with:
+
+    PYTHONPATH=. pytest tests/unit/test_helpers_workers.py -q
+"""
+
+from src import helpers_workers as workers
+
+
+def classify(update):
+    return workers.LANE_EXTRACTION if "photo" in update else workers.LANE_MODERATION
+
+
+def test_full_lane_rejects_without_blocking_the_other_lane():
+    # Not started, so nothing drains the queues
+    dispatcher = workers.UpdateDispatcher(lambda update: None, classify, 1, 1, max_queue=2)
+    photos = [{"update_id": i, "photo": []} for i in range(3)]
+
+    # webhook() answers 503 for a rejected update so Telegram redelivers it
+    assert [dispatcher.submit(update) for update in photos] == [True, True, False]
+    assert dispatcher.submit({"update_id": 10, "message": {}}) is True
+
+    stats = dispatcher.stats()
+    assert (stats["extraction"]["depth"], stats["extraction"]["rejected"]) == (2, 1)
+    assert (stats["moderation"]["depth"], stats["moderation"]["rejected"]) == (1, 0)
+
+
+def test_single_worker_lane_handles_updates_in_arrival_order():
+    handled = []
+
+    def handler(update):
+        if update["update_id"] == 2:
+            raise ValueError("bad update")
+        handled.append(update["update_id"])
+
+    lane = workers.WorkerLane("moderation", handler, workers=1, max_queue=10)
+    for update_id in range(5):
+        assert lane.submit({"update_id": update_id})
+    lane.start()
+    lane._queue.join()
+
+    # A failing update is counted and the lane keeps going
+    assert handled == [0, 1, 3, 4]
+    stats = lane.stats()
+    assert (stats["processed"], stats["failed"], stats["depth"], stats["busy"]) == (4, 1, 0, 0)